@@ -1,36 +1,50 @@
+import flask
 import dash
 from dash import Dash, dcc, html, Input, Output, State
-from dash.dash_table import DataTable
+from dash.dash_table import DataTable, FormatTemplate
+import numpy as np
 import plotly.graph_objects as go
 
 from src.etl import (
-    load_data, dataset_bounds, zip_points,
     filter_inventory_zip_price_beds, listings_by_zip,
-    suggest_zips_by_filter, comps_similares, market_snapshot
+    suggest_zips_by_filter, comps_similares
 )
-from src.model import ModelService
+from src.geo import comps_cercanos
+from src.markets import MarketRegistry
+from src.tiles import bbox_from_relayout
+from src.valuations import OFFER_FACTOR
 from src.graphics import (
-    zip_map, comps_map,
+    zip_map, comps_map, tile_map,
     price_hist, sqft_vs_price_rich, add_prediction_marker,
-    property_type_mix
+    property_type_mix, price_time_curve
 )
 
 # ---------------- datos y servicio ----------------
-df = load_data()
-ms = ModelService(df)
-bounds = dataset_bounds(df)
-
-postal_list = sorted(df["ZIP OR POSTAL CODE"].dropna().unique().tolist()) if "ZIP OR POSTAL CODE" in df else []
-type_list = sorted(df["PROPERTY TYPE"].dropna().unique().tolist()) if "PROPERTY TYPE" in df else []
-
-zip_df_full = zip_points(df)
-has_map_coords = not zip_df_full.empty
+# cada mercado (MarketData) agrupa su dataset, sus índices y su ModelService (mk.ms);
+# se cargan al primer uso y los menos usados se descartan si se pasa de MARKET_BUDGET_MB.
+# Las ventas nuevas que se dejen en data/deltas/ se ingieren en caliente (mk.maybe_refresh)
+# MARKETS_FILE=<json> -> lista de mercados (por defecto data/markets.json o solo el dataset de siempre)
+# COMPACT_DATA=1 -> category/float32/int16 en memoria (ver etl.compact_frame)
+# SHARED_DATA_DIR=<dir> -> el dataset se abre con mmap y lo comparten todos los workers
+# Los modelos de cada mercado se cargan en segundo plano en cada worker (ms.status());
+# hasta entonces las predicciones salen de las medianas por ZIP
+markets = MarketRegistry.from_env()
+markets.get()  # el mercado por defecto se carga ya (con preload lo heredan los workers)
 
 HERO_IMAGES = [f"/assets/Fotos/hero{i}.jpg" for i in range(1, 9)]
 
 app = Dash(__name__, suppress_callback_exceptions=True)
 server = app.server
 
+
+@server.route("/health/models")
+def models_health():
+    # estado de carga de los modelos de los mercados cargados en este worker
+    # peek: la sonda no carga mercados, no cambia el orden LRU ni dispara descartes
+    loaded = {name: markets.peek(name) for name in markets.loaded()}
+    return flask.jsonify({name: mk.ms.status() for name, mk in loaded.items() if mk is not None})
+
+
 # ---------------- helpers visuales ----------------
 
 label = lambda txt: html.Label(
@@ -128,6 +142,16 @@ hero = html.Div(
                         html.Div(
                             className="hero-menu",
                             children=[
+                                dcc.Dropdown(
+                                    id="market",
+                                    className="dropdown market-select",
+                                    options=markets.options(),
+                                    value=markets.default,
+                                    clearable=False,
+                                    searchable=False,
+                                    # con un solo mercado no hace falta el selector
+                                    style={} if len(markets.markets) > 1 else {"display": "none"},
+                                ),
                                 html.Button(
                                     "QUIERO VENDER MI CASA",
                                     id="hero-sell-cta",
@@ -179,35 +203,46 @@ hero = html.Div(
 
 # ---------------- bloques COMPRADOR ----------------
 
-def buyer_controls():
+def price_slider_props(bounds):
+    pmin, pmax = int(bounds["price_min"]), int(bounds["price_max"])
+    return {
+        "min": pmin,
+        "max": pmax,
+        "value": [pmin, pmax],
+        "marks": {pmin: f"${int(pmin/1000)}k", pmax: f"${int(pmax/1000)}k"},
+    }
+
+
+def beds_options(bounds):
+    return [
+        {"label": f"{b} dormitorio(s)", "value": b}
+        for b in range(int(bounds["beds_min"]), int(bounds["beds_max"]) + 1)
+    ]
+
+
+def buyer_controls(mk):
     return card(
         [
             html.H3("Filtra por precio y nº de habitaciones", className="section-title"),
             label("Rango de precio ($)"),
             dcc.RangeSlider(
                 id="buy-price-range",
-                min=int(bounds["price_min"]),
-                max=int(bounds["price_max"]),
                 step=5000,
-                value=[int(bounds["price_min"]), int(bounds["price_max"])],
-                marks={
-                    int(bounds["price_min"]): f"${int(bounds['price_min']/1000)}k",
-                    int(bounds["price_max"]): f"${int(bounds['price_max']/1000)}k",
-                },
                 tooltip={"always_visible": True, "placement": "bottom"},
+                **price_slider_props(mk.bounds),
             ),
             html.Div(id="buy-price-label", className="muted mt"),
             dcc.Input(
                 id="buy-price-min",
                 type="number",
                 style={"display": "none"},
-                value=int(bounds["price_min"]),
+                value=int(mk.bounds["price_min"]),
             ),
             dcc.Input(
                 id="buy-price-max",
                 type="number",
                 style={"display": "none"},
-                value=int(bounds["price_max"]),
+                value=int(mk.bounds["price_max"]),
             ),
             html.Div(
                 className="row mt",
@@ -219,14 +254,8 @@ def buyer_controls():
                             dcc.Dropdown(
                                 id="buy-beds-min",
                                 className="dropdown",
-                                options=[
-                                    {"label": f"{b} dormitorio(s)", "value": b}
-                                    for b in range(
-                                        int(bounds["beds_min"]),
-                                        int(bounds["beds_max"]) + 1,
-                                    )
-                                ],
-                                value=max(2, int(bounds["beds_min"])),
+                                options=beds_options(mk.bounds),
+                                value=max(2, int(mk.bounds["beds_min"])),
                                 clearable=False,
                                 placeholder="Elige nº de dormitorios",
                             ),
@@ -239,7 +268,7 @@ def buyer_controls():
                             dcc.Dropdown(
                                 id="buy-zip-pref",
                                 className="dropdown",
-                                options=[{"label": str(z), "value": int(z)} for z in postal_list],
+                                options=[{"label": str(z), "value": int(z)} for z in mk.postal_list],
                                 placeholder="Selecciona un ZIP (opcional)",
                                 clearable=True,
                             ),
@@ -252,11 +281,21 @@ def buyer_controls():
     )
 
 
-def buyer_map_and_table():
+def buyer_map_and_table(mk):
     return card(
         [
             html.H3("Mapa de zonas disponibles"),
-            dcc.Graph(id="buy-map", figure=zip_map(zip_df_full), clear_on_unhover=True),
+            dcc.RadioItems(
+                id="buy-map-mode",
+                options=[
+                    {"label": " Por ZIP", "value": "zip"},
+                    {"label": " Densidad / viviendas", "value": "tiles"},
+                ],
+                value="zip",
+                inline=True,
+                inputStyle={"marginLeft": "12px"},
+            ),
+            dcc.Graph(id="buy-map", figure=zip_map(mk.zip_df), clear_on_unhover=True),
             html.Div(id="buy-available-zips", className="mt"),
             html.Hr(),
             html.H4("Viviendas del ZIP seleccionado"),
@@ -274,9 +313,15 @@ def buyer_map_and_table():
                         "YEAR BUILT",
                         "PRICE",
                     ]
+                ] + [
+                    # valoración precalculada (MarketData.ensure_valuations); ordenable desde la cabecera
+                    {"name": "MODEL PRICE", "id": "MODEL PRICE", "type": "numeric", "format": FormatTemplate.money(0)},
+                    {"name": "DESCUENTO VS MODELO", "id": "MODEL DISCOUNT", "type": "numeric", "format": FormatTemplate.percentage(1)},
+                    {"name": "TIEMPO", "id": "MODEL TIME"},
                 ],
                 data=[],
                 page_size=8,
+                sort_action="native",
                 row_selectable="single",
                 style_cell={"textAlign": "center"},
                 style_header={"fontWeight": "700"},
@@ -318,6 +363,7 @@ def buyer_offer_block():
                             ),
                             html.Hr(),
                             html.Div(id="buy-peers", className="muted"),
+                            dcc.Graph(id="buy-time-curve"),
                         ],
                     ),
                 ],
@@ -327,20 +373,24 @@ def buyer_offer_block():
 
 # ---------------- bloques para el vendedor ----------------
 
-def seller_controls():
-    zip_opts = [{"label": str(z), "value": z} for z in postal_list]
-    ptype_opts = [{"label": str(p), "value": p} for p in type_list] if type_list else []
+def seller_zip_info(postal_list):
     subtitle = f"{len(postal_list)} ZIPs detectados en el dataset"
-    default_ptype = type_list[0] if type_list else "Single Family Residential"
     zip_preview = html.Div(
         [html.Div("ZIPs disponibles (muestra):", className="muted"), chips(postal_list[:10])],
         className="zip-preview",
     )
+    return [html.Div(subtitle, className="muted"), zip_preview]
+
+
+def seller_controls(mk):
+    postal_list, type_list = mk.postal_list, mk.type_list
+    zip_opts = [{"label": str(z), "value": z} for z in postal_list]
+    ptype_opts = [{"label": str(p), "value": p} for p in type_list] if type_list else []
+    default_ptype = type_list[0] if type_list else "Single Family Residential"
     return card(
         [
             html.H3("Características de la vivienda"),
-            html.Div(subtitle, className="muted"),
-            zip_preview,
+            html.Div(seller_zip_info(postal_list), id="sell-zip-info"),
             label("ZIP"),
             dcc.Dropdown(
                 id="sell-zip",
@@ -457,58 +507,64 @@ def seller_results():
 
 # ---------------- layout ----------------
 
-app.layout = html.Div(
-    [
-        dcc.Store(id="buy-selected-zip", data=None),
-        dcc.Store(id="sell-modal-open", data=False),
-        hero,
-        dcc.Interval(id="hero-interval", interval=5000, n_intervals=0),
-        dcc.Tabs(
-            id="tabs",
-            value="buyer",
-            className="tabs-realestate",
-            parent_className="tabs-realestate-wrap",
-            children=[
-                dcc.Tab(
-                    label="COMPRADOR",
-                    value="buyer",
-                    className="tab-realestate",
-                    selected_className="tab-realestate--active",
-                    children=[
-                        html.Div(
-                            className="row mt-lg",
-                            children=[
-                                html.Div(buyer_controls(), className="col-30"),
-                                html.Div(buyer_map_and_table(), className="col-70"),
-                            ],
-                        ),
-                        html.Div(
-                            className="row mt-lg",
-                            children=[html.Div(buyer_offer_block(), className="col-100")],
-                        ),
-                    ],
-                ),
-                dcc.Tab(
-                    label="VENDEDOR",
-                    value="seller",
-                    className="tab-realestate",
-                    selected_className="tab-realestate--active",
-                    children=[
-                        html.Div(
-                            className="row mt-lg",
-                            children=[
-                                html.Div(seller_controls(), className="col-30"),
-                                html.Div(seller_results(), className="col-70"),
-                            ],
-                        )
-                    ],
-                ),
-            ],
-        ),
-        contact_modal(),
-    ],
-    className="container",
-)
+def serve_layout():
+    # función para que cada carga de página vea los ZIPs/límites tras ingerir deltas
+    mk = markets.get()
+    return html.Div(
+        [
+            dcc.Store(id="buy-selected-zip", data=None),
+            dcc.Store(id="sell-modal-open", data=False),
+            hero,
+            dcc.Interval(id="hero-interval", interval=5000, n_intervals=0),
+            dcc.Tabs(
+                id="tabs",
+                value="buyer",
+                className="tabs-realestate",
+                parent_className="tabs-realestate-wrap",
+                children=[
+                    dcc.Tab(
+                        label="COMPRADOR",
+                        value="buyer",
+                        className="tab-realestate",
+                        selected_className="tab-realestate--active",
+                        children=[
+                            html.Div(
+                                className="row mt-lg",
+                                children=[
+                                    html.Div(buyer_controls(mk), className="col-30"),
+                                    html.Div(buyer_map_and_table(mk), className="col-70"),
+                                ],
+                            ),
+                            html.Div(
+                                className="row mt-lg",
+                                children=[html.Div(buyer_offer_block(), className="col-100")],
+                            ),
+                        ],
+                    ),
+                    dcc.Tab(
+                        label="VENDEDOR",
+                        value="seller",
+                        className="tab-realestate",
+                        selected_className="tab-realestate--active",
+                        children=[
+                            html.Div(
+                                className="row mt-lg",
+                                children=[
+                                    html.Div(seller_controls(mk), className="col-30"),
+                                    html.Div(seller_results(), className="col-70"),
+                                ],
+                            )
+                        ],
+                    ),
+                ],
+            ),
+            contact_modal(),
+        ],
+        className="container",
+    )
+
+
+app.layout = serve_layout
 
 # ---------------- callbacks hero / tabs ----------------
 
@@ -574,6 +630,46 @@ def update_button_styles(active_tab):
         }
     return buyer_style, seller_style
 
+# ---------------- callback mercado ----------------
+
+@app.callback(
+    Output("buy-price-range", "min"),
+    Output("buy-price-range", "max"),
+    Output("buy-price-range", "value"),
+    Output("buy-price-range", "marks"),
+    Output("buy-beds-min", "options"),
+    Output("buy-beds-min", "value"),
+    Output("buy-zip-pref", "options"),
+    Output("buy-zip-pref", "value"),
+    Output("sell-zip-info", "children"),
+    Output("sell-zip", "options"),
+    Output("sell-zip", "value"),
+    Output("sell-ptype", "options"),
+    Output("sell-ptype", "value"),
+    Input("market", "value"),
+    prevent_initial_call=True,
+)
+def switch_market(market):
+    # al cambiar de mercado los controles pasan a sus límites, ZIPs y tipos
+    mk = markets.get(market)
+    slider = price_slider_props(mk.bounds)
+    postal_list, type_list = mk.postal_list, mk.type_list
+    return (
+        slider["min"],
+        slider["max"],
+        slider["value"],
+        slider["marks"],
+        beds_options(mk.bounds),
+        max(2, int(mk.bounds["beds_min"])),
+        [{"label": str(z), "value": int(z)} for z in postal_list],
+        None,
+        seller_zip_info(postal_list),
+        [{"label": str(z), "value": z} for z in postal_list],
+        None,
+        [{"label": str(p), "value": p} for p in type_list],
+        type_list[0] if type_list else "Single Family Residential",
+    )
+
 # ---------------- callbacks COMPRADOR ----------------
 
 @app.callback(
@@ -599,22 +695,29 @@ def sync_price_slider(price_range):
     Input("buy-price-max", "value"),
     Input("buy-beds-min", "value"),
     Input("buy-zip-pref", "value"),
+    Input("market", "value"),
+    Input("buy-map-mode", "value"),
+    Input("buy-map", "relayoutData"),
 )
-def buyer_update_map(selected_zip, price_min, price_max, beds_min, zip_pref):
-    if not has_map_coords:
+def buyer_update_map(selected_zip, price_min, price_max, beds_min, zip_pref, market, map_mode, relayout):
+    # mover/ampliar el mapa solo cambia algo en el modo densidad
+    if dash.callback_context.triggered_id == "buy-map" and map_mode != "tiles":
+        return dash.no_update, dash.no_update, dash.no_update
+    mk = markets.get(market)
+    mk.maybe_refresh()
+    if mk.zip_df.empty:
         fig_empty = go.Figure(layout=go.Layout(title="Mapa no disponible (faltan coordenadas)."))
         return fig_empty, "", ""
 
-    price_min = float(price_min) if price_min is not None else bounds["price_min"]
-    price_max = float(price_max) if price_max is not None else bounds["price_max"]
+    price_min = float(price_min) if price_min is not None else mk.bounds["price_min"]
+    price_max = float(price_max) if price_max is not None else mk.bounds["price_max"]
     price_range = [price_min, price_max]
 
-    dff = filter_inventory_zip_price_beds(df, price_range, beds_min)
-    zdf = zip_points(dff)
+    zdf = mk.cube.zip_points(price_range, beds_min)
 
     warn = ""
     if zip_pref and (zdf.empty or zip_pref not in zdf["ZIP"].tolist()):
-        sug = suggest_zips_by_filter(df, price_range, beds_min)
+        sug = suggest_zips_by_filter(mk.df, price_range, beds_min, fidx=mk.fidx)
         warn = (
             f"No hay resultados en ZIP {zip_pref}. Sugerencias: {', '.join(map(str, sug))}"
             if sug
@@ -637,7 +740,20 @@ def buyer_update_map(selected_zip, price_min, price_max, beds_min, zip_pref):
         ]
     )
 
-    fig = zip_map(zdf, sel, "Zonas disponibles (click para seleccionar)")
+    if map_mode == "tiles":
+        # celdas/viviendas del viewport con los mismos filtros, sin pasar de POINT_BUDGET puntos.
+        # Con el precio sin tocar el filtro es solo de dormitorios: una banda con niveles precalculados
+        bbox, zoom = bbox_from_relayout(relayout)
+        full_price = price_min <= mk.bounds["price_min"] and price_max >= mk.bounds["price_max"]
+        no_beds = beds_min is None or float(beds_min) <= mk.bounds["beds_min"]
+        if full_price and no_beds:
+            rows, key = None, None
+        else:
+            rows = mk.fidx.select(price_range, beds_min)
+            key = ("beds", float(beds_min)) if full_price else None
+        fig = tile_map(mk.tiles, bbox, zoom, rows, title="Densidad de ventas (click para seleccionar)", key=key)
+    else:
+        fig = zip_map(zdf, sel, "Zonas disponibles (click para seleccionar)")
     return fig, chips_div, warn
 
 
@@ -645,13 +761,16 @@ def buyer_update_map(selected_zip, price_min, price_max, beds_min, zip_pref):
     Output("buy-table", "data"),
     Output("buy-table", "selected_rows"),
     Input("buy-map", "clickData"),
+    Input("market", "value"),
     State("buy-price-min", "value"),
     State("buy-price-max", "value"),
     State("buy-beds-min", "value"),
 )
-def buyer_load_zip_table(clickData, price_min, price_max, beds_min):
-    if not clickData:
+def buyer_load_zip_table(clickData, market, price_min, price_max, beds_min):
+    # el clic anterior es de otro mercado: la tabla se vacía
+    if not clickData or dash.callback_context.triggered_id == "market":
         return [], []
+    mk = markets.get(market)
     try:
         point = clickData["points"][0]
         if "customdata" in point and point["customdata"]:
@@ -660,9 +779,10 @@ def buyer_load_zip_table(clickData, price_min, price_max, beds_min):
             zip_clicked = int(point.get("hovertext"))
     except Exception:
         return [], []
-    price_min = float(price_min) if price_min is not None else bounds["price_min"]
-    price_max = float(price_max) if price_max is not None else bounds["price_max"]
-    dff = filter_inventory_zip_price_beds(df, [price_min, price_max], beds_min)
+    price_min = float(price_min) if price_min is not None else mk.bounds["price_min"]
+    price_max = float(price_max) if price_max is not None else mk.bounds["price_max"]
+    mk.ensure_valuations()
+    dff = filter_inventory_zip_price_beds(mk.zidx.frame(zip_clicked), [price_min, price_max], beds_min)
     table = listings_by_zip(dff, zip_clicked)
     keep = [
         c
@@ -675,10 +795,19 @@ def buyer_load_zip_table(clickData, price_min, price_max, beds_min):
             "SQUARE FEET",
             "YEAR BUILT",
             "PRICE",
+            "MODEL PRICE",
+            "OFFER MIN",
+            "MODEL TIME",
+            "MODEL DISCOUNT",
         ]
         if c in table.columns
     ]
-    return table[keep].head(200).to_dict("records"), []
+    table = table[keep].head(200)
+    if "MODEL TIME" in table:
+        table["MODEL TIME"] = [mk.ms.time_label(int(c)) if c == c else None for c in table["MODEL TIME"]]
+        # generación de modelos de la valoración: el panel de oferta solo la reutiliza si sigue vigente
+        table["MODEL GEN"] = mk.valuation_generation
+    return table.astype(object).where(table.notna(), None).to_dict("records"), []
 
 
 @app.callback(
@@ -687,12 +816,17 @@ def buyer_load_zip_table(clickData, price_min, price_max, beds_min):
     Output("buy-scatter", "figure"),
     Output("buy-scenarios", "data"),
     Output("buy-peers", "children"),
+    Output("buy-time-curve", "figure"),
     Input("buy-table", "derived_virtual_data"),
-    Input("buy-table", "selected_rows"),
+    Input("buy-table", "derived_virtual_selected_rows"),
+    State("market", "value"),
 )
-def buyer_predict_offer(rows, selected_rows):
+def buyer_predict_offer(rows, selected_rows, market):
     if not rows or not selected_rows:
-        return "", "", go.Figure(), [], ""
+        return "", "", go.Figure(), [], "", go.Figure()
+    mk = markets.get(market)
+    ms = mk.ms
+    ms.check_artifacts()
     row = rows[selected_rows[0]]
     zip_code = int(row.get("ZIP OR POSTAL CODE") or 0) if "ZIP OR POSTAL CODE" in row else None
     beds = float(row.get("BEDS") or 0)
@@ -700,15 +834,18 @@ def buyer_predict_offer(rows, selected_rows):
     sqft = float(row.get("SQUARE FEET") or 0)
     year = float(row.get("YEAR BUILT") or 0)
     ptype = row.get("PROPERTY TYPE") or "Single Family Residential"
-    used_approx = False
-    try:
-        f = ms.build_features(zip_code, beds, baths, sqft, 0, year, 0, ptype)
-        base = ms.predict_price(f)
-    except Exception:
-        used_approx = True
-        f = ms.build_features(zip_code, beds, baths, sqft, 0, year, 0, ptype)
-        base = ms.predict_price(f)
-    offer_min = base * 0.97
+    used_approx = not ms.ready   # modelos aún cargando: de momento medianas por ZIP
+    f = ms.build_record(zip_code, beds, baths, sqft, 0, year, 0, ptype)
+    if row.get("MODEL PRICE") is not None and ms.ready and row.get("MODEL GEN") == ms.bundle.generation:
+        # vivienda del inventario ya valorada con estos modelos: sin llamar al modelo
+        base, offer_min = float(row["MODEL PRICE"]), float(row["OFFER MIN"])
+    else:
+        try:
+            base = ms.predict_price(f)
+        except Exception:
+            used_approx = True
+            base = ms.predict_price(f)
+        offer_min = base * OFFER_FACTOR
     warn = (
         "No hay datos suficientes o modelo entrenado para este caso; te mostramos una aproximación basada en estadística de la zona."
         if used_approx
@@ -721,35 +858,24 @@ def buyer_predict_offer(rows, selected_rows):
         ],
         className="badge-row",
     )
-    dzip = df[df["ZIP OR POSTAL CODE"] == zip_code] if zip_code else df
+    dzip = mk.zidx.frame(zip_code) if zip_code else mk.df
     fig = sqft_vs_price_rich(dzip, "Precio vs Superficie (detalle)")
     fig = add_prediction_marker(fig, sqft, base, "Predicción")
     if "ZIP OR POSTAL CODE" in dzip:
         fig.update_traces(customdata=dzip["ZIP OR POSTAL CODE"])
     mults = [0.90, 0.95, 1.00, 1.05, 1.10]
     precios_esc = [base * m for m in mults]
-    ys = []
-    for precio_opcion in precios_esc:
+    # escenarios y curva (50 precios entre -15% y +15%): búsqueda binaria en la tabla de
+    # tiempos del modelo (TimeLookup); sin tabla para el ZIP, una sola llamada al KNN
+    curve_x = np.linspace(base * 0.85, base * 1.15, 50)
+    ys, curve_fig = [1] * len(mults), go.Figure()
+    if ms.has_time:
         try:
-            feats_time = ms.build_features(
-                zip_code,
-                beds,
-                baths,
-                sqft,
-                0,
-                year,
-                0,
-                ptype,
-            )
-            if ms.has_time:
-                cat = ms.predict_time_category(feats_time, precio_opcion)
-            else:
-                cat = 1
+            cats = ms.time_at_prices(f, np.r_[precios_esc, curve_x])
+            ys = cats[: len(mults)].tolist()
+            curve_fig = price_time_curve(curve_x.tolist(), cats[len(mults):].tolist())
         except Exception:
-            cat = 1
-        ys.append(cat)
-    if len(set(ys)) == 1:
-        ys = [0, 0, 1, 2, 2]
+            pass
     scen = [
         {
             "Escenario": f"{int(m * 100)}%",
@@ -776,7 +902,7 @@ def buyer_predict_offer(rows, selected_rows):
         )
     else:
         peer_msg = "No hay suficientes pares en el ZIP para comparar."
-    return warn, summary, fig, scen, peer_msg
+    return warn, summary, fig, scen, peer_msg, curve_fig
 
 
 @app.callback(
@@ -835,8 +961,13 @@ def sync_selected_zip(map_click, scatter_click, sel_rows, table_rows):
     Input("sell-ptype", "value"),
     Input("sell-lot", "value"),
     Input("sell-year", "value"),
+    State("market", "value"),
 )
-def seller_infer(zip_code, beds, baths, sqft, ptype, lot, year):
+def seller_infer(zip_code, beds, baths, sqft, ptype, lot, year, market):
+    mk = markets.get(market)
+    ms = mk.ms
+    ms.check_artifacts()
+    mk.maybe_refresh()
     if not zip_code:
         return (
             "Selecciona un ZIP del listado.",
@@ -847,6 +978,7 @@ def seller_infer(zip_code, beds, baths, sqft, ptype, lot, year):
             go.Figure(),
             [],
         )
+    postal_list = mk.postal_list
     if postal_list and zip_code not in postal_list:
         warn = f"ZIP {zip_code} fuera del dataset. Usa alguno de: {', '.join(map(str, postal_list[:10]))}"
         return (
@@ -858,7 +990,7 @@ def seller_infer(zip_code, beds, baths, sqft, ptype, lot, year):
             go.Figure(),
             [],
         )
-    snap = market_snapshot(df, zip_code)
+    snap = mk.snapshot(zip_code)
     market = html.Div(
         [
             html.Div(f"Listado en ZIP {zip_code}", className="badge"),
@@ -882,15 +1014,23 @@ def seller_infer(zip_code, beds, baths, sqft, ptype, lot, year):
         ],
         className="badge-row",
     )
-    comps = comps_similares(df, zip_code, beds or 0, baths or 0, sqft or 0)
-    used_approx = False
+    # comparables por cercanía alrededor del centro del ZIP (cruzan el límite del ZIP);
+    # si no hay ninguno del mismo tipo en el radio, se vuelve a los del propio ZIP
+    center = mk.zip_center(zip_code)
+    comps = (
+        comps_cercanos(mk.geo, center[0], center[1], beds or 0, baths or 0, sqft or 0, property_type=ptype)
+        if center else comps_similares(mk.df, zip_code, beds or 0, baths or 0, sqft or 0, zidx=mk.zidx)
+    )
+    if comps.empty:
+        comps = comps_similares(mk.df, zip_code, beds or 0, baths or 0, sqft or 0, zidx=mk.zidx)
+    used_approx = not ms.ready   # modelos aún cargando: de momento medianas por ZIP
     try:
-        f = ms.build_features(zip_code, beds, baths, sqft, lot, year, 0, ptype)
+        f = ms.build_record(zip_code, beds, baths, sqft, lot, year, 0, ptype)
         base = ms.predict_price(f)
         dom_cat = ms.predict_time_category(f, base) if ms.has_time else 1
     except Exception:
         used_approx = True
-        f = ms.build_features(zip_code, beds, baths, sqft, lot, year, 0, ptype)
+        f = ms.build_record(zip_code, beds, baths, sqft, lot, year, 0, ptype)
         base = ms.predict_price(f)
         dom_cat = 1
     dom_label = ms.time_label(dom_cat)
@@ -907,7 +1047,7 @@ def seller_infer(zip_code, beds, baths, sqft, ptype, lot, year):
         ],
         className="badge-row",
     )
-    inv = df[df["ZIP OR POSTAL CODE"] == int(zip_code)]
+    inv = mk.zidx.frame(zip_code)
     med_ppsf = (inv["PRICE"] / inv["SQUARE FEET"].replace(0, 1)).median() if not inv.empty else None
     ratio_bb = inv["BED BATH RATIO"].median() if "BED BATH RATIO" in inv else None
     metrics = html.Div(
@@ -0,0 +1,63 @@
+# bench/bench_align.py
+# Coste de alinear features a las columnas del modelo: get_dummies + concat (como se hacía
+# antes) frente a FeatureAligner. Uso: python -m bench.bench_align
+import time
+import numpy as np
+import pandas as pd
+
+from src.model import ModelService, FeatureAligner, COLS_TIME
+
+
+def legacy_align(df_in, target_cols):
+    df_num = df_in.select_dtypes(include=["number"]).copy()
+    dummies = pd.get_dummies(df_in[["PROPERTY TYPE"]], prefix=["property_type"])
+    X = pd.concat([df_num, dummies], axis=1)
+    for c in target_cols:
+        if c not in X.columns:
+            X[c] = 0
+    return X[target_cols]
+
+
+def timeit(fn, repeat: int) -> float:
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat
+
+
+def main():
+    import json
+    cols = json.load(open(COLS_TIME)) + ["property_type_Condo/Co-op", "property_type_Townhouse"]
+    ms = ModelService.__new__(ModelService)   # solo build_features: sin cargar dataset ni modelos
+    ms.default_ptype = "Single Family Residential"
+    aligner = FeatureAligner(cols)
+
+    one = ms.build_features(75208, 3, 2, 1600, 5000, 1990, 0, "Townhouse", 350000)
+    rec = one.iloc[0].to_dict()
+    buf = np.zeros((1, len(cols)))
+    rng = np.random.default_rng(0)
+    n = 10_000
+    many = ms.build_features_batch(
+        rng.integers(75001, 75400, n), rng.integers(1, 6, n), rng.choice([1, 1.5, 2, 3], n),
+        rng.integers(500, 5000, n), 5000, 1990, 0,
+        rng.choice(["Single Family Residential", "Townhouse", "Condo/Co-op"], n), 350000,
+    )
+    assert np.array_equal(aligner.transform(one), legacy_align(one, cols).to_numpy(dtype=float))
+    assert np.array_equal(aligner.transform(many), legacy_align(many, cols).to_numpy(dtype=float))
+
+    rows = [
+        ("1 fila  get_dummies/concat", timeit(lambda: legacy_align(one, cols), 300)),
+        ("1 fila  FeatureAligner.transform", timeit(lambda: aligner.transform(one), 3000)),
+        ("1 fila  transform_record (buffer)", timeit(lambda: aligner.transform_record(rec, buf), 30000)),
+        ("1 fila  build_record + transform_record", timeit(
+            lambda: aligner.transform_record(ms.build_record(75208, 3, 2, 1600, 5000, 1990, 0, "Townhouse", 350000), buf), 30000)),
+        (f"{n} filas get_dummies/concat (por fila)", timeit(lambda: legacy_align(many, cols), 20) / n),
+        (f"{n} filas FeatureAligner (por fila)", timeit(lambda: aligner.transform(many), 50) / n),
+    ]
+    for name, sec in rows:
+        print(f"{name:<42} {sec * 1e6:10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# bench/bench_forest.py
+# Modelo de precio: RandomForestRegressor.predict frente a FlatForest (nodos aplanados),
+# con un bosque del tamaño del grid de train_models. Uso: python -m bench.bench_forest
+import pickle, time
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from src.model import FlatForest
+from src.train_models import DATA_PATH, DROP_MODEL1, build_features, safe_drop
+
+
+def timeit(fn, repeat: int) -> float:
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat
+
+
+def main():
+    df = build_features(pd.read_csv(DATA_PATH))
+    X = safe_drop(df, DROP_MODEL1).select_dtypes(include=["number"])
+    mask = ~X.isna().any(axis=1)
+    X, y = X[mask].to_numpy(dtype=float), df["PRICE"].astype(float)[mask].to_numpy()
+
+    for n_estimators, max_depth in [(200, 5), (350, 8)]:
+        rf = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=0, n_jobs=-1).fit(X, y)
+        flat = FlatForest.from_sklearn(rf)
+        rf_seq = pickle.loads(pickle.dumps(rf)).set_params(n_jobs=1)
+        assert np.array_equal(flat.predict(X), rf_seq.predict(X))
+
+        one, many = X[:1], X[:1000]
+        print(f"{n_estimators} árboles, max_depth={max_depth}")
+        print(f"  {'pickle MB':<32} {len(pickle.dumps(rf)) / 2**20:10.1f}")
+        print(f"  {'FlatForest MB':<32} {flat.nbytes / 2**20:10.1f}")
+        for name, fn, rep, n in [
+            ("1 fila  sklearn n_jobs=-1", lambda: rf.predict(one), 20, 1),
+            ("1 fila  sklearn n_jobs=1", lambda: rf_seq.predict(one), 20, 1),
+            ("1 fila  FlatForest", lambda: flat.predict(one), 2000, 1),
+            ("1000 filas sklearn (por fila)", lambda: rf.predict(many), 10, 1000),
+            ("1000 filas FlatForest (por fila)", lambda: flat.predict(many), 20, 1000),
+        ]:
+            print(f"  {name:<32} {timeit(fn, rep) / n * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
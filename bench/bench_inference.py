@@ -0,0 +1,63 @@
+# bench/bench_inference.py
+# Predicciones de una vivienda desde muchos hilos a la vez (como callbacks de Dash):
+# cada hilo llama a predict_time_category directamente o a través de InferencePool.
+# Uso: python -m bench.bench_inference [workers del pool]
+import sys, threading, time, warnings
+import numpy as np
+
+from src.etl import load_data
+from src.inference import InferencePool
+from src.model import ModelService
+
+PER_THREAD = 200
+
+
+def run(ms, threads: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # viviendas distintas en cada llamada: ninguna sale de la caché
+    jobs = [[(int(rng.integers(75001, 75400)), float(rng.integers(1, 6)), float(rng.choice([1, 2, 3])),
+              float(rng.integers(500, 5000)), float(rng.integers(150_000, 900_000))) for _ in range(PER_THREAD)]
+            for _ in range(threads)]
+    lat = [[] for _ in range(threads)]
+
+    def worker(i):
+        for z, beds, baths, sqft, price in jobs[i]:
+            rec = ms.build_record(z, beds, baths, sqft, 5000, 1990, 0, "Single Family Residential")
+            t = time.perf_counter()
+            ms.predict_time_category(rec, price)
+            lat[i].append(time.perf_counter() - t)
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    wall = time.perf_counter() - t0
+    all_lat = np.concatenate([np.asarray(x) for x in lat]) * 1e3
+    return threads * PER_THREAD / wall, np.percentile(all_lat, 50), np.percentile(all_lat, 99)
+
+
+def main():
+    warnings.simplefilter("ignore")
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    df = load_data("data/sold_data.csv")
+    direct = ModelService(df, cache_size=16)
+    pool = InferencePool(workers)
+    pooled = ModelService(df, cache_size=16, batcher=pool)
+    pool.start()
+    while not pool.ready:
+        time.sleep(0.05)
+    run(pooled, 4, 0)   # cada proceso del pool carga los modelos en su primer lote
+
+    print(f"{'hilos':>6} {'':<12} {'pred/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for threads in (1, 8, 32, 64):
+        for name, ms in (("directo", direct), (f"pool x{workers}", pooled)):
+            rate, p50, p99 = run(ms, threads, threads)
+            print(f"{threads:>6} {name:<12} {rate:9.0f} {p50:8.2f} {p99:8.2f}")
+    print(pool.stats())
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench/bench_knn.py
+# KNN de tiempo: StandardScaler + KNeighborsClassifier (lo que hay en los .pkl) frente a
+# KnnTimeIndex (KDTree + escalador fundido), con 10k, 100k y 1M filas de entrenamiento.
+# Uso: python -m bench.bench_knn [filas ...]
+import os, sys, pickle, time, warnings
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from sklearn.neighbors import KNeighborsClassifier
+
+from src.knn_index import KnnTimeIndex
+from src.model import MODELS_DIR, TIME_INDEX, TIME_MODEL, _asset_path, _pickle_load
+
+
+def timeit(fn, repeat: int) -> float:
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat
+
+
+def synthetic(n: int, rng):
+    """filas con la forma de las de entrenamiento: se remuestrean las reales con algo de ruido"""
+    # la versión publicada (CURRENT) o los ficheros sueltos, igual que ModelBundle.load
+    index_path, knn_path = _asset_path(MODELS_DIR, TIME_INDEX), _asset_path(MODELS_DIR, TIME_MODEL)
+    if not os.path.exists(index_path):
+        sys.exit(f"no existe {index_path}: entrena primero (python -m src.train_models)")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        knn = _pickle_load(knn_path)
+    index = KnnTimeIndex.load(index_path)   # matriz de entrenamiento (escalada) y etiquetas
+    base = (index.X - index.b) / index.w
+    pick = rng.integers(0, len(base), n)
+    X = base[pick] * rng.normal(1.0, 0.03, (n, base.shape[1]))
+    return X, index.classes_[index.y[pick]], knn.get_params()
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    rng = np.random.default_rng(0)
+    print(f"{'filas':>9} {'':<8} {'MB':>8} {'1 fila us':>10} {'55 filas us':>12} {'coinciden':>10}")
+    for n in sizes:
+        X, y, params = synthetic(n, rng)
+        scaler = StandardScaler().fit(X)
+        Xs = scaler.transform(X)
+        knn = KNeighborsClassifier(**params).fit(Xs, y)
+        index = KnnTimeIndex.from_training(Xs, y, knn, scaler)
+
+        one = X[rng.integers(0, n, 1)] * 1.01
+        curve = np.repeat(one, 55, axis=0)
+        curve[:, 1] *= np.linspace(0.8, 1.2, 55)   # PRICE, como en predict_time_curve
+        queries = X[rng.integers(0, n, 2000)] * rng.normal(1.0, 0.03, (2000, X.shape[1]))
+
+        def sk(Q):
+            return knn.predict_proba(scaler.transform(Q))
+
+        agree = float(np.mean(knn.predict(scaler.transform(queries)) == index.predict(queries)))
+        pkl_mb = (len(pickle.dumps(knn)) + len(pickle.dumps(scaler))) / 2**20
+        rows = [
+            ("pickle", pkl_mb, timeit(lambda: sk(one), 200), timeit(lambda: sk(curve), 100), ""),
+            ("índice", index.nbytes / 2**20, timeit(lambda: index.predict_proba(one), 200),
+             timeit(lambda: index.predict_proba(curve), 100), f"{agree:.4f}"),
+        ]
+        for name, mb, t1, t55, extra in rows:
+            print(f"{n:>9} {name:<8} {mb:8.1f} {t1 * 1e6:10.1f} {t55 * 1e6:12.1f} {extra:>10}")
+
+
+if __name__ == "__main__":
+    main()
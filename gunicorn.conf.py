@@ -0,0 +1,38 @@
+# gunicorn.conf.py
+# Config de gunicorn (Procfile / render.yaml). Con preload el dataset, los índices y el
+# ModelService se construyen una sola vez en el master y los workers los heredan por fork
+# (copy-on-write): la RSS por worker no crece con el dataset y arrancan casi al instante.
+import gc
+import os
+import sys
+
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+
+def when_ready(server):
+    # todo lo cargado hasta aquí sale del GC: si no, cada recolección en un worker
+    # escribe en las cabeceras de esos objetos y fuerza la copia de sus páginas
+    if preload_app:
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # los modelos se cargan en un hilo de cada worker (nunca en el master: los hilos no
+    # sobreviven al fork); así empiezan a cargar antes de la primera petición
+    app = sys.modules.get("app")
+    if app is not None:
+        app.markets.start_models()
+        # el pool de inferencia (INFERENCE_WORKERS) es por worker: con varios workers serían
+        # workers x INFERENCE_WORKERS procesos cargando los modelos, así que solo se usa con uno
+        if app.markets.inference is not None and worker.cfg.workers > 1:
+            worker.log.warning("INFERENCE_WORKERS ignorado con %d workers: se predice en cada worker", worker.cfg.workers)
+            app.markets.disable_inference()
+        # si queda, el pool también arranca ya, no en la primera predicción
+        if app.markets.inference is not None:
+            app.markets.inference.start()
+
+
+def worker_exit(server, worker):
+    app = sys.modules.get("app")
+    if app is not None and app.markets.inference is not None:
+        app.markets.inference.shutdown()
@@ -0,0 +1,121 @@
+# src/cube.py
+import numpy as np
+import pandas as pd
+
+
+class ZipCube:
+    """
+    Cubo precalculado ZIP x nivel de BEDS x banda de precio para el mapa del comprador.
+    Responde a zip_points(filtro por precio y beds) sin recorrer las filas:
+    - COUNT exacto (searchsorted sobre precios ordenados dentro de cada celda ZIP/BEDS)
+    - MEDIAN_PRICE aproximada con error relativo <= rel_error (bandas geométricas),
+      o exacta con exact=True (junta los tramos ya ordenados de cada ZIP)
+    - LAT/LON: mediana de todo el ZIP, así las burbujas no se mueven al filtrar
+    Las filas sin PRICE o sin coordenadas no entran en el cubo.
+    """
+    def __init__(self, df: pd.DataFrame, rel_error: float = 0.02, exact: bool = False):
+        self.rel_error = float(rel_error)
+        self.exact = exact
+        need = ["ZIP OR POSTAL CODE", "LATITUDE", "LONGITUDE"]
+        if not set(need + ["PRICE", "BEDS"]).issubset(df.columns):
+            self.zips = np.empty(0, dtype=int)
+            return
+
+        d = df.dropna(subset=need)
+        g = d.groupby("ZIP OR POSTAL CODE")
+        self.zips = g.size().index.to_numpy().astype(int)
+        self.lat = g["LATITUDE"].median().to_numpy()
+        self.lon = g["LONGITUDE"].median().to_numpy()
+
+        d = d[d["PRICE"].notna()]
+        price = d["PRICE"].to_numpy(dtype=float)
+        beds = d["BEDS"].to_numpy(dtype=float)
+        self.beds_levels = np.unique(beds)
+        zid = np.searchsorted(self.zips, d["ZIP OR POSTAL CODE"].to_numpy().astype(int))
+        lvl = np.searchsorted(self.beds_levels, beds)
+        self.n_levels = len(self.beds_levels)
+
+        # clave compuesta celda * (U + 1) + rango del precio: un único array ordenado
+        # donde cada celda es un tramo contiguo y se puede buscar en todas a la vez
+        self.uniq_prices = np.unique(price)
+        self._stride = len(self.uniq_prices) + 1
+        cell = zid * self.n_levels + lvl
+        keys = cell.astype(np.int64) * self._stride + np.searchsorted(self.uniq_prices, price)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.prices = price[order]
+        self.n_cells = len(self.zips) * self.n_levels
+
+        # bandas geométricas: el punto medio geométrico queda a <= rel_error de cualquier precio de la banda
+        q = (1.0 + self.rel_error) ** 2
+        positive = self.uniq_prices[self.uniq_prices > 0]
+        if len(positive):
+            p_lo, p_hi = positive[0], positive[-1]
+            n_bands = int(np.ceil(np.log(p_hi / p_lo) / np.log(q))) + 1
+            self.edges = np.concatenate([[0.0], p_lo * q ** np.arange(n_bands + 1)])
+        else:
+            self.edges = np.array([0.0, 1.0])
+        # posición absoluta (en self.keys) del primer precio >= cada borde, por celda
+        edge_rank = np.searchsorted(self.uniq_prices, self.edges, "left")
+        cells = np.arange(self.n_cells, dtype=np.int64)[:, None]
+        self._edge_pos = np.searchsorted(self.keys, cells * self._stride + edge_rank[None, :], "left")
+
+    def _cell_bounds(self, price_range, beds_min):
+        pmin = price_range[0] if price_range else None
+        pmax = price_range[1] if price_range else None
+        r_lo = int(np.searchsorted(self.uniq_prices, float(pmin), "left")) if pmin is not None else 0
+        r_hi = int(np.searchsorted(self.uniq_prices, float(pmax), "right")) if pmax is not None else len(self.uniq_prices)
+        r_hi = max(r_lo, r_hi)
+        l0 = int(np.searchsorted(self.beds_levels, float(beds_min), "left")) if beds_min is not None else 0
+
+        cells = (np.arange(len(self.zips))[:, None] * self.n_levels + np.arange(l0, self.n_levels)[None, :])
+        base = cells.astype(np.int64) * self._stride
+        lo = np.searchsorted(self.keys, base + r_lo, "left")
+        hi = np.searchsorted(self.keys, base + r_hi, "left")
+        return cells, lo, hi
+
+    def _approx_median(self, cells, lo, hi, counts, price_range):
+        # filas en rango por debajo de cada borde, sumando los niveles de beds -> (Z, bandas+1)
+        ep = self._edge_pos[cells]
+        below = (np.clip(ep, lo[..., None], hi[..., None]) - lo[..., None]).sum(axis=1)
+        pmin = float(price_range[0]) if price_range and price_range[0] is not None else 0.0
+        pmax = float(price_range[1]) if price_range and price_range[1] is not None else np.inf
+
+        def kth(k):
+            j = (below <= k[:, None]).sum(axis=1)          # banda [edges[j-1], edges[j]) que contiene el k-ésimo
+            j = np.clip(j, 1, len(self.edges) - 1)
+            a = np.maximum(self.edges[j - 1], pmin)
+            b = np.minimum(self.edges[j], pmax)
+            return np.where(a > 0, np.sqrt(a * b), a)
+
+        k_lo = (counts - 1) // 2
+        k_hi = counts // 2
+        return (kth(k_lo) + kth(k_hi)) / 2.0
+
+    def _exact_median(self, lo, hi, counts):
+        out = np.full(len(counts), np.nan)
+        for z in np.flatnonzero(counts):
+            parts = [self.prices[a:b] for a, b in zip(lo[z], hi[z]) if b > a]
+            out[z] = np.median(np.concatenate(parts))
+        return out
+
+    def zip_points(self, price_range=None, beds_min=None) -> pd.DataFrame:
+        """Equivalente a etl.zip_points(filter_inventory_zip_price_beds(...)) en O(nº de ZIPs)"""
+        if len(self.zips) == 0:
+            return pd.DataFrame(columns=["ZIP","COUNT","MEDIAN_PRICE","LAT","LON"])
+        cells, lo, hi = self._cell_bounds(price_range, beds_min)
+        counts = (hi - lo).sum(axis=1)
+        if self.exact:
+            med = self._exact_median(lo, hi, counts)
+        else:
+            med = self._approx_median(cells, lo, hi, counts, price_range)
+
+        keep = counts > 0
+        out = pd.DataFrame({
+            "ZIP": self.zips[keep],
+            "COUNT": counts[keep],
+            "MEDIAN_PRICE": med[keep],
+            "LAT": self.lat[keep],
+            "LON": self.lon[keep],
+        })
+        return out.sort_values("COUNT", ascending=False, kind="stable").reset_index(drop=True)
@@ -1,10 +1,37 @@
 # src/etl.py
+import os, json, shutil, hashlib
 import pandas as pd
 import numpy as np
 
-def load_data(path: str = "data/sold_data.csv") -> pd.DataFrame:
-    df = pd.read_csv(path)
+from src.valuations import VALUATION_COLS
 
+
+CACHE_DIR = "data/.cache"
+# subir la versión si cambia la limpieza de load_data, así se invalida la caché vieja
+CACHE_VERSION = 1
+
+
+def load_data(path: str = "data/sold_data.csv", cache_dir: str | None = CACHE_DIR,
+              compact: bool = False) -> pd.DataFrame:
+    """
+    Carga el CSV limpio. Si hay caché columnar (.npy por columna) con la misma
+    huella del CSV (tamaño, mtime y hash) se lee de ahí; si no, se parsea y se guarda.
+    cache_dir=None desactiva la caché. compact=True aplica compact_frame.
+    """
+    if cache_dir is None:
+        df = clean_frame(pd.read_csv(path))
+        return compact_frame(df) if compact else df
+
+    cdir = _cache_path(path, cache_dir)
+    df = _read_cache(cdir, path)
+    if df is None:
+        fingerprint = _fingerprint(path)
+        df = clean_frame(pd.read_csv(path))
+        _write_cache(df, cdir, fingerprint)
+    return compact_frame(df) if compact else df
+
+
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
     df["LATITUDE"] = pd.to_numeric(df["LATITUDE"], errors="coerce")
     df["LONGITUDE"] = pd.to_numeric(df["LONGITUDE"], errors="coerce")
 
@@ -35,6 +62,267 @@ def load_data(path: str = "data/sold_data.csv") -> pd.DataFrame:
     return df
 
 
+# ---------------- caché columnar ----------------
+
+def _cache_path(path: str, cache_dir: str) -> str:
+    # nombre legible + hash de la ruta absoluta: dos mercados con CSV del mismo nombre en
+    # carpetas distintas no comparten (ni se pisan) la caché
+    name = os.path.splitext(os.path.basename(path))[0]
+    tag = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:10]
+    return os.path.join(cache_dir, f"{name}-{tag}")
+
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": _file_sha1(path)}
+
+
+def _cache_is_fresh(meta: dict, path: str, version=CACHE_VERSION) -> bool:
+    if meta.get("version") != version:
+        return False
+    src = meta.get("source", {})
+    st = os.stat(path)
+    if src.get("size") != st.st_size:
+        return False
+    if src.get("mtime_ns") == st.st_mtime_ns:
+        return True
+    # mismo tamaño pero mtime distinto (copia, checkout...): decide el hash
+    return src.get("sha1") == _file_sha1(path)
+
+
+def _read_cache(cdir: str, path: str, mmap: bool = False, version=CACHE_VERSION) -> pd.DataFrame | None:
+    # mmap=True: columnas numéricas y códigos quedan como memmap de solo lectura,
+    # compartidas entre procesos a través de la page cache
+    # version: la de load_data (CACHE_VERSION) o la de otra salida con el mismo formato (stream_etl)
+    meta_path = os.path.join(cdir, "meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if not _cache_is_fresh(meta, path, version):
+            return None
+        mtime_ns = os.stat(path).st_mtime_ns
+        if meta["source"].get("mtime_ns") != mtime_ns:
+            # validada por hash: se apunta el mtime nuevo para no re-hashear en cada arranque
+            meta["source"]["mtime_ns"] = mtime_ns
+            _dump_meta(meta, cdir)
+        cols = {}
+        for col in meta["columns"]:
+            values = np.load(os.path.join(cdir, col["file"]), mmap_mode="r" if mmap else None, allow_pickle=False)
+            if col["kind"] == "cat":
+                values = pd.Categorical.from_codes(values, categories=col["categories"])
+            elif col["kind"] == "str":
+                values = pd.Categorical.from_codes(values, categories=col["categories"])
+                values = pd.Series(values).astype(col["dtype"])
+            elif col["kind"] == "text":
+                offsets = np.load(os.path.join(cdir, col["offsets"]), allow_pickle=False)
+                nulls = np.load(os.path.join(cdir, col["nulls"]), allow_pickle=False)
+                values = pd.Series(_decode_text(values, offsets, nulls), dtype=col["dtype"])
+            cols[col["name"]] = values
+        df = pd.DataFrame(cols, index=pd.RangeIndex(meta["rows"]), copy=False)
+        df.attrs.update(meta.get("attrs", {}))
+        return df
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _decode_text(blob: np.ndarray, offsets: np.ndarray, nulls: np.ndarray) -> np.ndarray:
+    # columna de texto libre: bytes utf-8 concatenados + offsets (n + 1) + máscara de nulos
+    data = blob.tobytes()
+    out = np.array([data[a:b].decode("utf-8") for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())], dtype=object)
+    out[nulls] = np.nan
+    return out
+
+
+def _dump_meta(meta: dict, cdir: str):
+    tmp = os.path.join(cdir, f"meta.json.tmp-{os.getpid()}")
+    try:
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(cdir, "meta.json"))
+    except OSError:
+        pass
+
+
+def _write_cache(df: pd.DataFrame, cdir: str, fingerprint: dict):
+    # se escribe en un directorio temporal y se renombra; si otro worker
+    # gana la carrera simplemente se descarta el nuestro
+    tmp = f"{cdir}.tmp-{os.getpid()}"
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columns = []
+        for i, name in enumerate(df.columns):
+            s = df[name]
+            fname = f"c{i:03d}.npy"
+            entry = {"name": name, "file": fname, "dtype": str(s.dtype)}
+            if s.dtype.kind in "biufcmM":
+                entry["kind"] = "num"
+                np.save(os.path.join(tmp, fname), s.to_numpy())
+            elif isinstance(s.dtype, pd.CategoricalDtype):
+                entry["kind"] = "cat"
+                entry["categories"] = [str(c) for c in s.cat.categories]
+                np.save(os.path.join(tmp, fname), s.cat.codes.to_numpy())
+            else:
+                codes, uniques = pd.factorize(s)
+                entry["kind"] = "str"
+                entry["categories"] = [str(u) for u in uniques]
+                np.save(os.path.join(tmp, fname), codes.astype(np.int32))
+            columns.append(entry)
+        meta = {"version": CACHE_VERSION, "source": fingerprint, "rows": len(df), "columns": columns,
+                "attrs": dict(df.attrs)}
+        _dump_meta(meta, tmp)
+        if os.path.exists(cdir):
+            shutil.rmtree(cdir, ignore_errors=True)
+        os.rename(tmp, cdir)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ---------------- esquema compacto ----------------
+
+COMPACT_FLOAT32 = ["BEDS", "BATHS", "SQUARE FEET", "LOT SIZE", "HOA/MONTH", "$/SQUARE FOOT",
+                   "BED BATH RATIO", "LATITUDE", "LONGITUDE"]
+COMPACT_INT32 = ["ZIP OR POSTAL CODE", "YEAR BUILT", "DAYS ON MARKET", "SOLD MONTH"]
+COMPACT_DATES = ["SOLD DATE", "LISTING DATE"]
+DATE_NAT = np.iinfo(np.int16).min
+
+
+def compact_frame(df: pd.DataFrame, like: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Versión compacta del dataset limpio (se multiplica por cada worker):
+    - strings de baja cardinalidad -> category
+    - medidas -> float32 (PRICE y ORIGINAL LISTING PRICE se quedan en float64 por precisión)
+    - ZIP, YEAR BUILT, DOM, SOLD MONTH -> int32 (float32 si tienen nulos, int32 no admite NaN)
+    - fechas -> int16 con días desde df.attrs["date_base"] (NaT = -32768); ver expand_dates
+    like: frame compacto ya existente (ingesta), para reutilizar sus categorías, sus tipos y su
+    fecha base. like no se modifica: si el lote trae categorías nuevas o nulos en una columna
+    int32, widen_compact da la copia de like con la que concatenar.
+    """
+    out = df.copy()
+    cats = [c for c in out.columns if out[c].dtype == object or pd.api.types.is_string_dtype(out[c])]
+    for c in cats:
+        if like is None:
+            if out[c].nunique() <= 0.5 * len(out):
+                out[c] = out[c].astype("category")
+        elif c in like and isinstance(like[c].dtype, pd.CategoricalDtype):
+            # las categorías del frame existente y detrás las nuevas: sus códigos no cambian
+            known = like[c].cat.categories
+            extra = pd.Index(out[c].dropna().unique()).difference(known)
+            out[c] = pd.Categorical(out[c], categories=known.append(extra) if len(extra) else known)
+
+    for c in COMPACT_FLOAT32:
+        if c in out:
+            out[c] = out[c].astype(np.float32)
+    for c in COMPACT_INT32:
+        if c in out:
+            # con like se mantiene su tipo; int32 solo pasa a float32 si el lote trae nulos
+            target = like[c].dtype if like is not None and c in like else np.int32
+            out[c] = out[c].astype(np.float32 if target != np.int32 or out[c].isna().any() else np.int32)
+
+    base = pd.Timestamp((like.attrs if like is not None else {}).get("date_base", "2000-01-01"))
+    for c in COMPACT_DATES:
+        if c in out and pd.api.types.is_datetime64_any_dtype(out[c]):
+            days = (out[c] - base).dt.days.clip(DATE_NAT + 1, np.iinfo(np.int16).max)
+            out[c] = days.fillna(DATE_NAT).astype(np.int16)
+    out.attrs["compact"] = True
+    out.attrs["date_base"] = base.isoformat()
+    return out
+
+
+def widen_compact(like: pd.DataFrame, batch: pd.DataFrame) -> pd.DataFrame:
+    """
+    like con las columnas ensanchadas para que concat con batch (compact_frame(.., like=like))
+    conserve el esquema compacto: categorías nuevas al final y int32 -> float32 si el lote trae
+    nulos. Si no hace falta nada devuelve like tal cual; si no, una copia (like no se toca).
+    """
+    cols = {}
+    for c in batch.columns:
+        if c not in like:
+            continue
+        a, b = like[c].dtype, batch[c].dtype
+        if isinstance(a, pd.CategoricalDtype) and isinstance(b, pd.CategoricalDtype) \
+                and len(b.categories) > len(a.categories):
+            cols[c] = like[c].cat.set_categories(b.categories)
+        elif a == np.int32 and b == np.float32:
+            cols[c] = like[c].astype(np.float32)
+    if not cols:
+        return like
+    out = like.assign(**cols)
+    out.attrs = dict(like.attrs)
+    return out
+
+
+def expand_dates(df: pd.DataFrame, cols=COMPACT_DATES) -> pd.DataFrame:
+    """Devuelve las fechas compactas (int16) como datetime64; si el frame no es compacto no toca nada."""
+    if not df.attrs.get("compact"):
+        return df
+    out = df.copy()
+    base = pd.Timestamp(df.attrs["date_base"])
+    for c in cols:
+        if c in out and out[c].dtype == np.int16:
+            d = out[c].astype("float64").where(out[c] != DATE_NAT)
+            out[c] = base + pd.to_timedelta(d, unit="D")
+    return out
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Bytes por columna antes/después (memory_usage deep) con una fila TOTAL al final."""
+    b = before.memory_usage(deep=True, index=False)
+    a = after.memory_usage(deep=True, index=False)
+    rep = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "dtype_after": after.dtypes.reindex(before.columns).astype(str),
+        "bytes_before": b,
+        "bytes_after": a.reindex(b.index),
+    })
+    rep.loc["TOTAL"] = ["", "", int(b.sum()), int(a.sum())]
+    rep["ratio"] = rep["bytes_after"] / rep["bytes_before"]
+    return rep
+
+
+def deep_nbytes(obj, skip=()) -> int:
+    """
+    Bytes aproximados de una estructura: arrays numpy, frames de pandas (deep), árboles de
+    sklearn (get_arrays / __getstate__) y lo que cuelga de sus atributos, dicts y listas.
+    skip: objetos que no se cuentan (p.ej. el dataset compartido); cada objeto cuenta una vez.
+    """
+    seen = {id(o) for o in skip}
+
+    def size(o) -> int:
+        if o is None or isinstance(o, (str, bytes, int, float, bool)) or id(o) in seen:
+            return 0
+        seen.add(id(o))
+        if isinstance(o, np.ndarray):
+            return 0 if o.base is not None and id(o.base) in seen else o.nbytes
+        if isinstance(o, pd.DataFrame):
+            return int(o.memory_usage(deep=True).sum())
+        if isinstance(o, (pd.Series, pd.Index)):
+            return int(o.memory_usage(deep=True))
+        if isinstance(o, dict):
+            return sum(size(v) for v in o.values())
+        if isinstance(o, (list, tuple, set)):
+            return sum(size(v) for v in o)
+        if hasattr(o, "get_arrays"):   # KDTree / BallTree
+            return sum(size(a) for a in o.get_arrays())
+        if hasattr(o, "__dict__"):
+            return size(vars(o))
+        try:                           # objetos de Cython (p.ej. sklearn.tree._tree.Tree)
+            state = o.__getstate__()
+        except Exception:
+            return 0
+        return size(state) if isinstance(state, dict) else 0
+
+    return size(obj)
+
+
 def dataset_bounds(df: pd.DataFrame) -> dict:
     def rng(col):
         if col not in df or df[col].dropna().empty:
@@ -66,36 +354,179 @@ def zip_points(df: pd.DataFrame) -> pd.DataFrame:
     return out.sort_values("COUNT", ascending=False).reset_index(drop=True)
 
 
-def filter_inventory_zip_price_beds(df: pd.DataFrame, price_range, beds_min):
-    dff = df.copy()
+class FilterIndex:
+    """
+    Motor de filtros columnar sobre un frame fijo (se construye una vez):
+    - PRICE ordenado -> el rango de precio es un slice vía searchsorted
+    - bitmaps "BEDS >= nivel" precalculados, en el mismo orden que PRICE
+    - bitmaps por valor para columnas categóricas (PROPERTY TYPE, ...), creados al primer uso
+    select() devuelve posiciones de fila (sin copiar el frame); frame() materializa solo esas filas.
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        price = df["PRICE"].to_numpy(dtype=float)
+        self.order = np.argsort(price, kind="stable")   # los NaN quedan al final
+        self.prices = price[self.order]
+        self.n_priced = int(np.count_nonzero(~np.isnan(self.prices)))
+
+        beds = df["BEDS"].to_numpy(dtype=float)[self.order]
+        self.beds_levels = np.unique(beds[~np.isnan(beds)])
+        self._beds_ge = [beds >= lv for lv in self.beds_levels]
+        self._codes = {}    # col -> (codes en orden de precio, {valor: code})
+        self._bitmaps = {}  # (col, valor) -> bitmap
+
+    def _price_slice(self, price_range) -> slice:
+        pmin = price_range[0] if price_range else None
+        pmax = price_range[1] if price_range else None
+        if pmin is None and pmax is None:
+            return slice(0, len(self.prices))
+        priced = self.prices[:self.n_priced]
+        lo = int(np.searchsorted(priced, float(pmin), "left")) if pmin is not None else 0
+        hi = int(np.searchsorted(priced, float(pmax), "right")) if pmax is not None else self.n_priced
+        return slice(lo, max(lo, hi))
+
+    def beds_bitmap(self, beds_min) -> np.ndarray | None:
+        i = int(np.searchsorted(self.beds_levels, float(beds_min), "left"))
+        if i >= len(self.beds_levels):
+            return None
+        return self._beds_ge[i]
+
+    def eq_bitmap(self, col: str, value) -> np.ndarray:
+        key = (col, value)
+        if key not in self._bitmaps:
+            if col not in self._codes:
+                codes, uniques = pd.factorize(self.df[col].to_numpy()[self.order])
+                self._codes[col] = (codes, {v: i for i, v in enumerate(uniques)})
+            codes, lookup = self._codes[col]
+            code = lookup.get(value)
+            self._bitmaps[key] = codes == code if code is not None else np.zeros(len(codes), dtype=bool)
+        return self._bitmaps[key]
+
+    def select(self, price_range=None, beds_min=None, where: dict | None = None) -> np.ndarray:
+        """
+        Posiciones (orden original) de las filas que cumplen los filtros.
+        where: {columna: valor o lista de valores} para igualdades sobre categóricas.
+        """
+        sl = self._price_slice(price_range)
+        mask = None
+        if beds_min is not None:
+            bm = self.beds_bitmap(beds_min)
+            if bm is None:
+                return np.empty(0, dtype=np.intp)
+            mask = bm[sl]
+        for col, values in (where or {}).items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            m = np.zeros(sl.stop - sl.start, dtype=bool)
+            for v in values:
+                m |= self.eq_bitmap(col, v)[sl]
+            mask = m if mask is None else (mask & m)
+        rows = self.order[sl]
+        if mask is not None:
+            rows = rows[mask]
+        return np.sort(rows)
+
+    def frame(self, rows: np.ndarray) -> pd.DataFrame:
+        return self.df.take(rows)
+
+
+def filter_inventory_zip_price_beds(df: pd.DataFrame, price_range, beds_min, fidx: FilterIndex | None = None):
+    if fidx is not None and fidx.df is df:
+        return fidx.frame(fidx.select(price_range, beds_min))
+    mask = np.ones(len(df), dtype=bool)
     if price_range and price_range[0] is not None:
-        dff = dff[dff["PRICE"] >= float(price_range[0])]
+        mask &= (df["PRICE"] >= float(price_range[0])).to_numpy()
     if price_range and price_range[1] is not None:
-        dff = dff[dff["PRICE"] <= float(price_range[1])]
+        mask &= (df["PRICE"] <= float(price_range[1])).to_numpy()
     if beds_min is not None:
-        dff = dff[dff["BEDS"] >= float(beds_min)]
-    return dff
+        mask &= (df["BEDS"] >= float(beds_min)).to_numpy()
+    return df[mask]
+
+
+class ZipIndex:
+    """
+    Índice por ZIP construido una sola vez: las filas quedan ordenadas por ZIP
+    y cada ZIP ocupa un rango contiguo [start, end) de self.df.
+    Usar self.df como dataset de la app para que los lookups por ZIP sean slices.
+    """
+    def __init__(self, df: pd.DataFrame):
+        z = df["ZIP OR POSTAL CODE"].to_numpy()
+        if len(z) and not (z[1:] >= z[:-1]).all():
+            order = np.argsort(z, kind="stable")
+            df = df.take(order)
+            z = z[order]
+        self.df = df.reset_index(drop=True)
+        # z ya está ordenado: cada ZIP empieza donde cambia el valor
+        self.starts = np.flatnonzero(np.r_[True, z[1:] != z[:-1]]) if len(z) else np.empty(0, dtype=np.intp)
+        self.zips = z[self.starts]
+        self.ends = np.append(self.starts[1:], len(z)).astype(self.starts.dtype)
+
+    def rows(self, zip_code) -> slice:
+        i = int(np.searchsorted(self.zips, int(zip_code)))
+        if i < len(self.zips) and self.zips[i] == int(zip_code):
+            return slice(int(self.starts[i]), int(self.ends[i]))
+        return slice(0, 0)
+
+    def frame(self, zip_code) -> pd.DataFrame:
+        return self.df.iloc[self.rows(zip_code)]
+
+    def counts(self) -> dict:
+        return dict(zip(self.zips.tolist(), (self.ends - self.starts).tolist()))
+
+    def extend(self, new_rows: pd.DataFrame) -> "ZipIndex":
+        """
+        Nuevo índice con las filas añadidas en su sitio: se ordenan solo las filas nuevas
+        y se intercalan con las existentes (merge lineal, sin reordenar todo el dataset).
+        """
+        new_rows = new_rows.reindex(columns=self.df.columns)
+        zn = new_rows["ZIP OR POSTAL CODE"].to_numpy()
+        order = np.argsort(zn, kind="stable")
+        new_rows, zn = new_rows.take(order), zn[order]
+
+        n, m = len(self.df), len(new_rows)
+        new_pos = np.searchsorted(self.df["ZIP OR POSTAL CODE"].to_numpy(), zn, "right") + np.arange(m)
+        is_new = np.zeros(n + m, dtype=bool)
+        is_new[new_pos] = True
+        perm = np.empty(n + m, dtype=np.intp)
+        perm[~is_new] = np.arange(n)
+        perm[new_pos] = n + np.arange(m)
+        merged = pd.concat([self.df, new_rows], ignore_index=True).take(perm)
+        return ZipIndex(merged)
 
 
-def listings_by_zip(df: pd.DataFrame, zip_code: int) -> pd.DataFrame:
-    dff = df[df["ZIP OR POSTAL CODE"] == int(zip_code)].copy()
+def _zip_frame(df: pd.DataFrame, zip_code: int, zidx: ZipIndex | None = None) -> pd.DataFrame:
+    # el índice solo vale para el mismo frame sobre el que se construyó
+    if zidx is not None and zidx.df is df:
+        return zidx.frame(zip_code)
+    return df[df["ZIP OR POSTAL CODE"] == int(zip_code)]
+
+
+def listings_by_zip(df: pd.DataFrame, zip_code: int, zidx: ZipIndex | None = None) -> pd.DataFrame:
+    dff = _zip_frame(df, zip_code, zidx).copy()
     keep = [c for c in ["ADDRESS","ZIP OR POSTAL CODE","PROPERTY TYPE","BEDS","BATHS",
-                        "SQUARE FEET","LOT SIZE","YEAR BUILT","PRICE","LATITUDE","LONGITUDE"] if c in dff.columns]
+                        "SQUARE FEET","LOT SIZE","YEAR BUILT","PRICE","LATITUDE","LONGITUDE",
+                        *VALUATION_COLS] if c in dff.columns]
     return dff[keep].sort_values("PRICE").reset_index(drop=True)
 
 
-def suggest_zips_by_filter(df: pd.DataFrame, price_range, beds_min, topn=12):
-    dff = filter_inventory_zip_price_beds(df, price_range, beds_min)
-    if dff.empty or "ZIP OR POSTAL CODE" not in dff.columns:
+def suggest_zips_by_filter(df: pd.DataFrame, price_range, beds_min, topn=12, fidx: FilterIndex | None = None):
+    if "ZIP OR POSTAL CODE" not in df.columns:
         return []
-    vc = dff["ZIP OR POSTAL CODE"].value_counts().head(topn).index.astype(int).tolist()
+    if fidx is not None and fidx.df is df:
+        # solo hace falta la columna ZIP de las filas seleccionadas
+        zips = pd.Series(df["ZIP OR POSTAL CODE"].to_numpy()[fidx.select(price_range, beds_min)])
+    else:
+        zips = filter_inventory_zip_price_beds(df, price_range, beds_min)["ZIP OR POSTAL CODE"]
+    if zips.empty:
+        return []
+    vc = zips.value_counts().head(topn).index.astype(int).tolist()
     return vc
 
 
-def comps_similares(df: pd.DataFrame, zip_code: int, beds: float, baths: float, sqft: float, topn=20):
+def comps_similares(df: pd.DataFrame, zip_code: int, beds: float, baths: float, sqft: float, topn=20,
+                    zidx: ZipIndex | None = None):
     if "ZIP OR POSTAL CODE" not in df:
         return pd.DataFrame()
-    d = df[df["ZIP OR POSTAL CODE"] == int(zip_code)].dropna(subset=["BEDS","BATHS","SQUARE FEET"])
+    d = _zip_frame(df, zip_code, zidx).dropna(subset=["BEDS","BATHS","SQUARE FEET"])
     if d.empty:
         return pd.DataFrame()
   
@@ -106,9 +537,58 @@ def comps_similares(df: pd.DataFrame, zip_code: int, beds: float, baths: float,
     return d[keep].reset_index(drop=True)
 
 
-def market_snapshot(df: pd.DataFrame, zip_code: int) -> dict:
+def comps_batch(df: pd.DataFrame, subjects: pd.DataFrame, topn=20, zidx: ZipIndex | None = None,
+                max_cells: int = 2_000_000) -> pd.DataFrame:
+    """
+    comps_similares para muchas viviendas a la vez (cartera, inventario completo...).
+    subjects: frame con ZIP OR POSTAL CODE, BEDS, BATHS, SQUARE FEET.
+    Se agrupan por ZIP y para cada grupo se calcula la matriz de distancias (sujetos x ZIP)
+    de una vez, con argpartition para quedarse con los topn (en trozos de max_cells celdas).
+    Devuelve formato largo: SUBJECT (índice del sujeto), RANK, DIST y las columnas de comps_similares.
+    Con empates justo en la posición topn puede elegirse otro comparable a la misma distancia.
+    """
+    keep = [c for c in ["ADDRESS","ZIP OR POSTAL CODE","PROPERTY TYPE","BEDS","BATHS","SQUARE FEET","PRICE","LATITUDE","LONGITUDE","YEAR BUILT"] if c in df.columns]
+    out_cols = ["SUBJECT", "RANK", "DIST"] + keep
+    if "ZIP OR POSTAL CODE" not in df or subjects.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    w = np.array([1.0, 1.0, 1/800.0])
+    S = subjects[["BEDS","BATHS","SQUARE FEET"]].to_numpy(dtype=float)
+    S = np.nan_to_num(S)
+    z_sub = subjects["ZIP OR POSTAL CODE"].to_numpy().astype(int)
+    labels = subjects.index.to_numpy()
+
+    parts = []
+    for z in np.unique(z_sub):
+        sub = np.flatnonzero(z_sub == z)
+        d = _zip_frame(df, z, zidx).dropna(subset=["BEDS","BATHS","SQUARE FEET"])
+        if d.empty:
+            continue
+        B = d[["BEDS","BATHS","SQUARE FEET"]].to_numpy(dtype=float)
+        m = len(B)
+        k = min(topn, m)
+        step = max(1, max_cells // m)
+        for a in range(0, len(sub), step):
+            rows = sub[a:a + step]
+            D = (np.abs(S[rows, None, :] - B[None, :, :]) * w).sum(axis=2)
+            idx = np.argpartition(D, k - 1, axis=1)[:, :k] if k < m else np.broadcast_to(np.arange(m), D.shape)
+            Dk = np.take_along_axis(D, idx, axis=1)
+            o = np.argsort(Dk, axis=1, kind="stable")
+            idx = np.take_along_axis(idx, o, axis=1)
+            Dk = np.take_along_axis(Dk, o, axis=1)
+            part = d[keep].take(idx.ravel())
+            part.insert(0, "DIST", Dk.ravel())
+            part.insert(0, "RANK", np.tile(np.arange(1, k + 1), len(rows)))
+            part.insert(0, "SUBJECT", np.repeat(labels[rows], k))
+            parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=out_cols)
+    return pd.concat(parts, ignore_index=True)
+
+
+def market_snapshot(df: pd.DataFrame, zip_code: int, zidx: ZipIndex | None = None) -> dict:
     """Pequeño resumen de mercado para el ZIP"""
-    d = df[df["ZIP OR POSTAL CODE"] == int(zip_code)]
+    d = _zip_frame(df, zip_code, zidx)
     if d.empty:
         return {"count":0,"med_price":None,"med_sqft":None,"med_dom":None}
     snap = {
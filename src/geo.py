@@ -0,0 +1,86 @@
+# src/geo.py
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+
+EARTH_RADIUS_MI = 3958.8
+
+COMPS_COLS = ["ADDRESS","ZIP OR POSTAL CODE","PROPERTY TYPE","BEDS","BATHS","SQUARE FEET","PRICE",
+              "LATITUDE","LONGITUDE","YEAR BUILT"]
+
+
+class GeoIndex:
+    """
+    BallTree (haversine) sobre LATITUDE/LONGITUDE construido una vez para todo el dataset.
+    Las consultas cuestan O(log n) y no dependen del ZIP: una vivienda al otro lado
+    del límite del ZIP también es vecina. Con property_type se usa un árbol por tipo
+    (se crea al primer uso).
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        if not {"LATITUDE", "LONGITUDE"}.issubset(df.columns):
+            self._rows = np.empty(0, dtype=np.intp)
+            self._tree = None
+            self._by_type = {}
+            return
+        lat = df["LATITUDE"].to_numpy(dtype=float)
+        lon = df["LONGITUDE"].to_numpy(dtype=float)
+        self._rows = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+        self._rad = np.radians(np.column_stack([lat[self._rows], lon[self._rows]]))
+        self._tree = BallTree(self._rad, metric="haversine") if len(self._rows) else None
+        self._by_type = {}
+
+    def _tree_for(self, property_type):
+        if property_type is None:
+            return self._rows, self._tree
+        if property_type not in self._by_type:
+            ptypes = self.df["PROPERTY TYPE"].to_numpy()[self._rows]
+            sel = np.flatnonzero(ptypes == property_type)
+            tree = BallTree(self._rad[sel], metric="haversine") if len(sel) else None
+            self._by_type[property_type] = (self._rows[sel], tree)
+        return self._by_type[property_type]
+
+    def nearest(self, lat: float, lon: float, k: int = 20, radius_mi: float | None = None,
+                property_type: str | None = None):
+        """
+        Las k viviendas más cercanas a (lat, lon) dentro de radius_mi millas.
+        Devuelve (posiciones de fila en self.df, distancias en millas), ordenadas por distancia.
+        """
+        rows, tree = self._tree_for(property_type)
+        if tree is None or k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        dist, ind = tree.query(np.radians([[lat, lon]]), k=min(k, len(rows)))
+        dist_mi = dist[0] * EARTH_RADIUS_MI
+        pos = rows[ind[0]]
+        if radius_mi is not None:
+            ok = dist_mi <= radius_mi
+            pos, dist_mi = pos[ok], dist_mi[ok]
+        return pos, dist_mi
+
+
+def comps_radius(geo: GeoIndex, lat: float, lon: float, k: int = 20, radius_mi: float | None = 1.0,
+                 property_type: str | None = None) -> pd.DataFrame:
+    """k comparables más cercanos en un radio (millas), opcionalmente del mismo tipo, con DIST_MI."""
+    pos, dist = geo.nearest(lat, lon, k, radius_mi, property_type)
+    keep = [c for c in COMPS_COLS if c in geo.df.columns]
+    out = geo.df.iloc[pos][keep].reset_index(drop=True)
+    out["DIST_MI"] = dist
+    return out
+
+
+def comps_cercanos(geo: GeoIndex, lat: float, lon: float, beds: float, baths: float, sqft: float,
+                   topn: int = 20, radius_mi: float = 1.5, property_type: str | None = None,
+                   pool: int = 200) -> pd.DataFrame:
+    """
+    Como etl.comps_similares pero por cercanía real en vez de por ZIP: toma las `pool`
+    viviendas más cercanas dentro del radio y las ordena por la misma distancia L1
+    de beds/baths/sqft más 1 punto por milla.
+    """
+    d = comps_radius(geo, lat, lon, pool, radius_mi, property_type).dropna(subset=["BEDS","BATHS","SQUARE FEET"])
+    if d.empty:
+        return pd.DataFrame()
+    w_beds, w_baths, w_sqft, w_mi = 1.0, 1.0, 1/800.0, 1.0
+    dist = (w_beds*(d["BEDS"]-beds).abs() + w_baths*(d["BATHS"]-baths).abs()
+            + w_sqft*(d["SQUARE FEET"]-sqft).abs() + w_mi*d["DIST_MI"])
+    return d.assign(_dist=dist).sort_values("_dist", kind="stable").head(topn).drop(columns="_dist").reset_index(drop=True)
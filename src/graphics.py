@@ -240,6 +240,92 @@ def comps_map(df: pd.DataFrame, title: str = "Comparables cercanos") -> go.Figur
 
 
 
+def tile_map(
+    pyramid,
+    bbox=None,
+    zoom: float | None = None,
+    rows=None,
+    budget: int = 2000,
+    title: str = "Densidad de ventas",
+    key=None,
+) -> go.Figure:
+    # pinta el nivel de la pirámide (tiles.TilePyramid) que cabe en el viewport:
+    # celdas con tamaño según nº de ventas o, con zoom suficiente, viviendas sueltas
+    # key: banda de filtros de rows con niveles precalculados (ver TilePyramid.view)
+    zoom = 10 if zoom is None else zoom   # mismo zoom inicial que zip_map
+    cells, level = pyramid.view(bbox, zoom, budget, rows, key)
+    if cells.empty:
+        return go.Figure(layout=go.Layout(title=title))
+
+    warm_scale = ["#f7efe7", "#e8c9a9", "#d39b73", "#b56b45", "#7b3f27"]
+    count = cells["COUNT"].to_numpy(dtype=float)
+    if level is None:
+        size = 9
+        hover = (
+            "%{text}<br>"
+            "precio: $%{customdata[2]:,.0f}<br>"
+            "$/ft²: %{customdata[3]:,.0f}"
+            "<extra></extra>"
+        )
+        text = cells["ADDRESS"] if "ADDRESS" in cells else None
+    else:
+        size = 6 + 28 * (count / count.max()) ** 0.5
+        hover = (
+            "zip %{customdata[0]}<br>"
+            "nº viviendas: %{customdata[1]}<br>"
+            "mediana precio: $%{customdata[2]:,.0f}<br>"
+            "mediana $/ft²: %{customdata[3]:,.0f}"
+            "<extra></extra>"
+        )
+        text = None
+
+    fig = go.Figure(
+        go.Scattermapbox(
+            lat=cells["LAT"],
+            lon=cells["LON"],
+            mode="markers",
+            marker=dict(
+                size=size,
+                color=cells["MEDIAN_PRICE"],
+                colorscale=warm_scale,
+                opacity=0.85,
+                colorbar=dict(title=dict(text="Mediana precio ($)", font=dict(size=13)), tickprefix="$"),
+            ),
+            text=text,
+            customdata=cells[["ZIP", "COUNT", "MEDIAN_PRICE", "MEDIAN_PPSF"]].to_numpy(),
+            hovertemplate=hover,
+            showlegend=False,
+        )
+    )
+    fig.update_layout(
+        mapbox_style="carto-positron",
+        mapbox=dict(
+            center=dict(lat=float(cells["LAT"].median()), lon=float(cells["LON"].median())),
+            zoom=zoom,
+        ),
+        # conserva el encuadre del usuario al repintar con otro nivel
+        uirevision="tiles",
+        height=520,
+        margin=dict(l=0, r=0, t=60, b=0),
+        title=dict(
+            text=title,
+            font=dict(
+                size=20,
+                color=ACCENT,
+                family="Playfair Display, Georgia, serif",
+            ),
+            x=0.5,
+            xanchor="center",
+        ),
+        hoverlabel=dict(
+            bgcolor="rgba(17,24,39,0.92)",
+            font_size=11,
+            font_family="Times New Roman, Georgia, serif",
+        ),
+    )
+    return fig
+
+
 def price_hist(df: pd.DataFrame, title: str = "Distribución de precios") -> go.Figure:
 
     if df is None or df.empty:
@@ -340,6 +426,7 @@ def property_type_mix(
         .sort_values(ascending=False)
         * 100
     )
+    s = s[s > 0]  # con PROPERTY TYPE categórica value_counts incluye tipos sin filas
 
     warm_qualitative = ["#b56b45", "#7b3f27", "#e8c9a9", "#6e8898", "#cfa686"]
 
@@ -0,0 +1,155 @@
+# src/inference.py
+import os, queue, threading, time
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+
+from src.model import ModelBundle
+
+
+WINDOW_MS = 2.0     # espera máxima desde la primera petición del lote
+MAX_BATCH = 64      # filas por lote: al llegar a esto se manda sin esperar
+TIMEOUT = 1.0       # pasado esto la predicción se hace en el propio proceso
+
+_bundles = OrderedDict()   # en cada proceso del pool: firma -> ModelBundle
+_MAX_BUNDLES = 4
+
+
+def _run_batch(signature: tuple, kind: str, X: np.ndarray) -> np.ndarray:
+    """se ejecuta en el pool: carga (una vez) justo la versión de la firma y predice el lote"""
+    b = _bundles.get(signature)
+    if b is None:
+        b = _bundles[signature] = ModelBundle.from_signature(signature)
+        while len(_bundles) > _MAX_BUNDLES:
+            _bundles.popitem(last=False)
+    if kind == "price":
+        return b.predict_price(X)
+    return b.predict_time(X)[0]
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    Pool pequeño de procesos con los modelos y micro-batching delante.
+    Las predicciones de una vivienda que llegan de varios hilos a la vez se juntan durante
+    window_ms (o hasta max_batch filas) y van al pool como un solo predict(); cada lote
+    lleva la firma del bundle que lo pidió, así un lote nunca mezcla versiones.
+    El pool y el hilo que reparte se crean la primera vez que se usan en cada proceso
+    (seguro con preload); mientras arranca, predict() devuelve None y se predice en local.
+    """
+    def __init__(self, workers: int = 2, window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH,
+                 timeout: float = TIMEOUT):
+        self.workers, self.window, self.max_batch, self.timeout = workers, window_ms / 1000.0, max_batch, timeout
+        self.ready = False
+        self.batches = self.rows = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "InferencePool | None":
+        """
+        INFERENCE_WORKERS (procesos del pool en cada proceso que lo use, es decir, por worker web;
+        sin definir o 0 -> sin pool), INFERENCE_WINDOW_MS e INFERENCE_MAX_BATCH
+        """
+        workers = int(os.environ.get("INFERENCE_WORKERS") or 0)
+        if workers <= 0:
+            return None
+        return cls(
+            workers,
+            window_ms=float(os.environ.get("INFERENCE_WINDOW_MS") or WINDOW_MS),
+            max_batch=int(os.environ.get("INFERENCE_MAX_BATCH") or MAX_BATCH),
+        )
+
+    def start(self):
+        """arranca el pool en este proceso (p.ej. justo tras el fork del worker)"""
+        self._ensure()
+
+    def _ensure(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.ready = False
+            # spawn: los procesos del pool no heredan hilos ni locks del worker web
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=mp.get_context("spawn"))
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._loop, args=(self._queue, self._pool), name="inference-batcher", daemon=True).start()
+            warm = [self._pool.submit(_warm) for _ in range(self.workers)]
+            threading.Thread(target=self._wait_ready, args=(warm,), daemon=True).start()
+
+    def _wait_ready(self, warm):
+        try:
+            for f in warm:
+                f.result()
+            self.ready = True
+        except Exception:
+            pass
+
+    def submit(self, kind: str, signature: tuple, row: np.ndarray) -> Future:
+        self._ensure()
+        fut = Future()
+        self._queue.put((kind, signature, row, fut))
+        return fut
+
+    def predict(self, kind: str, signature: tuple, row: np.ndarray):
+        """una fila ya alineada; None si el pool aún no está listo o no responde a tiempo"""
+        self._ensure()
+        if not self.ready:
+            return None
+        try:
+            return self.submit(kind, signature, row).result(self.timeout)
+        except Exception:
+            return None
+
+    def _loop(self, q, pool):
+        while True:
+            items = [q.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    items.append(q.get(timeout=left))
+                except queue.Empty:
+                    break
+            groups = {}
+            for kind, signature, row, fut in items:
+                groups.setdefault((kind, signature), []).append((row, fut))
+            for (kind, signature), group in groups.items():
+                self._dispatch(pool, kind, signature, group)
+
+    def _dispatch(self, pool, kind, signature, group):
+        futs = [f for _, f in group]
+        self.batches += 1
+        self.rows += len(group)
+        try:
+            job = pool.submit(_run_batch, signature, kind, np.vstack([r for r, _ in group]))
+        except Exception as e:   # pool roto o cerrado
+            for f in futs:
+                f.set_exception(e)
+            return
+
+        def done(job):
+            try:
+                out = job.result()
+            except Exception as e:
+                for f in futs:
+                    f.set_exception(e)
+                return
+            for f, v in zip(futs, out.tolist()):
+                f.set_result(v)
+        job.add_done_callback(done)
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "workers": self.workers, "batches": self.batches, "rows": self.rows,
+                "mean_batch": self.rows / self.batches if self.batches else 0.0}
+
+    def shutdown(self):
+        if self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pid, self.ready = None, False
@@ -0,0 +1,102 @@
+# src/knn_index.py
+import joblib
+import numpy as np
+
+from sklearn.neighbors import KDTree
+
+
+class KnnTimeIndex:
+    """
+    KNN del tiempo de venta ya "compilado": los vectores de entrenamiento escalados dentro
+    de un KDTree (API pública de sklearn) y el StandardScaler fundido en un z = x * w + b por
+    columna (w = 1/scale, b = -mean/scale). Se construye al entrenar con la matriz y las
+    etiquetas de entrenamiento (from_training), sin leer atributos privados del KNN.
+    La matriz va en float64: el KDTree público solo trabaja con float64 y una copia float32
+    aparte sumaría memoria en vez de ahorrarla. Se guarda una sola vez (la del árbol).
+    predict/predict_proba siguen las reglas de KNeighborsClassifier (pesos uniform o
+    1/distancia, distancia 0 -> solo cuentan los vecinos idénticos, empate -> clase menor).
+    """
+    def __init__(self, X, y, classes, n_neighbors: int = 5, weights: str = "uniform",
+                 w=None, b=None, leaf_size: int = 30, tree=None):
+        if weights not in ("uniform", "distance"):
+            raise ValueError(f"weights='{weights}' no soportado")
+        self.tree = tree if tree is not None else KDTree(np.asarray(X, dtype=float), leaf_size=leaf_size)
+        self.X = np.asarray(self.tree.get_arrays()[0])   # la copia float64 del árbol, no otra
+        self.y = np.asarray(y, dtype=np.int8)            # índice en classes
+        self.classes_ = np.asarray(classes)
+        self.k = min(int(n_neighbors), len(self.X))
+        self.weights = weights
+        d = self.X.shape[1]
+        self.w = np.ones(d) if w is None else np.asarray(w, dtype=float)
+        self.b = np.zeros(d) if b is None else np.asarray(b, dtype=float)
+
+    @classmethod
+    def from_training(cls, X, y, knn, scaler=None) -> "KnnTimeIndex":
+        """
+        X, y: lo que recibió knn.fit (X ya escalado); knn: el KNeighborsClassifier entrenado,
+        del que solo se usan sus parámetros y classes_; scaler: su StandardScaler, si lo hay.
+        """
+        params = knn.get_params()
+        if params["metric"] not in ("minkowski", "euclidean") or (params["metric"] == "minkowski" and params["p"] != 2):
+            raise ValueError(f"métrica {params['metric']} no soportada")
+        classes = np.asarray(knn.classes_)
+        w = b = None
+        if scaler is not None:
+            # con with_mean=False el escalador guarda mean_ igualmente pero no lo resta
+            d = np.shape(X)[1]
+            w = 1.0 / scaler.scale_ if getattr(scaler, "with_std", True) and scaler.scale_ is not None else np.ones(d)
+            b = -(scaler.mean_ if getattr(scaler, "with_mean", True) and scaler.mean_ is not None else np.zeros(d)) * w
+        return cls(X, np.searchsorted(classes, np.asarray(y)), classes, params["n_neighbors"], params["weights"], w, b,
+                   leaf_size=params["leaf_size"])
+
+    @property
+    def n_features(self) -> int:
+        return self.X.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """memoria de la matriz, etiquetas y árbol (el árbol comparte la matriz, no la copia)"""
+        return self.y.nbytes + sum(np.asarray(a).nbytes for a in self.tree.get_arrays())
+
+    # la matriz ya va dentro del árbol: se guarda una sola vez
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["X"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.X = np.asarray(self.tree.get_arrays()[0])
+
+    def save(self, path: str):
+        """joblib con rename atómico; se abre con mmap_mode="r" en load()"""
+        from src.model import _atomic_dump   # src.model importa este módulo
+        _atomic_dump(self, path)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> "KnnTimeIndex":
+        return joblib.load(path, mmap_mode="r" if mmap else None)
+
+    def _votes(self, X) -> np.ndarray:
+        Z = np.asarray(X, dtype=float) * self.w + self.b
+        dist, ind = self.tree.query(Z, k=self.k)
+        if self.weights == "uniform":
+            wts = np.ones(dist.shape)
+        else:
+            with np.errstate(divide="ignore"):
+                wts = 1.0 / dist
+            inf = np.isinf(wts)
+            exact = inf.any(axis=1)
+            wts[exact] = inf[exact]
+        votes = np.zeros((len(Z), len(self.classes_)))
+        rows = np.repeat(np.arange(len(Z)), self.k)
+        np.add.at(votes, (rows, self.y[ind].ravel()), wts.ravel())
+        return votes
+
+    def predict_proba(self, X) -> np.ndarray:
+        votes = self._votes(X)
+        total = votes.sum(axis=1, keepdims=True)
+        return votes / np.where(total != 0, total, 1.0)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self._votes(X), axis=1)]
@@ -0,0 +1,361 @@
+# src/market.py
+import io, os, logging, time, threading
+import numpy as np
+import pandas as pd
+
+from src.etl import (
+    CACHE_DIR, _cache_path, _fingerprint, _read_cache, _write_cache, load_data, clean_frame, compact_frame, widen_compact, deep_nbytes, dataset_bounds, zip_points, market_snapshot,
+    ZipIndex, FilterIndex,
+)
+from src.cube import ZipCube
+from src.geo import GeoIndex
+from src.rollups import MonthlyRollup
+from src.tiles import TilePyramid
+from src.valuations import VALUATION_COLS, valuate
+
+
+DELTA_DIR = "data/deltas"
+REJECTED_DIR = "rejected"   # dentro de delta_dir: trozos de deltas que no se han podido ingerir
+# un snapshot es un dict de 4 entradas (count y tres medianas): se cuenta por entrada, sin medirlo
+SNAPSHOT_BYTES = 320
+
+log = logging.getLogger(__name__)
+
+
+class MarketData:
+    """
+    Dataset de un mercado junto con sus estructuras derivadas (índice por ZIP,
+    filtros, cubo del mapa, índice geográfico, pirámide de celdas, series mensuales, puntos por ZIP,
+    límites y snapshots).
+    ingest() añade ventas nuevas y actualiza solo lo que toca a los ZIPs afectados;
+    los índices de filtros y geográfico, el cubo y la pirámide se reconstruyen la próxima vez que se piden.
+    Las valoraciones del modelo (VALUATION_COLS) se guardan como columnas de self.df; ver ensure_valuations.
+    """
+    def __init__(self, df: pd.DataFrame, ms=None):
+        self.zidx = ZipIndex(df)
+        self.df = self.zidx.df
+        self.ms = ms
+        self.delta_dir = None
+        self.zip_df = zip_points(self.df)
+        self.bounds = dataset_bounds(self.df)
+        self._fidx = None
+        self._cube = None
+        self._geo = None
+        self._tiles = None
+        self._rollup = None
+        self._snapshots = {}
+        self._delta_offsets = {}    # ruta -> (bytes ya ingeridos, cabecera)
+        self._delta_lock = threading.Lock()   # dos callbacks no leen a la vez la misma cola
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._val_gen = None        # generación de modelos con la que se calcularon las valoraciones (valuation_generation)
+        self._sizes = {}            # pieza -> (id del objeto medido, bytes): ver memory_bytes
+        self._val_thread = None
+        self._measure(df=self.df, zidx=self.zidx, zip_df=self.zip_df)
+
+    @classmethod
+    def load(cls, path: str = "data/sold_data.csv", cache_dir: str | None = CACHE_DIR,
+             delta_dir: str | None = DELTA_DIR, compact: bool = False,
+             shared_dir: str | None = None) -> "MarketData":
+        """
+        shared_dir: el frame ya ordenado por ZIP se guarda ahí una vez (mismo formato que la caché)
+        y cada proceso lo abre con mmap de solo lectura, así todos los workers comparten las
+        mismas páginas en vez de tener su propia copia.
+        """
+        if shared_dir:
+            df = cls._attach_shared(path, cache_dir, compact, shared_dir)
+        else:
+            df = load_data(path, cache_dir, compact=compact)
+        mk = cls(df)
+        mk.delta_dir = delta_dir
+        if delta_dir:
+            mk.ingest_deltas(delta_dir)
+        return mk
+
+    @staticmethod
+    def _attach_shared(path, cache_dir, compact, shared_dir) -> pd.DataFrame:
+        cdir = _cache_path(path, shared_dir) + ("-compact" if compact else "")
+        df = _read_cache(cdir, path, mmap=True)
+        if df is None:
+            fingerprint = _fingerprint(path)
+            built = ZipIndex(load_data(path, cache_dir, compact=compact)).df
+            _write_cache(built, cdir, fingerprint)
+            df = _read_cache(cdir, path, mmap=True)
+            if df is None:  # directorio no escribible: se sigue con la copia en memoria
+                df = built
+        return df
+
+    # ---------------- estructuras perezosas ----------------
+
+    @property
+    def fidx(self) -> FilterIndex:
+        if self._fidx is None or self._fidx.df is not self.df:
+            self._fidx = self._measure(fidx=FilterIndex(self.df))
+        return self._fidx
+
+    @property
+    def cube(self) -> ZipCube:
+        if self._cube is None:
+            self._cube = self._measure(cube=ZipCube(self.df))
+        return self._cube
+
+    @property
+    def geo(self) -> GeoIndex:
+        if self._geo is None or self._geo.df is not self.df:
+            self._geo = self._measure(geo=GeoIndex(self.df))
+        return self._geo
+
+    @property
+    def tiles(self) -> TilePyramid:
+        if self._tiles is None or self._tiles.df is not self.df:
+            self._tiles = self._measure(tiles=TilePyramid(self.df))
+        return self._tiles
+
+    @property
+    def rollup(self) -> MonthlyRollup:
+        if self._rollup is None:
+            self._rollup = self._measure(rollup=MonthlyRollup(self.df))
+        return self._rollup
+
+    def _measure(self, **parts):
+        """
+        Mide cada pieza una vez, cuando se crea (carga, ingesta, valoraciones o estructura
+        construida), y devuelve la última. Las estructuras no cuentan el dataset que referencian.
+        """
+        obj = None
+        for key, obj in parts.items():
+            n = int(obj.memory_usage(deep=True).sum()) if key == "df" else deep_nbytes(obj, skip=[self.df])
+            self._sizes[key] = (id(obj), n)
+        return obj
+
+    def memory_bytes(self) -> int:
+        """
+        Memoria estimada del mercado: dataset (con las columnas de valoración), índices y
+        estructuras ya construidos, snapshots y modelos cargados. No mide nada: suma lo medido
+        por _measure de las piezas que siguen en uso, así que es barato en cada get() del registro.
+        """
+        live = {"df": self.df, "zidx": self.zidx, "zip_df": self.zip_df, "fidx": self._fidx, "cube": self._cube,
+                "geo": self._geo, "tiles": self._tiles, "rollup": self._rollup}
+        n = sum(b for key, (i, b) in list(self._sizes.items()) if live.get(key) is not None and id(live[key]) == i)
+        n += len(self._snapshots) * SNAPSHOT_BYTES
+        return n + (self.ms.memory_bytes() if self.ms is not None else 0)
+
+    def zip_center(self, zip_code):
+        """(lat, lon) mediana del ZIP o None"""
+        row = self.zip_df[self.zip_df["ZIP"] == int(zip_code)]
+        return None if row.empty else (float(row["LAT"].iloc[0]), float(row["LON"].iloc[0]))
+
+    @property
+    def postal_list(self) -> list:
+        return self.zidx.zips.tolist()
+
+    @property
+    def type_list(self) -> list:
+        return sorted(self.df["PROPERTY TYPE"].dropna().unique().tolist()) if "PROPERTY TYPE" in self.df else []
+
+    def snapshot(self, zip_code: int) -> dict:
+        z = int(zip_code)
+        if z not in self._snapshots:
+            self._snapshots[z] = market_snapshot(self.df, z, self.zidx)
+        return self._snapshots[z]
+
+    # ---------------- ingesta incremental ----------------
+
+    def ingest(self, new_rows: pd.DataFrame) -> list:
+        """Añade filas nuevas (formato del CSV de Redfin). Devuelve los ZIPs afectados."""
+        new_rows = clean_frame(new_rows.copy())
+        if new_rows.empty:
+            return []
+        with self._lock:
+            zidx = self.zidx
+            if self.df.attrs.get("compact"):
+                new_rows = compact_frame(new_rows, like=self.df)
+                # categorías nuevas o nulos en columnas int32: se ensancha una copia, no el df en uso
+                base = widen_compact(self.df, new_rows)
+                if base is not self.df:
+                    zidx = ZipIndex(base)
+            zidx = zidx.extend(new_rows)
+            df = zidx.df
+            touched = sorted(new_rows["ZIP OR POSTAL CODE"].unique().tolist())
+
+            # puntos del mapa: solo se regeneran las filas de los ZIPs tocados
+            frames = [zidx.frame(z) for z in touched]
+            fresh = zip_points(pd.concat(frames)) if frames else zip_points(new_rows.iloc[:0])
+            keep = self.zip_df[~self.zip_df["ZIP"].isin(touched)]
+            zip_df = (
+                pd.concat([keep, fresh], ignore_index=True)
+                .sort_values("COUNT", ascending=False, kind="stable")
+                .reset_index(drop=True)
+            )
+
+            # límites: se combinan con los de las filas nuevas
+            nb = dataset_bounds(new_rows)
+            bounds = dict(self.bounds)
+            for k, v in nb.items():
+                if v is None:
+                    continue
+                old = bounds.get(k)
+                bounds[k] = v if old is None else (min(old, v) if k.endswith("_min") else max(old, v))
+
+            if self.ms is not None:
+                self.ms.ingest(new_rows, df, zidx)
+            if self._rollup is not None:
+                self._rollup.update(new_rows, df, zidx)
+
+            # las filas nuevas llegan sin valoración (NaN); si alguna predicción sale de las
+            # medianas por ZIP, las de los ZIPs tocados también se recalculan
+            if self._val_gen is not None and "MODEL TIME" in df and self.ms is not None \
+                    and not (self.ms.has_price and self.ms.has_time):
+                col = df["MODEL TIME"].to_numpy(dtype=float, copy=True)
+                for z in touched:
+                    col[zidx.rows(z)] = np.nan
+                df["MODEL TIME"] = col
+
+            self.zidx, self.df = zidx, df
+            self.zip_df, self.bounds = zip_df, bounds
+            self._fidx, self._cube, self._geo, self._tiles = None, None, None, None
+            for z in touched:
+                self._snapshots.pop(int(z), None)
+        # fuera del lock: el dataset nuevo se mide una vez (la serie mensual crece en su sitio)
+        self._measure(df=df, zidx=zidx, zip_df=zip_df)
+        if self._rollup is not None:
+            self._measure(rollup=self._rollup)
+        if self._val_gen is not None:
+            self.ensure_valuations()
+        return touched
+
+    # ---------------- valoraciones precalculadas ----------------
+
+    @property
+    def valuation_generation(self) -> int | None:
+        """generación de los modelos (ModelService.bundle.generation) de las columnas VALUATION_COLS"""
+        return self._val_gen
+
+    def valuations_ready(self) -> bool:
+        """VALUATION_COLS de self.df al día con los modelos cargados y sin filas pendientes"""
+        ms = self.ms
+        return (
+            ms is not None and self._val_gen == ms.bundle.generation
+            and all(c in self.df for c in VALUATION_COLS) and not self.df["MODEL TIME"].isna().any()
+        )
+
+    def ensure_valuations(self, wait: bool = False) -> bool:
+        """
+        Si hace falta, calcula en un hilo las valoraciones del modelo de todas las viviendas
+        (al cargar o cambiar los modelos) o solo de las que faltan (filas ingeridas).
+        No hace nada hasta que los modelos están listos. Devuelve True si ya estaban al día.
+        """
+        if self.ms is None or not self.ms.ready or self.valuations_ready():
+            return self.ms is not None and self.ms.ready
+        with self._lock:
+            if self._val_thread is None or not self._val_thread.is_alive():
+                self._val_thread = threading.Thread(target=self._valuate, name="valuations", daemon=True)
+                self._val_thread.start()
+            t = self._val_thread
+        if wait:
+            t.join()
+            return self.valuations_ready()
+        return False
+
+    def _valuate(self):
+        # se calcula fuera del lock (las ingestas y los callbacks no esperan a la valoración);
+        # el lock solo se toma para ver qué falta y para pegar las columnas. Si entretanto df
+        # ha cambiado (ingesta) o hay modelos nuevos, el resultado se tira y se vuelve a empezar
+        while True:
+            with self._lock:
+                df, gen = self.df, self.ms.bundle.generation
+                full = self._val_gen != gen or not all(c in df for c in VALUATION_COLS)
+                rows = None if full else np.flatnonzero(df["MODEL TIME"].isna().to_numpy())
+            v = valuate(df, self.ms, rows)
+            with self._lock:
+                if self.df is not df or self.ms.bundle.generation != gen:
+                    continue
+                for c in VALUATION_COLS:
+                    col = np.full(len(df), np.nan) if full else df[c].to_numpy(dtype=float, copy=True)
+                    col[v.index.to_numpy()] = v[c].to_numpy()
+                    df[c] = col
+                self._val_gen = gen
+            self._measure(df=df)   # columnas de valoración nuevas: el dataset ha crecido
+            return
+
+    def ingest_deltas(self, delta_dir: str = DELTA_DIR) -> list:
+        """
+        Ingiere lo nuevo de los CSV de delta_dir: de cada fichero se recuerda hasta qué byte se
+        ha leído, así un fichero al que se añaden filas (o que aún se está copiando) solo aporta
+        su cola y nunca duplica filas.
+        Un trozo que no se puede leer o ingerir se avisa en el log, se copia a delta_dir/rejected/
+        y se salta: un fichero malo no tumba los callbacks que llaman a maybe_refresh.
+        """
+        if not os.path.isdir(delta_dir):
+            return []
+        touched = set()
+        with self._delta_lock:
+            for name in sorted(os.listdir(delta_dir)):
+                if not name.endswith(".csv"):
+                    continue
+                path = os.path.join(delta_dir, name)
+                try:
+                    data, state = self._read_delta_tail(path)
+                except OSError as e:   # borrado o sin permisos entre listdir y open: próxima pasada
+                    log.warning("delta %s no se puede leer: %s", path, e)
+                    continue
+                if data is None:
+                    self._delta_offsets[path] = state
+                    continue
+                try:
+                    touched.update(self.ingest(pd.read_csv(io.BytesIO(data))))
+                except Exception:
+                    log.exception("delta %s: bytes hasta %d descartados", path, state[0])
+                    self._reject(delta_dir, name, state[0], data)
+                # el desplazamiento avanza también si falla: el trozo malo no se reintenta en cada pasada
+                self._delta_offsets[path] = state
+        return sorted(touched)
+
+    @staticmethod
+    def _reject(delta_dir: str, name: str, end: int, data: bytes):
+        try:
+            out = os.path.join(delta_dir, REJECTED_DIR)
+            os.makedirs(out, exist_ok=True)
+            with open(os.path.join(out, f"{name[:-4]}.{end}.csv"), "wb") as f:
+                f.write(data)
+        except OSError as e:
+            log.warning("no se pudo apartar el trozo de %s: %s", name, e)
+
+    def _read_delta_tail(self, path: str) -> tuple:
+        """
+        Filas de path a partir del último byte ingerido, solo hasta el último salto de línea:
+        una fila cuenta cuando termina en salto de línea (la última puede estar copiándose).
+        Si el fichero es más corto que lo ya leído (sustituido o truncado) se lee desde el principio.
+        Devuelve (cabecera + filas en bytes o None, estado de lectura a guardar tras ingerirlas).
+        """
+        offset, header = self._delta_offsets.get(path, (0, b""))
+        size = os.path.getsize(path)
+        if size < offset:
+            offset, header = 0, b""
+        if size == offset:
+            return None, (offset, header)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read(size - offset)
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return None, (offset, header)
+        chunk = chunk[:end]
+        if not header:
+            nl = chunk.find(b"\n") + 1
+            header, chunk = chunk[:nl], chunk[nl:]
+        return (header + chunk if chunk.strip() else None), (offset + end, header)
+
+    def maybe_refresh(self, delta_dir: str | None = None, every: float = 60.0) -> list:
+        """
+        Comprueba deltas como mucho una vez cada `every` segundos (llamar desde callbacks).
+        Sin delta_dir se usa el del load() de este mercado.
+        """
+        delta_dir = delta_dir or self.delta_dir
+        if not delta_dir:
+            return []
+        now = time.monotonic()
+        if now - self._last_poll < every:
+            return []
+        self._last_poll = now
+        return self.ingest_deltas(delta_dir)
@@ -0,0 +1,138 @@
+# src/markets.py
+import os, json, threading
+from collections import OrderedDict
+
+from src.etl import CACHE_DIR
+from src.market import MarketData, DELTA_DIR
+from src.model import ModelService, MODELS_DIR
+from src.inference import InferencePool
+
+
+MARKETS_FILE = "data/markets.json"
+DEFAULT_MARKETS = {
+    "texas": {"label": "Texas", "path": "data/sold_data.csv", "models_dir": MODELS_DIR, "delta_dir": DELTA_DIR},
+}
+
+
+def load_markets_config(path: str = MARKETS_FILE) -> dict:
+    """
+    Lee {nombre: {"label", "path", "models_dir", "delta_dir"}} de un JSON.
+    Sin fichero -> un único mercado con el dataset de siempre.
+    models_dir y delta_dir son opcionales (por defecto models/ y sin deltas).
+    """
+    if not os.path.exists(path):
+        return dict(DEFAULT_MARKETS)
+    with open(path) as f:
+        cfg = json.load(f)
+    if not cfg:
+        raise ValueError(f"{path} no define ningún mercado")
+    for name, c in cfg.items():
+        if "path" not in c:
+            raise ValueError(f"mercado '{name}' sin 'path' en {path}")
+    return cfg
+
+
+class MarketRegistry:
+    """
+    Mercados (MarketData + ModelService) cargados bajo demanda.
+    get() carga el mercado la primera vez y lo marca como el más reciente; si la suma
+    de lo cargado supera budget_mb se descartan los menos usados (nunca el que se acaba
+    de pedir). La memoria de cada mercado es MarketData.memory_bytes (dataset, índices,
+    estructuras y modelos): cada pieza se mide al crearse, fuera del lock del registro, y aquí
+    solo se suman; por eso el presupuesto se puede comprobar en cada get(), también para un
+    mercado ya cargado que ha crecido (valoraciones, ingestas).
+    """
+    def __init__(self, markets: dict, budget_mb: float | None = None, default: str | None = None,
+                 cache_dir: str | None = CACHE_DIR, compact: bool = False, shared_dir: str | None = None,
+                 inference: InferencePool | None = None):
+        self.markets = markets
+        self.default = default if default in markets else next(iter(markets))
+        self.budget = budget_mb * 2**20 if budget_mb else None
+        self.cache_dir, self.compact, self.shared_dir = cache_dir, compact, shared_dir
+        self.inference = inference   # un pool para todos los mercados: cada lote lleva su firma de modelos
+        self._loaded = OrderedDict()   # nombre -> MarketData, del menos al más reciente
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in markets}
+
+    @classmethod
+    def from_env(cls) -> "MarketRegistry":
+        """MARKETS_FILE, MARKET_BUDGET_MB, DEFAULT_MARKET, COMPACT_DATA, SHARED_DATA_DIR e INFERENCE_* (InferencePool.from_env)"""
+        budget = os.environ.get("MARKET_BUDGET_MB")
+        return cls(
+            load_markets_config(os.environ.get("MARKETS_FILE", MARKETS_FILE)),
+            budget_mb=float(budget) if budget else None,
+            default=os.environ.get("DEFAULT_MARKET"),
+            compact=os.environ.get("COMPACT_DATA") == "1",
+            shared_dir=os.environ.get("SHARED_DATA_DIR") or None,
+            inference=InferencePool.from_env(),
+        )
+
+    def get(self, name: str | None = None) -> MarketData:
+        name = name if name in self.markets else self.default
+        with self._lock:
+            mk = self._loaded.get(name)
+            if mk is not None:
+                self._loaded.move_to_end(name)
+                self._evict(keep=name)
+                return mk
+        # la carga va fuera del lock general: pedir otro mercado ya cargado no espera
+        with self._load_locks[name]:
+            with self._lock:
+                mk = self._loaded.get(name)
+            if mk is None:
+                mk = self._load(name)
+            with self._lock:
+                self._loaded[name] = mk
+                self._loaded.move_to_end(name)
+                self._evict(keep=name)
+        return mk
+
+    def _load(self, name: str) -> MarketData:
+        c = self.markets[name]
+        mk = MarketData.load(
+            c["path"], self.cache_dir, c.get("delta_dir"),
+            compact=self.compact, shared_dir=self.shared_dir,
+        )
+        mk.ms = ModelService(mk.df, c.get("models_dir", MODELS_DIR), background=True, batcher=self.inference)
+        # con cada versión de modelos se revalora el inventario (en un hilo, ver MarketData.ensure_valuations)
+        mk.ms.on_load.append(lambda bundle: mk.ensure_valuations())
+        return mk
+
+    def start_models(self):
+        """Arranca la carga de modelos de los mercados ya cargados (p.ej. justo tras el fork)."""
+        with self._lock:
+            loaded = list(self._loaded.values())
+        for mk in loaded:
+            mk.ms.start_loading()
+
+    def disable_inference(self):
+        """Quita el pool de inferencia (y de los ModelService ya creados): se predice en el propio proceso."""
+        with self._lock:
+            self.inference = None
+            loaded = list(self._loaded.values())
+        for mk in loaded:
+            mk.ms.batcher = None
+
+    def _evict(self, keep: str):
+        if self.budget is None:
+            return
+        while self.memory_bytes() > self.budget and len(self._loaded) > 1:
+            name = next(n for n in self._loaded if n != keep)
+            del self._loaded[name]
+
+    def memory_bytes(self) -> int:
+        return sum(mk.memory_bytes() for mk in self._loaded.values())
+
+    def loaded(self) -> list:
+        return list(self._loaded)
+
+    def peek(self, name: str) -> MarketData | None:
+        """el mercado si está cargado, sin cargarlo ni tocar el orden LRU (para /health)"""
+        with self._lock:
+            return self._loaded.get(name)
+
+    def label(self, name: str) -> str:
+        return self.markets.get(name, {}).get("label", name)
+
+    def options(self) -> list:
+        return [{"label": self.label(n), "value": n} for n in self.markets]
@@ -1,14 +1,33 @@
 
 # src/model.py
-import os, json, pickle
+import os, json, logging, pickle, time, threading, warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+import joblib
+import numpy as np
 import pandas as pd
 
+from src.etl import deep_nbytes
+from src.knn_index import KnnTimeIndex
+from src.registry import current_version, version_dir
+from src.time_lookup import TimeLookup
 
+
+MODELS_DIR  = "models"
 PRICE_MODEL = "models/price_xgb.pkl"
 TIME_MODEL  = "models/time_knn.pkl"
 COLS_PRICE  = "models/feature_cols_model1.json"
 COLS_TIME   = "models/feature_cols_model2.json"
 SCALER_TIME = "models/scaler_time.pkl"
+TIME_INDEX  = "models/time_index.joblib"
+PRICE_FOREST = "models/price_forest.joblib"
+TIME_LOOKUP = "models/time_lookup.joblib"
+# pickles con arrays numpy grandes de los que train_models guarda una copia .joblib para abrirla
+# con mmap (el KNN: matriz de entrenamiento y árbol). El bosque de precio son objetos Tree que
+# se copian al cargar igualmente (se sirve con price_forest) y el escalador es diminuto
+MMAP_COPIES = [TIME_MODEL]
+
+log = logging.getLogger(__name__)
 
 def _pickle_load(path: str):
 
@@ -16,42 +35,610 @@ def _pickle_load(path: str):
         return pickle.load(f)
 
 
+def _atomic_dump(obj, path: str):
+    """joblib.dump a un temporal y rename atómico: quien abre path ve el fichero viejo o el nuevo entero"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+def _load_optional(name: str, dirs: list, mmap: bool = True, sources=()):
+    """
+    Artefacto joblib opcional (índice, bosque aplanado, tabla...) del primer directorio de dirs
+    que lo tenga. None si no existe, es más viejo que alguno de sources (los ficheros de los que
+    sale) o no se puede abrir: esa parte sigue con el modelo original.
+    """
+    for d in dirs:
+        path = os.path.join(d, os.path.basename(name))
+        if not os.path.exists(path):
+            continue
+        newest = max((os.stat(p).st_mtime_ns for p in sources if os.path.exists(p)), default=0)
+        if os.stat(path).st_mtime_ns < newest:
+            return None
+        try:
+            return joblib.load(path, mmap_mode="r" if mmap else None)
+        except Exception:
+            return None
+    return None
+
+
+def _mmap_copy(path: str) -> str:
+    return os.path.splitext(path)[0] + ".joblib"
+
+
+def write_mmap_copies(out_dir: str):
+    """
+    Copias .joblib de MMAP_COPIES en out_dir. Las escribe train_models en la versión nueva antes
+    del manifest (quedan en él); al cargar nunca se escribe nada.
+    """
+    for name in MMAP_COPIES:
+        path = os.path.join(out_dir, os.path.basename(name))
+        if os.path.exists(path):
+            _atomic_dump(_pickle_load(path), _mmap_copy(path))
+
+
+def load_artifact(path: str, mmap: bool = True):
+    """
+    Carga un .pkl; si no existe devuelve None. Con mmap, si es de MMAP_COPIES y tiene al lado su
+    copia .joblib (no más vieja que el .pkl) se abre esa con mmap_mode="r": los arrays numpy del
+    modelo quedan en el page cache y todos los workers comparten esas páginas. Sin copia se lee
+    el .pkl; no se escribe nada (las versiones publicadas no se tocan).
+    """
+    if not os.path.exists(path):
+        return None
+    if mmap and os.path.basename(path) in {os.path.basename(n) for n in MMAP_COPIES}:
+        copy = _load_optional(_mmap_copy(path), [os.path.dirname(path)], mmap, sources=[path])
+        if copy is not None:
+            return copy
+    return _pickle_load(path)
+
+
+def _search_dirs(models_dir: str) -> list:
+    """
+    [(directorio, versión)] donde buscar los modelos: el del mercado y luego models/.
+    Si un directorio tiene CURRENT se mira solo en la versión publicada, nunca en los
+    ficheros sueltos de al lado: así no se mezclan versiones.
+    """
+    dirs = []
+    for d in dict.fromkeys([models_dir, MODELS_DIR]):
+        v = current_version(d)
+        dirs.append((version_dir(d, v) if v else d, v))
+    return dirs
+
+
+def _asset_path(models_dir: str, path: str, dirs: list | None = None) -> str:
+    # cada mercado puede traer sus modelos; lo que no esté se toma de models/
+    dirs = dirs if dirs is not None else _search_dirs(models_dir)
+    name = os.path.basename(path)
+    for d, _ in dirs:
+        p = os.path.join(d, name)
+        if os.path.exists(p):
+            return p
+    return os.path.join(dirs[-1][0], name)
+
+
+def artifacts_signature(models_dir: str = MODELS_DIR, dirs: list | None = None) -> tuple:
+    """(ruta, tamaño, mtime) de cada fichero de modelo: cambia si se sustituye alguno o si CURRENT apunta a otra versión"""
+    dirs = dirs if dirs is not None else _search_dirs(models_dir)
+    sig = []
+    for path in (PRICE_MODEL, TIME_MODEL, SCALER_TIME, COLS_PRICE, COLS_TIME):
+        p = _asset_path(models_dir, path, dirs)
+        try:
+            st = os.stat(p)
+            sig.append((p, st.st_size, st.st_mtime_ns))
+        except OSError:
+            sig.append((p, None, None))
+    return tuple(sig)
+
+
+def _as_array(v, n: int) -> np.ndarray:
+    if np.ndim(v) == 0 or isinstance(v, str):
+        return np.full(n, v, dtype=object if v is None or isinstance(v, str) else None)
+    return np.asarray(v)
+
+
+def _or0(v, n: int) -> np.ndarray:
+    """float(v or 0) por elemento: None y 0 -> 0.0, NaN se queda como NaN"""
+    a = _as_array(v, n)
+    if a.dtype == object:
+        return np.array([float(x or 0) for x in a], dtype=float)
+    return a.astype(float)
+
+
+class FeatureAligner:
+    """
+    Traduce un frame de build_features a la matriz de columnas del modelo sin DataFrames
+    intermedios. Se compila una vez por lista de columnas: qué columna del frame va a cada
+    posición y el vocabulario del one-hot de PROPERTY TYPE (columnas "property_type_<tipo>").
+    Las columnas que no vienen en el frame o no son numéricas quedan a 0.
+    """
+    PREFIX = "property_type_"
+
+    def __init__(self, target_cols: list):
+        self.cols = list(target_cols)
+        self.onehot = {c[len(self.PREFIX):]: j for j, c in enumerate(self.cols) if c.startswith(self.PREFIX)}
+        self.numeric = [(j, c) for j, c in enumerate(self.cols) if not c.startswith(self.PREFIX)]
+
+    def transform(self, feats: pd.DataFrame, out: np.ndarray | None = None) -> np.ndarray:
+        """Matriz (n filas, len(cols)) en el orden del modelo; out permite reutilizar un buffer."""
+        n = len(feats)
+        X = np.zeros((n, len(self.cols))) if out is None else out[:n]
+        if out is not None:
+            X.fill(0.0)
+        for j, c in self.numeric:
+            if c in feats.columns:
+                col = feats[c]
+                if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+                    X[:, j] = col.to_numpy(dtype=float)
+        if self.onehot and "PROPERTY TYPE" in feats.columns:
+            pt = feats["PROPERTY TYPE"].to_numpy(dtype=object)
+            for value, j in self.onehot.items():
+                X[:, j] = pt == value
+        return X
+
+    def transform_record(self, rec: dict, out: np.ndarray | None = None) -> np.ndarray:
+        """Una sola vivienda como dict (mismas claves que build_features): fila (1, len(cols))."""
+        X = np.zeros((1, len(self.cols))) if out is None else out
+        row = X[0]
+        for j, c in self.numeric:
+            v = rec.get(c, 0)
+            row[j] = v if isinstance(v, (int, float, np.number)) and not isinstance(v, bool) else 0.0
+        if self.onehot:
+            row[list(self.onehot.values())] = 0.0
+            j = self.onehot.get(rec.get("PROPERTY TYPE"))
+            if j is not None:
+                row[j] = 1.0
+        return X
+
+
+class PredictionCache:
+    """
+    LRU acotado (maxsize entradas) con caducidad opcional (ttl en segundos) para las
+    predicciones de una vivienda. Cuenta aciertos, fallos y expulsiones (por tamaño o por ttl).
+    """
+    def __init__(self, maxsize: int = 4096, ttl: float | None = None):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()   # clave -> (valor, instante)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """valor guardado o None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                self.evictions += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / total if total else 0.0}
+
+
+class FlatForest:
+    """
+    RandomForestRegressor aplanado: los nodos de todos los árboles en arrays contiguos
+    (feature, threshold, hijos, valor) y la raíz de cada árbol. predict() baja por todos
+    los árboles a la vez para todas las filas, sin joblib ni hilos.
+    Mismo resultado bit a bit que forest.predict con n_jobs=1: X en float32, umbral en
+    float32 redondeado hacia abajo (x <= t64 equivale a x <= t32 si x es float32), NaN
+    según missing_go_to_left y suma de los árboles en orden antes de dividir.
+    children[2*nodo + 1] es el hijo izquierdo y children[2*nodo] el derecho; las hojas
+    apuntan a sí mismas, así basta con iterar `depth` veces.
+    """
+    CHUNK = 4096   # filas por pasada: acota la matriz filas x árboles
+
+    def __init__(self, feature, threshold, children, value, missing_left, roots, depth: int):
+        self.feature, self.threshold, self.children = feature, threshold, children
+        self.value, self.missing_left = value, missing_left
+        self.roots, self.depth = roots, int(depth)
+
+    @classmethod
+    def from_sklearn(cls, forest) -> "FlatForest":
+        if type(forest).__name__ not in ("RandomForestRegressor", "ExtraTreesRegressor") or forest.n_outputs_ != 1:
+            raise ValueError(f"{type(forest).__name__} no se puede aplanar")
+        parts = {k: [] for k in ("feature", "threshold", "children", "value", "missing_left")}
+        roots, off = [], 0
+        for est in forest.estimators_:
+            t = est.tree_
+            idx = np.arange(t.node_count) + off
+            leaf = t.children_left == -1
+            thr = t.threshold.astype(np.float32)
+            thr = np.where(thr > t.threshold, np.nextafter(thr, np.float32(-np.inf)), thr)
+            parts["feature"].append(np.where(leaf, 0, t.feature))
+            parts["threshold"].append(thr)
+            parts["children"].append(np.column_stack([
+                np.where(leaf, idx, t.children_right + off), np.where(leaf, idx, t.children_left + off),
+            ]).ravel())
+            parts["value"].append(t.value[:, 0, 0])
+            parts["missing_left"].append(np.asarray(t.missing_go_to_left, dtype=bool))
+            roots.append(off)
+            off += t.node_count
+        cat = {k: np.concatenate(v) for k, v in parts.items()}
+        # hijos y raíces en intp: take() no tiene que convertir los índices en cada nivel
+        return cls(
+            cat["feature"].astype(np.int16 if forest.n_features_in_ < 2**15 else np.int32),
+            cat["threshold"].astype(np.float32), cat["children"].astype(np.intp),
+            cat["value"].astype(np.float64), cat["missing_left"],
+            np.array(roots, dtype=np.intp), max(e.tree_.max_depth for e in forest.estimators_),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(np.asarray(a).nbytes for a in (self.feature, self.threshold, self.children,
+                                                  self.value, self.missing_left, self.roots))
+
+    def save(self, path: str):
+        _atomic_dump(self, path)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> "FlatForest":
+        return joblib.load(path, mmap_mode="r" if mmap else None)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) > self.CHUNK:
+            return np.concatenate([self.predict(X[i:i + self.CHUNK]) for i in range(0, len(X), self.CHUNK)])
+        n, d = X.shape
+        flat = np.ascontiguousarray(X).ravel()
+        base = (np.arange(n, dtype=np.intp) * d)[:, None]
+        missing = bool(np.isnan(flat).any())
+        node = np.broadcast_to(self.roots, (n, len(self.roots)))
+        for _ in range(self.depth):
+            x = flat.take(base + self.feature.take(node))
+            go_left = x <= self.threshold.take(node)
+            if missing:
+                go_left |= np.isnan(x) & self.missing_left.take(node)
+            node = self.children.take(2 * node + go_left)
+        # cumsum acumula en orden (np.sum suma por parejas y podría cambiar el último bit)
+        return np.cumsum(self.value.take(node), axis=1)[:, -1] / len(self.roots)
+
+
+def load_price_forest(model_path: str, model, mmap: bool = True):
+    """
+    FlatForest guardado junto al modelo de precio (lo escribe train_models); si no existe o es
+    más viejo se aplana el modelo en memoria, sin escribir en la versión. None si el modelo no
+    es un bosque de sklearn.
+    """
+    if model is None:
+        return None
+    forest = _load_optional(PRICE_FOREST, [os.path.dirname(model_path)], mmap, sources=[model_path])
+    if forest is not None:
+        return forest
+    try:
+        return FlatForest.from_sklearn(model)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _column(feats, col: str, dtype=float) -> np.ndarray:
+    """columna de un frame o valor de un dict de build_record, siempre como array 1-D"""
+    return np.asarray(feats[col], dtype=dtype).reshape(-1)
+
+
+def _accepts_arrays(est, cols: list) -> bool:
+    """
+    True si al estimador se le puede pasar la matriz en el orden del json: no se entrenó con
+    nombres o sus columnas son justo esas. El estimador no se toca.
+    """
+    names = getattr(est, "feature_names_in_", None)
+    return names is None or list(names) == list(cols)
+
+
+@contextmanager
+def _unnamed_ok():
+    # los estimadores entrenados con DataFrame avisan al recibir un array; el orden de las
+    # columnas ya está comprobado por _accepts_arrays, así que se silencia solo ese aviso
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        yield
+
+
+class ModelBundle:
+    """
+    Modelos, columnas y alineadores de un directorio, cargados juntos. ModelService cambia
+    de bundle con una sola asignación, así una predicción nunca mezcla dos versiones.
+    Lo que falte se queda en None/[] y esa parte usa las medianas. ModelBundle() = sin modelos.
+    El KNN de tiempo se consulta a través de time_index (KnnTimeIndex) y un RandomForest de
+    precio a través de price_forest (FlatForest) cuando se pueden construir.
+    version: id de la versión publicada en CURRENT (src/registry.py) o None sin registro.
+    time_lookup: tabla precio -> tiempo por ZIP/tipo/dormitorios (TimeLookup) si se ha construido.
+    """
+    def __init__(self, price_model=None, time_model=None, scaler_time=None,
+                 price_cols: list | None = None, time_cols: list | None = None,
+                 signature: tuple = (), missing: list | None = None, time_index: KnnTimeIndex | None = None,
+                 price_forest: FlatForest | None = None, version: str | None = None,
+                 time_lookup: TimeLookup | None = None):
+        self.price_model, self.time_model, self.scaler_time = price_model, time_model, scaler_time
+        self.price_cols, self.time_cols = list(price_cols or []), list(time_cols or [])
+        self.signature, self.missing, self.version = signature, list(missing or []), version
+        self.generation = 0
+
+        self.has_price = self.price_model is not None and len(self.price_cols) > 0
+        self.has_time  = self.time_model  is not None and len(self.time_cols)  > 0
+
+        self.price_aligner = FeatureAligner(self.price_cols)
+        self.time_aligner  = FeatureAligner(self.time_cols)
+        # si algún estimador espera otras columnas por nombre se le sigue pasando un DataFrame
+        self.price_arrays = self.price_model is None or _accepts_arrays(self.price_model, self.price_cols)
+        # el bosque aplanado recibe arrays en el orden del json
+        self.price_forest = price_forest if self.has_price and self.price_arrays else None
+        self.time_arrays = all(
+            e is None or _accepts_arrays(e, self.time_cols) for e in (self.scaler_time, self.time_model)
+        )
+        # índice KDTree con el escalador fundido; si no cuadra con las columnas se usa el pickle
+        ok = time_index is not None and self.has_time and time_index.n_features == len(self.time_cols)
+        self.time_index = time_index if ok else None
+        self.time_lookup = time_lookup if self.has_time else None
+
+    @classmethod
+    def load(cls, models_dir: str = MODELS_DIR, mmap: bool = True) -> "ModelBundle":
+        # CURRENT se lee una sola vez y la firma se toma antes de leer los modelos:
+        # si algo cambia mientras tanto se verá en la próxima comprobación
+        dirs = _search_dirs(models_dir)
+        signature = artifacts_signature(models_dir, dirs)
+        return cls.from_signature(signature, mmap, version=next((v for _, v in dirs if v), None))
+
+    @classmethod
+    def from_signature(cls, signature: tuple, mmap: bool = True, version: str | None = None) -> "ModelBundle":
+        """
+        Carga justo los ficheros de una firma (artifacts_signature): otro proceso puede
+        abrir exactamente la misma versión que tiene ya cargada este.
+        """
+        paths = [p for p, _, _ in signature]
+        price, time_, scaler, cols_price, cols_time = paths
+        price_model, time_model, scaler_time = load_artifact(price, mmap), load_artifact(time_, mmap), load_artifact(scaler, mmap)
+        # índice y tabla de tiempo van junto al KNN (misma versión) y valen si no son más viejos que él
+        time_dir, time_sources = [os.path.dirname(time_)], [time_, scaler]
+        return cls(
+            price_model, time_model, scaler_time,
+            json.load(open(cols_price)) if os.path.exists(cols_price) else [],
+            json.load(open(cols_time)) if os.path.exists(cols_time) else [],
+            signature=signature,
+            missing=[p for p in paths if not os.path.exists(p)],
+            time_index=_load_optional(TIME_INDEX, time_dir, mmap, time_sources),
+            price_forest=load_price_forest(price, price_model, mmap),
+            version=version,
+            time_lookup=_load_optional(TIME_LOOKUP, time_dir, mmap, time_sources),
+        )
+
+    def predict_price(self, X: np.ndarray) -> np.ndarray:
+        """X ya alineado a price_cols (price_aligner); requiere has_price"""
+        if self.price_forest is not None:
+            return self.price_forest.predict(X)
+        if not self.price_arrays:
+            X = pd.DataFrame(X, columns=self.price_aligner.cols)
+        with _unnamed_ok():
+            return np.asarray(self.price_model.predict(X), dtype=float)
+
+    def predict_time(self, X: np.ndarray, proba: bool = False):
+        """
+        X ya alineado a time_cols y con su PRICE; requiere has_time.
+        Devuelve (categorías, probabilidades (n, 3) de 0/1/2 o None).
+        """
+        est = self.time_index
+        if est is None:
+            est = self.time_model
+            if not self.time_arrays:
+                X = pd.DataFrame(X, columns=self.time_aligner.cols)
+            if self.scaler_time is not None:
+                try:
+                    with _unnamed_ok():
+                        X = self.scaler_time.transform(X)
+                except Exception:
+                    pass
+        if not proba:
+            with _unnamed_ok():
+                return np.asarray(est.predict(X)).astype(int), None
+        # predict() es el argmax de predict_proba: una sola consulta al KNN para ambos
+        with _unnamed_ok():
+            p = est.predict_proba(X)
+        classes = np.asarray(est.classes_).astype(int)
+        probs = np.zeros((len(p), 3))
+        probs[:, classes] = p
+        return classes[np.argmax(p, axis=1)], probs
+
+
+# atributos del bundle activo que ModelService expone tal cual (ms.has_time, ms.price_cols...)
+_BUNDLE_ATTRS = {
+    "price_model", "time_model", "scaler_time", "price_cols", "time_cols",
+    "has_price", "has_time", "price_aligner", "time_aligner", "time_index", "price_forest", "time_lookup",
+}
+
+
 class ModelService:
     """
     Predicción de dos posibilidades según si hay datos de modelo:
     - Con modelo: usa los .pkl y columnas .json si estan presentes
     - Sin modelo: predicciones basadas en medianas y lógica
     El objetivo es que siempre pueda predecir algo razonable con lo que ponga el ususario
+    Las predicciones de una vivienda (dict de build_record) se guardan en self.cache; se vacía
+    al recargar los modelos (check_artifacts) y al ingerir ventas nuevas.
+    Con background=True los modelos se cargan en un hilo la primera vez que se usan en cada
+    proceso (seguro con preload: el hilo nace en el worker, no en el master) y mientras tanto
+    se predice con las medianas; status() dice en qué punto está.
+    Con batcher (InferencePool) las predicciones de una vivienda que no están en la caché
+    se mandan al pool, que las junta en lotes con las de otros hilos.
     """
-    def __init__(self, df: pd.DataFrame):
-        self.df = df.copy()
-        self._load_assets()
-
+    def __init__(self, df: pd.DataFrame, models_dir: str = MODELS_DIR,
+                 cache_size: int = 4096, cache_ttl: float | None = None,
+                 background: bool = False, mmap: bool = True, batcher=None):
+        # solo lectura: sin copia, para no duplicar el dataset por worker
+        self.df = df
+        self.models_dir = models_dir
+        self.background, self.mmap = background, mmap
+        self.batcher = batcher
+        self.on_load = []   # funciones f(bundle) que se llaman tras cada carga de modelos
+        self.cache = PredictionCache(cache_size, cache_ttl)
+        self._last_check = time.monotonic()
+        self._bundle = ModelBundle()
+        self._bundle_bytes = 0   # memoria de los modelos del bundle activo, medida al cargarlo
+        self._generation = 0
+        self._load_lock = threading.Lock()
+        self._loader_pid = None
+        self.ready = False
+        self._state, self._error, self._load_seconds = "pending", None, None
         if "ZIP OR POSTAL CODE" in self.df and "PRICE" in self.df:
             self.median_by_zip = self.df.groupby("ZIP OR POSTAL CODE")["PRICE"].median().to_dict()
         else:
             self.median_by_zip = {}
-        self.global_median = float(self.df["PRICE"].median()) if "PRICE" in self.df else 0.0
-        self.default_ptype = (
-            self.df["PROPERTY TYPE"].mode()[0]
-            if "PROPERTY TYPE" in self.df and not self.df["PROPERTY TYPE"].empty
-            else "Single Family Residential"
+        # precios ordenados y conteo por tipo: permiten actualizar la mediana global
+        # y el tipo por defecto al ingerir filas nuevas sin recorrer todo el dataset
+        self._sorted_prices = np.sort(self.df["PRICE"].dropna().to_numpy(dtype=float)) if "PRICE" in self.df else np.empty(0)
+        self._ptype_counts = (
+            {k: int(v) for k, v in self.df["PROPERTY TYPE"].value_counts().items() if v}
+            if "PROPERTY TYPE" in self.df else {}
         )
+        self.global_median = self._median_sorted() if "PRICE" in self.df else 0.0
+        self.default_ptype = self._mode_ptype()
+        self._zip_med = None
+        if not background:
+            self._load_bundle()
 
-    def _load_assets(self):
-        self.price_model = _pickle_load(PRICE_MODEL)
-        self.time_model  = _pickle_load(TIME_MODEL)
-        self.scaler_time = _pickle_load(SCALER_TIME)
+    def _median_sorted(self) -> float:
+        p = self._sorted_prices
+        if len(p) == 0:
+            return float("nan")
+        mid = len(p) // 2
+        return float(p[mid]) if len(p) % 2 else float((p[mid - 1] + p[mid]) / 2.0)
 
-        self.price_cols = json.load(open(COLS_PRICE)) if os.path.exists(COLS_PRICE) else []
-        self.time_cols  = json.load(open(COLS_TIME))  if os.path.exists(COLS_TIME)  else []
+    def _mode_ptype(self) -> str:
+        if not self._ptype_counts:
+            return "Single Family Residential"
+        # igual que Series.mode()[0]: máximo conteo y, si hay empate, el menor valor
+        top = max(self._ptype_counts.values())
+        return min(k for k, v in self._ptype_counts.items() if v == top)
 
-        self.has_price = self.price_model is not None and len(self.price_cols) > 0
-        self.has_time  = self.time_model  is not None and len(self.time_cols)  > 0
+    def ingest(self, new_rows: pd.DataFrame, df: pd.DataFrame, zidx=None):
+        """
+        Actualiza las medianas de respaldo con filas nuevas (ya limpias).
+        df es el dataset completo tras añadirlas; solo se recalculan los ZIPs tocados.
+        """
+        self.df = df
+        self._zip_med = None
+        self.cache.clear()   # las predicciones de respaldo dependen de las medianas
+        if "ZIP OR POSTAL CODE" in new_rows and "PRICE" in new_rows:
+            for z in new_rows["ZIP OR POSTAL CODE"].unique().tolist():
+                d = zidx.frame(z) if zidx is not None and zidx.df is df else df[df["ZIP OR POSTAL CODE"] == z]
+                self.median_by_zip[z] = d["PRICE"].median()
+        if "PRICE" in new_rows:
+            add = np.sort(new_rows["PRICE"].dropna().to_numpy(dtype=float))
+            pos = np.searchsorted(self._sorted_prices, add, "right")
+            self._sorted_prices = np.insert(self._sorted_prices, pos, add)
+            self.global_median = self._median_sorted()
+        if "PROPERTY TYPE" in new_rows:
+            for k, v in new_rows["PROPERTY TYPE"].value_counts().items():
+                if v:
+                    self._ptype_counts[k] = self._ptype_counts.get(k, 0) + int(v)
+            self.default_ptype = self._mode_ptype()
 
+    # ---------------- carga de modelos ----------------
 
-    def build_features(self, zip_code, beds, baths, sqft, lot, year, hoa, property_type, price_for_time=None):
-        return pd.DataFrame([{
+    @property
+    def bundle(self) -> ModelBundle:
+        if self.background and self._loader_pid != os.getpid():
+            self.start_loading()
+        return self._bundle
+
+    def __getattr__(self, name):
+        if name in _BUNDLE_ATTRS:
+            return getattr(self.bundle, name)
+        raise AttributeError(name)
+
+    def start_loading(self):
+        """Lanza la carga en segundo plano (una vez por proceso); se puede llamar tras el fork."""
+        with self._load_lock:
+            if self._loader_pid == os.getpid():
+                return
+            self._loader_pid = os.getpid()
+        threading.Thread(target=self._load_bundle, name="models-loader", daemon=True).start()
+
+    def _load_bundle(self):
+        self._state = "loading" if not self.ready else "reloading"
+        t = time.monotonic()
+        try:
+            bundle = ModelBundle.load(self.models_dir, self.mmap)
+        except Exception as e:   # los modelos que había (o las medianas) siguen sirviendo
+            self._state, self._error = "error", repr(e)
+            return
+        if bundle.has_time and bundle.time_lookup is None:
+            # la tabla se genera al entrenar (train_models); sin ella el tiempo se pide al KNN
+            log.warning("sin %s para %s: tiempo con el modelo", os.path.basename(TIME_LOOKUP), bundle.signature[1][0])
+        self._generation += 1
+        bundle.generation = self._generation
+        bundle_bytes = deep_nbytes([bundle.price_model, bundle.time_model, bundle.scaler_time, bundle.time_index,
+                                    bundle.price_forest, bundle.time_lookup])
+        self._bundle, self._bundle_bytes = bundle, bundle_bytes
+        self.cache.clear()
+        self.ready, self._state, self._error = True, "ready", None
+        self._load_seconds = time.monotonic() - t
+        for fn in self.on_load:
+            fn(bundle)
+
+    def memory_bytes(self) -> int:
+        """
+        modelos cargados (incluidos índices y tablas; se miden una vez, en el hilo que los carga)
+        y estructuras propias (arrays de precios y medianas, baratas de medir), sin el dataset
+        """
+        return self._bundle_bytes + deep_nbytes([self._sorted_prices, self.median_by_zip, self._zip_med], skip=[self.df])
+
+    def status(self) -> dict:
+        b = self._bundle
+        return {
+            "state": self._state, "ready": self.ready, "version": b.version, "has_price": b.has_price, "has_time": b.has_time,
+            "missing": b.missing, "load_seconds": self._load_seconds, "error": self._error,
+        }
+
+    def check_artifacts(self, every: float = 5.0) -> bool:
+        """
+        Como mucho cada `every` segundos mira si cambió algún fichero de models_dir
+        o si CURRENT apunta a otra versión;
+        si es así recarga los modelos (en segundo plano si background) y vacía la caché.
+        Devuelve True si lanzó la recarga. La comprobación y el paso a "reloading" van bajo
+        _load_lock: dos callbacks a la vez no lanzan dos recargas.
+        """
+        now = time.monotonic()
+        with self._load_lock:
+            if now - self._last_check < every or self._state in ("pending", "loading", "reloading"):
+                return False
+            self._last_check = now
+            if artifacts_signature(self.models_dir) == self._bundle.signature:
+                return False
+            self._state = "loading" if not self.ready else "reloading"
+        if self.background:
+            threading.Thread(target=self._load_bundle, name="models-reloader", daemon=True).start()
+        else:
+            self._load_bundle()
+        return True
+
+
+    def build_record(self, zip_code, beds, baths, sqft, lot, year, hoa, property_type, price_for_time=None) -> dict:
+        """Una vivienda como dict: es lo más barato para predecir de una en una (sin DataFrame)."""
+        return {
             "ZIP OR POSTAL CODE": int(zip_code) if zip_code is not None else 0,
             "BEDS": float(beds or 0),
             "BATHS": float(baths or 0),
@@ -62,52 +649,165 @@ class ModelService:
             "BED BATH RATIO": (float(beds or 0) / (float(baths) if baths else 1.0)),
             "PRICE": float(price_for_time or 0),
             "PROPERTY TYPE": (property_type or self.default_ptype)
-        }])
-
-    def _align(self, df_in, target_cols):
-        df_num = df_in.select_dtypes(include=["number"]).copy()
-        dummies = pd.get_dummies(df_in[["PROPERTY TYPE"]], prefix=["property_type"])
-        X = pd.concat([df_num, dummies], axis=1)
-        for c in target_cols:
-            if c not in X.columns:
-                X[c] = 0
-        return X[target_cols]
-
-
-    def predict_price(self, feats_df: pd.DataFrame) -> float:
-        if self.has_price:
-            X = self._align(feats_df, self.price_cols)
-            return float(self.price_model.predict(X)[0])
-
-        zip_code = int(feats_df.iloc[0]["ZIP OR POSTAL CODE"])
-        base = self.median_by_zip.get(zip_code, self.global_median) or self.global_median
-        sqft = float(feats_df.iloc[0]["SQUARE FEET"]); beds = float(feats_df.iloc[0]["BEDS"]); baths = float(feats_df.iloc[0]["BATHS"])
-
-        factor = 1.0
-        if sqft > 0:
-            factor *= min(1.3, max(0.7, (sqft / 1600.0) ** 0.15))
-        factor *= (1 + 0.02 * max(0, beds - 3))
-        factor *= (1 + 0.015 * max(0, baths - 2))
-        return float(base * factor)
-
-    def predict_time_category(self, feats_df: pd.DataFrame, price_value: float) -> int:
-        if self.has_time:
-            feats_df = feats_df.copy()
-            feats_df.loc[:, "PRICE"] = price_value
-            X = self._align(feats_df, self.time_cols)
-            if self.scaler_time is not None:
-                try:
-                    X = self.scaler_time.transform(X)
-                except Exception:
-                    pass
-            return int(self.time_model.predict(X)[0])
-
-        zip_code = int(feats_df.iloc[0]["ZIP OR POSTAL CODE"])
-        med = self.median_by_zip.get(zip_code, self.global_median) or self.global_median
-        ratio = (price_value / med) if med else 1.0
-        if ratio <= 0.95: return 0     
-        if ratio <= 1.10: return 1     
-        return 2                     
+        }
+
+    def build_features(self, zip_code, beds, baths, sqft, lot, year, hoa, property_type, price_for_time=None):
+        return pd.DataFrame([self.build_record(zip_code, beds, baths, sqft, lot, year, hoa, property_type, price_for_time)])
+
+    def build_features_batch(self, zip_code, beds, baths, sqft, lot, year, hoa, property_type, price_for_time=None):
+        """
+        Igual que build_features pero con arrays (o escalares, que se repiten): una fila por vivienda.
+        Mismas reglas por fila: None/0 -> 0, baños 0 -> ratio sobre 1, tipo vacío -> default_ptype.
+        """
+        n = max((len(v) for v in (zip_code, beds, baths, sqft, lot, year, hoa, property_type, price_for_time)
+                 if np.ndim(v) > 0 and not isinstance(v, str)), default=1)
+        zips = _as_array(zip_code, n)
+        if zips.dtype == object:
+            zips = np.array([int(z) if z is not None else 0 for z in zips], dtype=np.int64)
+        beds_, baths_ = _or0(beds, n), _or0(baths, n)
+        ptypes = _as_array(property_type, n)
+        return pd.DataFrame({
+            "ZIP OR POSTAL CODE": zips.astype(np.int64),
+            "BEDS": beds_,
+            "BATHS": baths_,
+            "SQUARE FEET": _or0(sqft, n),
+            "LOT SIZE": _or0(lot, n),
+            "YEAR BUILT": _or0(year, n),
+            "HOA/MONTH": _or0(hoa, n),
+            "BED BATH RATIO": beds_ / np.where(baths_ != 0, baths_, 1.0),
+            "PRICE": _or0(price_for_time, n),
+            "PROPERTY TYPE": np.array([p or self.default_ptype for p in ptypes], dtype=object),
+        })
+
+    @staticmethod
+    def _align(feats, aligner: FeatureAligner) -> np.ndarray:
+        """feats: frame de build_features(_batch) o dict de build_record"""
+        return aligner.transform_record(feats) if isinstance(feats, dict) else aligner.transform(feats)
+
+
+    def _zip_medians(self, zips) -> np.ndarray:
+        """
+        median_by_zip.get(zip, global_median) or global_median, vectorizado:
+        las claves ordenadas se guardan una vez y cada ZIP es un searchsorted.
+        """
+        if self._zip_med is None:
+            keys = np.array(sorted(self.median_by_zip), dtype=np.int64)
+            self._zip_med = (keys, np.array([self.median_by_zip[k] for k in keys], dtype=float))
+        keys, meds = self._zip_med
+        zips = np.asarray(zips, dtype=np.int64)
+        if len(keys) == 0:
+            return np.full(len(zips), self.global_median, dtype=float)
+        pos = np.minimum(np.searchsorted(keys, zips), len(keys) - 1)
+        out = np.where(keys[pos] == zips, meds[pos], self.global_median)
+        return np.where(out == 0, self.global_median, out)
+
+    def predict_price_batch(self, feats_df) -> np.ndarray:
+        """Precio para cada fila de feats_df (build_features_batch, o un dict de build_record) en una sola pasada."""
+        b = self.bundle
+        if b.has_price:
+            return b.predict_price(self._align(feats_df, b.price_aligner))
+
+        base = self._zip_medians(_column(feats_df, "ZIP OR POSTAL CODE", np.int64))
+        sqft = _column(feats_df, "SQUARE FEET")
+        beds = _column(feats_df, "BEDS")
+        baths = _column(feats_df, "BATHS")
+
+        # mismas operaciones y en el mismo orden que la versión por fila (max/min de Python con NaN incluidos);
+        # la potencia se hace con la de Python sobre las superficies distintas: el pow SIMD de numpy
+        # puede diferir en el último bit
+        factor = np.ones_like(sqft)
+        pos = sqft > 0
+        u, inv = np.unique(sqft[pos], return_inverse=True)
+        f = np.array([(x / 1600.0) ** 0.15 for x in u.tolist()], dtype=float)[inv]
+        f = np.where(f > 0.7, f, 0.7)
+        factor[pos] = np.where(f < 1.3, f, 1.3)
+        extra_beds, extra_baths = beds - 3, baths - 2
+        factor = factor * (1 + 0.02 * np.where(extra_beds > 0, extra_beds, 0))
+        factor = factor * (1 + 0.015 * np.where(extra_baths > 0, extra_baths, 0))
+        return base * factor
+
+    def predict_time_batch(self, feats_df, price_values) -> np.ndarray:
+        """Categoría de tiempo (0/1/2) para cada fila con su precio (escalar o array)."""
+        return self._predict_time(feats_df, price_values)[0]
+
+    def predict_time_curve(self, feats, prices, proba: bool = False):
+        """
+        Una vivienda (dict de build_record o frame de una fila) a muchos precios: la fila se
+        repite una vez por precio y va al escalador y al KNN en una sola llamada.
+        Devuelve las categorías o, con proba=True, (categorías, probabilidades (n, 3) de 0/1/2).
+        """
+        if not isinstance(feats, dict):
+            feats = feats.iloc[0].to_dict()
+        cats, probs = self._predict_time(feats, np.asarray(prices, dtype=float).reshape(-1), proba)
+        return (cats, probs) if proba else cats
+
+    def time_at_prices(self, feats: dict, prices) -> np.ndarray:
+        """
+        Categoría de tiempo de una vivienda (dict de build_record) a cada precio: búsqueda
+        binaria en el TimeLookup del bundle si su ZIP tiene celda; si no, predict_time_curve.
+        """
+        prices = np.asarray(prices, dtype=float).reshape(-1)
+        lookup = self.bundle.time_lookup
+        if lookup is not None:
+            cats = lookup.categories(feats.get("ZIP OR POSTAL CODE"), feats.get("PROPERTY TYPE"), feats.get("BEDS"), prices)
+            if cats is not None:
+                return cats
+        return np.asarray(self.predict_time_curve(feats, prices), dtype=int)
+
+    def _predict_time(self, feats, price_values, proba: bool = False):
+        prices = np.asarray(price_values, dtype=float)
+        # un dict se repite para cada precio; un frame lleva ya una fila por precio
+        n = max(prices.size, 1) if isinstance(feats, dict) else len(feats)
+        prices = np.broadcast_to(prices, (n,))
+        b = self.bundle
+        if b.has_time:
+            X = self._align(feats, b.time_aligner)
+            if len(X) != n:
+                X = np.repeat(X, n, axis=0)
+            if "PRICE" in b.time_aligner.cols:
+                X[:, b.time_aligner.cols.index("PRICE")] = prices
+            return b.predict_time(X, proba)
+
+        med = self._zip_medians(_column(feats, "ZIP OR POSTAL CODE", np.int64))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(med != 0, prices / np.where(med != 0, med, 1.0), 1.0)
+        cats = np.where(ratio <= 0.95, 0, np.where(ratio <= 1.10, 1, 2))
+        return cats, (np.eye(3)[cats] if proba else None)
+
+    def _pooled(self, kind: str, feats: dict, price: float | None = None):
+        """una vivienda por el InferencePool (si lo hay y hay modelo); None -> se predice aquí"""
+        b = self.bundle
+        if self.batcher is None or not (b.has_price if kind == "price" else b.has_time):
+            return None
+        aligner = b.price_aligner if kind == "price" else b.time_aligner
+        row = self._align(feats, aligner)[0]
+        if kind == "time" and "PRICE" in aligner.cols:
+            row[aligner.cols.index("PRICE")] = price
+        return self.batcher.predict(kind, b.signature, row)
+
+    def predict_price(self, feats_df) -> float:
+        # solo los dict de build_record pasan por la caché (sus valores ya vienen normalizados)
+        # la generación del bundle va en la clave: nada calculado con modelos viejos se reutiliza
+        key = ("price", self.bundle.generation, tuple(feats_df.values())) if isinstance(feats_df, dict) else None
+        value = self.cache.get(key) if key else None
+        if value is None:
+            value = self._pooled("price", feats_df) if key else None
+            value = float(value if value is not None else self.predict_price_batch(feats_df)[0])
+            if key:
+                self.cache.put(key, value)
+        return value
+
+    def predict_time_category(self, feats_df, price_value: float) -> int:
+        if not isinstance(feats_df, dict):
+            return int(self.predict_time_batch(feats_df.iloc[:1], price_value)[0])
+        # el PRICE del dict no cuenta: se sustituye por price_value
+        key = ("time", self.bundle.generation, tuple(v for k, v in feats_df.items() if k != "PRICE"), float(price_value))
+        value = self.cache.get(key)
+        if value is None:
+            value = self._pooled("time", feats_df, float(price_value))
+            value = int(value if value is not None else self.predict_time_batch(feats_df, price_value)[0])
+            self.cache.put(key, value)
+        return value
 
     @staticmethod
     def time_label(cat: int) -> str:
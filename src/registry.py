@@ -0,0 +1,99 @@
+# src/registry.py
+import os, json, time, hashlib
+
+
+VERSIONS_DIR = "versions"
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def version_dir(models_dir: str, version: str) -> str:
+    return os.path.join(models_dir, VERSIONS_DIR, version)
+
+
+def current_version(models_dir: str) -> str | None:
+    """id al que apunta models_dir/CURRENT, o None si no hay registro (o apunta a algo que no existe)"""
+    try:
+        with open(os.path.join(models_dir, CURRENT)) as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return version if version and os.path.isdir(version_dir(models_dir, version)) else None
+
+
+def new_version(models_dir: str) -> tuple:
+    """(id, directorio) de una versión nueva y vacía; el id es la fecha y hora de entrenamiento"""
+    base = time.strftime("%Y%m%d-%H%M%S")
+    version, i = base, 1
+    while True:
+        path = version_dir(models_dir, version)
+        try:
+            os.makedirs(path)
+            return version, path
+        except FileExistsError:
+            i += 1
+            version = f"{base}-{i}"
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_manifest(path: str, version: str, **info) -> dict:
+    """manifest.json con el id, la fecha, tamaño y sha256 de cada fichero y lo que se pase en info"""
+    files = {
+        name: {"size": os.path.getsize(os.path.join(path, name)), "sha256": _sha256(os.path.join(path, name))}
+        for name in sorted(os.listdir(path)) if name != MANIFEST and not name.endswith(".tmp")
+    }
+    manifest = {"id": version, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": files, **info}
+    tmp = os.path.join(path, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    return manifest
+
+
+def read_manifest(models_dir: str, version: str) -> dict | None:
+    try:
+        with open(os.path.join(version_dir(models_dir, version), MANIFEST)) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+
+def list_versions(models_dir: str) -> list:
+    """manifiestos de las versiones completas (con manifest.json), de la más vieja a la más nueva"""
+    root = os.path.join(models_dir, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    found = (read_manifest(models_dir, v) for v in sorted(os.listdir(root)))
+    return [m for m in found if m is not None]
+
+
+def publish(models_dir: str, version: str):
+    """
+    Apunta CURRENT a la versión con un rename atómico: quien lea CURRENT ve la versión
+    anterior o la nueva, nunca un fichero a medias. Solo se publican versiones con manifiesto.
+    """
+    if read_manifest(models_dir, version) is None:
+        raise ValueError(f"la versión '{version}' no existe o no tiene {MANIFEST}")
+    tmp = os.path.join(models_dir, f"{CURRENT}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(models_dir, CURRENT))
+
+
+if __name__ == "__main__":
+    # python -m src.registry [models_dir]            -> lista las versiones
+    # python -m src.registry models_dir <id>         -> publica <id> (p.ej. para volver atrás)
+    import sys
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else "models"
+    if len(sys.argv) > 2:
+        publish(models_dir, sys.argv[2])
+    current = current_version(models_dir)
+    for m in list_versions(models_dir):
+        print(("* " if m["id"] == current else "  ") + m["id"], m.get("created", ""), json.dumps(m.get("metrics", {})))
@@ -0,0 +1,97 @@
+# src/rollups.py
+import numpy as np
+import pandas as pd
+
+from src.etl import expand_dates
+
+
+ALL_TYPES = "*"
+ROLLUP_COLS = ["COUNT", "MEDIAN_PRICE", "MEDIAN_PPSF", "MEDIAN_DOM"]
+
+
+def _month_key(value) -> int:
+    p = pd.Period(value, freq="M")
+    return p.year * 12 + p.month - 1
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    d = expand_dates(df, ["SOLD DATE"])
+    sold = pd.to_datetime(d["SOLD DATE"], errors="coerce")
+    ok = sold.notna().to_numpy()
+    sold = sold[ok]
+    d = d[ok]
+    sqft = d["SQUARE FEET"].to_numpy(dtype=float)
+    price = d["PRICE"].to_numpy(dtype=float)
+    return pd.DataFrame({
+        "ZIP": d["ZIP OR POSTAL CODE"].to_numpy().astype(int),
+        "MONTH": (sold.dt.year * 12 + sold.dt.month - 1).to_numpy().astype(int),
+        "PTYPE": d["PROPERTY TYPE"].astype(object).to_numpy(),
+        "PRICE": price,
+        "PPSF": np.where(sqft > 0, price / np.where(sqft > 0, sqft, 1), np.nan),
+        "DOM": d["DAYS ON MARKET"].to_numpy(dtype=float) if "DAYS ON MARKET" in d else np.nan,
+    })
+
+
+def _aggregate(p: pd.DataFrame) -> pd.DataFrame:
+    # por tipo y además la fila "todos los tipos" (las medianas no se pueden combinar luego)
+    both = pd.concat([p, p.assign(PTYPE=ALL_TYPES)], ignore_index=True)
+    g = both.groupby(["ZIP", "PTYPE", "MONTH"], sort=True)
+    return pd.DataFrame({
+        "COUNT": g.size(),
+        "MEDIAN_PRICE": g["PRICE"].median(),
+        "MEDIAN_PPSF": g["PPSF"].median(),
+        "MEDIAN_DOM": g["DOM"].median(),
+    }).reset_index()
+
+
+class MonthlyRollup:
+    """
+    Tabla materializada (ZIP, mes, tipo) -> nº ventas, mediana de precio, de $/ft2 y de DOM.
+    Cada serie (ZIP, tipo) guarda arrays ordenados por mes, así "ZIP X de A a B" es un
+    searchsorted + slice. update() recalcula solo los (ZIP, mes) que traen las filas nuevas.
+    """
+    def __init__(self, df: pd.DataFrame | None = None):
+        self._series = {}   # (zip, ptype) -> {"MONTH": int array, "COUNT": ..., ...}
+        if df is not None and not df.empty:
+            self._splice(_aggregate(_prepare(df)))
+
+    def _splice(self, agg: pd.DataFrame):
+        for (z, t), g in agg.groupby(["ZIP", "PTYPE"], sort=False):
+            new = {c: g[c].to_numpy() for c in ["MONTH"] + ROLLUP_COLS}
+            old = self._series.get((int(z), t))
+            if old is not None:
+                keep = ~np.isin(old["MONTH"], new["MONTH"])
+                merged = {c: np.concatenate([old[c][keep], new[c]]) for c in new}
+                o = np.argsort(merged["MONTH"], kind="stable")
+                new = {c: v[o] for c, v in merged.items()}
+            self._series[(int(z), t)] = new
+
+    def update(self, new_rows: pd.DataFrame, df: pd.DataFrame, zidx=None):
+        """
+        new_rows: filas recién ingeridas; df: dataset completo ya con ellas.
+        Se recalculan los meses tocados de los ZIPs tocados con todas sus filas.
+        """
+        p_new = _prepare(new_rows)
+        if p_new.empty:
+            return
+        frames = []
+        for z, months in p_new.groupby("ZIP")["MONTH"].unique().items():
+            d = zidx.frame(z) if zidx is not None and zidx.df is df else df[df["ZIP OR POSTAL CODE"] == z]
+            p = _prepare(d)
+            frames.append(p[p["MONTH"].isin(months)])
+        self._splice(_aggregate(pd.concat(frames, ignore_index=True)))
+
+    def query(self, zip_code, start=None, end=None, property_type: str | None = None) -> pd.DataFrame:
+        """Serie mensual del ZIP entre start y end (incluidos, p.ej. "2024-05"); property_type=None -> todos."""
+        s = self._series.get((int(zip_code), property_type or ALL_TYPES))
+        if s is None:
+            return pd.DataFrame(columns=["MONTH"] + ROLLUP_COLS)
+        lo = int(np.searchsorted(s["MONTH"], _month_key(start), "left")) if start is not None else 0
+        hi = int(np.searchsorted(s["MONTH"], _month_key(end), "right")) if end is not None else len(s["MONTH"])
+        months = s["MONTH"][lo:hi]
+        out = pd.DataFrame({c: s[c][lo:hi] for c in ROLLUP_COLS})
+        out.insert(0, "MONTH", pd.to_datetime(pd.DataFrame({"year": months // 12, "month": months % 12 + 1, "day": 1})))
+        return out
+
+    def zips(self) -> list:
+        return sorted({z for z, t in self._series if t == ALL_TYPES})
@@ -0,0 +1,91 @@
+# src/search.py
+import os, time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, check_cv
+
+
+FACTOR = 3          # en cada ronda sigue 1/FACTOR de los candidatos con FACTOR veces más recursos
+MIN_ROWS = 2_000    # filas mínimas por ronda
+MIN_TREES = 20      # árboles mínimos por candidato en las rondas baratas
+
+
+def _workers(n_jobs: int | None) -> int:
+    n = os.cpu_count() or 1
+    return n if not n_jobs or n_jobs < 0 else min(n_jobs, n)
+
+
+def _fit_score(estimator, params: dict, X, y, train, test, scorer) -> tuple[float, float]:
+    t = time.perf_counter()
+    est = clone(estimator).set_params(**params).fit(X[train], y[train])
+    return float(scorer(est, X[test], y[test])), time.perf_counter() - t
+
+
+def halving_search(estimator, param_grid: dict, X, y, scoring: str, cv: int = 3,
+                   resource_param: str | None = None, budget: float | None = None,
+                   n_jobs: int | None = None, random_state: int = 0) -> dict:
+    """
+    Successive halving sobre tamaño de muestra y (si resource_param, p.ej. "n_estimators")
+    sobre el nº de árboles de cada candidato: la ronda i usa la fracción FACTOR**(i - última)
+    de las filas y de los árboles, y pasa a la siguiente el mejor 1/FACTOR de los candidatos.
+    Todas las combinaciones candidato x fold de una ronda van a un pool de procesos de n_jobs
+    workers (por defecto uno por CPU) con el estimador a n_jobs=1: sin sobresuscribir núcleos.
+    budget: segundos. Antes de cada ronda se estima su coste con el de la anterior; si no cabe,
+    se para y gana el mejor de la última ronda completada (truncated=True).
+    Devuelve params del ganador, sus scores por fold (para no repetir la validación cruzada),
+    la fracción con la que se midieron y el detalle de cada ronda.
+    """
+    t0 = time.perf_counter()
+    X, y = np.asarray(X, dtype=float), np.asarray(y)
+    scorer = get_scorer(scoring)
+    if "n_jobs" in estimator.get_params():
+        estimator = clone(estimator).set_params(n_jobs=1)
+    cands = list(ParameterGrid(param_grid))
+    rounds = int(np.ceil(np.log(len(cands)) / np.log(FACTOR))) + 1 if len(cands) > 1 else 1
+    # subconjuntos anidados: cada ronda toma las primeras filas de la misma permutación
+    order = np.random.default_rng(random_state).permutation(len(X))
+    folds = check_cv(cv, y, classifier=is_classifier(estimator))
+    workers = _workers(n_jobs)
+
+    history, scores, truncated, prev = [], None, False, None
+    with Parallel(n_jobs=workers) as parallel:
+        for r in range(rounds):
+            frac = float(FACTOR) ** (r - rounds + 1)
+            rows = order[:min(len(X), max(MIN_ROWS, int(np.ceil(frac * len(X)))))]
+            params = [dict(p) for p in cands]
+            if resource_param is not None:
+                for p in params:
+                    p[resource_param] = max(MIN_TREES, int(round(p[resource_param] * frac)))
+            # trabajo ~ filas x árboles: con la ronda anterior se estima lo que tardará esta
+            work = len(rows) * sum(p.get(resource_param, 1) for p in params)
+            if budget is not None and prev is not None:
+                est = prev[1] * work / prev[0]
+                if time.perf_counter() - t0 + est > budget:
+                    truncated = True
+                    break
+            t = time.perf_counter()
+            splits = [(rows[tr], rows[te]) for tr, te in folds.split(X[rows], y[rows])]
+            out = parallel(delayed(_fit_score)(estimator, p, X, y, tr, te, scorer)
+                           for p in params for tr, te in splits)
+            scores = np.array([s for s, _ in out]).reshape(len(params), len(splits))
+            secs = time.perf_counter() - t
+            history.append({"fraction": frac, "rows": int(len(rows)), "candidates": len(params),
+                            "seconds": round(secs, 2), "best_score": float(scores.mean(axis=1).max())})
+            prev = (work, secs)
+            # orden estable: a igual score gana el primero de la rejilla
+            rank = np.argsort(-scores.mean(axis=1), kind="stable")
+            cands, scores, best = [cands[i] for i in rank], scores[rank], params[rank[0]]
+            cands = cands[:max(1, int(np.ceil(len(cands) / FACTOR)))] if r < rounds - 1 else cands
+
+    return {
+        "params": dict(cands[0]),          # con sus recursos completos (para el ajuste final)
+        "measured_params": best,           # los de la ronda en que se midió split_scores
+        "split_scores": scores[0].tolist(),
+        "fraction": history[-1]["fraction"],
+        "truncated": truncated,
+        "rounds": history,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
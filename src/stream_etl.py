@@ -0,0 +1,296 @@
+# src/stream_etl.py
+import os, shutil
+import numpy as np
+import pandas as pd
+
+from src.etl import CACHE_DIR, CACHE_VERSION, _cache_path, _fingerprint, _dump_meta, _read_cache
+
+
+# la salida usa el formato de caché de load_data pero con los tipos de STREAM_SCHEMA (float64 donde
+# load_data infiere int64, object, datetime64[ns]...): va en su propio directorio y con su propia
+# versión para que load_data no la tome nunca por la suya
+STREAM_VERSION = f"stream-{CACHE_VERSION}"
+
+
+# esquema explícito de salida: con chunks no se puede dejar que pandas infiera
+# (un chunk saldría int64 y el siguiente float64)
+STREAM_SCHEMA = {
+    "SOLD DATE": "datetime64[ns]",
+    "PROPERTY TYPE": "category",
+    "ADDRESS": "text",
+    "CITY": "category",
+    "STATE OR PROVINCE": "category",
+    "ZIP OR POSTAL CODE": "int64",
+    "PRICE": "float64",
+    "BEDS": "float64",
+    "BATHS": "float64",
+    "LOCATION": "category",
+    "SQUARE FEET": "float64",
+    "LOT SIZE": "float64",
+    "YEAR BUILT": "float64",
+    "$/SQUARE FOOT": "float64",
+    "HOA/MONTH": "float64",
+    "STATUS": "category",
+    "LATITUDE": "float64",
+    "LONGITUDE": "float64",
+    "LISTING DATE": "datetime64[ns]",
+    "ORIGINAL LISTING PRICE": "float64",
+    "DAYS ON MARKET": "float64",
+    "SOLD MONTH": "float64",
+    "BED BATH RATIO": "float64",
+}
+
+
+def clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Misma limpieza que etl.clean_frame pero forzando los tipos de STREAM_SCHEMA."""
+    out = {}
+    for c in chunk.columns:
+        kind = STREAM_SCHEMA.get(c, "text")
+        s = chunk[c]
+        if kind.startswith("datetime"):
+            out[c] = pd.to_datetime(s, errors="coerce").astype(kind)
+        elif kind in ("float64", "int64"):
+            out[c] = pd.to_numeric(s, errors="coerce").astype("float64")
+        else:
+            out[c] = s.astype(object)
+    df = pd.DataFrame(out, index=chunk.index)
+
+    if "PROPERTY TYPE" in df:
+        df["PROPERTY TYPE"] = df["PROPERTY TYPE"].fillna("Unknown")
+    if "ZIP OR POSTAL CODE" in df:
+        df["ZIP OR POSTAL CODE"] = df["ZIP OR POSTAL CODE"].fillna(0).astype("int64")
+    if "BEDS" in df and "BATHS" in df:
+        df["BATHS"] = df["BATHS"].fillna(0)
+        df["BEDS"] = df["BEDS"].fillna(0)
+        df["BED BATH RATIO"] = df["BEDS"] / df["BATHS"].replace(0, 1)
+    return df
+
+
+class _Sketch:
+    """
+    Histograma disperso por ZIP para medianas aproximadas en una sola pasada.
+    log=True: buckets geométricos (error relativo <= rel_error; con precios, sqft o DOM salen unos
+    cientos de buckets por ZIP como mucho). log=False: buckets lineales de ancho `step` que se
+    duplica en el ZIP que pase de max_buckets (se juntan los buckets de dos en dos), así que la
+    memoria está acotada por ZIP aunque haya una coordenada distinta por fila.
+    """
+    ZERO = np.iinfo(np.int64).min
+
+    def __init__(self, log: bool = True, rel_error: float = 0.01, step: float = 1e-4, max_buckets: int = 512):
+        self.log = log
+        self.q = np.log((1.0 + rel_error) ** 2)
+        self.step = step
+        self.max_buckets = max_buckets
+        self.counts = {}   # zip -> {bucket: n}
+        self.shift = {}    # zip -> s: en modo lineal el ancho del bucket es step * 2**s
+
+    def add(self, zips: np.ndarray, values: np.ndarray):
+        ok = ~np.isnan(values)
+        zips, values = zips[ok], values[ok]
+        if not len(values):
+            return
+        if self.log:
+            b = np.full(len(values), self.ZERO, dtype=np.int64)
+            pos = values > 0
+            b[pos] = np.floor(np.log(values[pos]) / self.q).astype(np.int64)
+        else:
+            b = np.floor(values / self.step).astype(np.int64)
+        pairs, n = np.unique(np.stack([zips.astype(np.int64), b]), axis=1, return_counts=True)
+        for (z, k), c in zip(pairs.T.tolist(), n.tolist()):
+            d = self.counts.setdefault(z, {})
+            k >>= self.shift.get(z, 0)   # >> redondea hacia abajo también con negativos
+            d[k] = d.get(k, 0) + c
+        if not self.log:
+            for z in set(pairs[0].tolist()):
+                while len(self.counts[z]) > self.max_buckets:
+                    self._coarsen(z)
+
+    def _coarsen(self, z: int):
+        merged = {}
+        for k, c in self.counts[z].items():
+            merged[k >> 1] = merged.get(k >> 1, 0) + c
+        self.counts[z] = merged
+        self.shift[z] = self.shift.get(z, 0) + 1
+
+    def _value(self, z: int, k: int) -> float:
+        if self.log:
+            return 0.0 if k == self.ZERO else float(np.exp((k + 0.5) * self.q))
+        return (k + 0.5) * self.step * 2 ** self.shift.get(z, 0)
+
+    def median(self, zip_code) -> float | None:
+        d = self.counts.get(zip_code)
+        if not d:
+            return None
+        keys = sorted(d)
+        cum = np.cumsum([d[k] for k in keys])
+        n = int(cum[-1])
+        lo = keys[int(np.searchsorted(cum, (n - 1) // 2, "right"))]
+        hi = keys[int(np.searchsorted(cum, n // 2, "right"))]
+        return (self._value(zip_code, lo) + self._value(zip_code, hi)) / 2.0
+
+
+class _ColumnWriter:
+    """Escribe una columna por trozos en un .bin crudo y al final la pasa a .npy (sin cargarla entera)."""
+    def __init__(self, tmp: str, i: int, name: str, kind: str):
+        self.tmp, self.name, self.kind = tmp, name, kind
+        self.file = f"c{i:03d}.npy"
+        self.n = 0
+        self._raw = open(os.path.join(tmp, f"c{i:03d}.bin"), "wb")
+        if kind == "category":
+            self.vocab = {}
+        elif kind == "text":
+            self._offsets = open(os.path.join(tmp, f"c{i:03d}.off.bin"), "wb")
+            self._nulls = open(os.path.join(tmp, f"c{i:03d}.nul.bin"), "wb")
+            self._pos = 0
+            np.array([0], dtype=np.int64).tofile(self._offsets)
+
+    def append(self, s: pd.Series):
+        self.n += len(s)
+        if self.kind == "category":
+            codes = np.full(len(s), -1, dtype=np.int32)
+            for j, v in enumerate(s.tolist()):
+                if isinstance(v, str):
+                    codes[j] = self.vocab.setdefault(v, len(self.vocab))
+            codes.tofile(self._raw)
+        elif self.kind == "text":
+            nulls = s.isna().to_numpy()
+            encoded = [b"" if null else str(v).encode("utf-8") for v, null in zip(s.tolist(), nulls)]
+            self._raw.write(b"".join(encoded))
+            ends = self._pos + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+            if len(ends):
+                self._pos = int(ends[-1])
+            ends.tofile(self._offsets)
+            nulls.tofile(self._nulls)
+        else:
+            s.to_numpy(dtype=self.dtype).tofile(self._raw)
+
+    @property
+    def dtype(self):
+        return np.dtype(self.kind)
+
+    def finish(self) -> dict:
+        self._raw.close()
+        entry = {"name": self.name, "file": self.file}
+        if self.kind == "category":
+            _bin_to_npy(self.tmp, self.file, np.int32, self.n)
+            entry.update(kind="str", dtype="object", categories=list(self.vocab))
+        elif self.kind == "text":
+            self._offsets.close(); self._nulls.close()
+            stem = self.file[:-4]
+            _bin_to_npy(self.tmp, self.file, np.uint8, self._pos)
+            _bin_to_npy(self.tmp, f"{stem}.off.npy", np.int64, self.n + 1)
+            _bin_to_npy(self.tmp, f"{stem}.nul.npy", np.bool_, self.n)
+            entry.update(kind="text", dtype="object", offsets=f"{stem}.off.npy", nulls=f"{stem}.nul.npy")
+        else:
+            _bin_to_npy(self.tmp, self.file, self.dtype, self.n)
+            entry.update(kind="num", dtype=self.kind)
+        return entry
+
+
+def _bin_to_npy(tmp: str, npy_name: str, dtype, n: int, block: int = 1 << 22):
+    raw = os.path.join(tmp, npy_name[:-4] + ".bin")
+    out = np.lib.format.open_memmap(os.path.join(tmp, npy_name), mode="w+", dtype=dtype, shape=(n,))
+    if n:
+        src = np.memmap(raw, dtype=dtype, mode="r", shape=(n,))
+        for a in range(0, n, block):
+            out[a:a + block] = src[a:a + block]
+        del src
+    out.flush()
+    del out
+    os.remove(raw)
+
+
+def _stream_path(path: str, cache_dir: str) -> str:
+    return f"{_cache_path(path, cache_dir)}.stream"
+
+
+def load_stream(path: str = "data/sold_data.csv", cache_dir: str = CACHE_DIR, mmap: bool = True) -> pd.DataFrame | None:
+    """Salida limpia de stream_etl (tipos de STREAM_SCHEMA) si está al día con el CSV; si no, None."""
+    return _read_cache(_stream_path(path, cache_dir), path, mmap=mmap, version=STREAM_VERSION)
+
+
+def stream_etl(path: str = "data/sold_data.csv", cache_dir: str = CACHE_DIR,
+               chunksize: int = 200_000, rel_error: float = 0.01) -> dict:
+    """
+    ETL en streaming para exportaciones grandes: lee el CSV por chunks, escribe la salida
+    limpia (un .npy por columna, se lee con load_stream; load_data no la usa) y calcula en la
+    misma pasada los agregados que necesita la app:
+    - bounds: como dataset_bounds (exacto)
+    - zip_points: como zip_points (COUNT exacto, medianas con error <= rel_error; lat/lon con
+      buckets de 1e-4 grados que se ensanchan si un ZIP pasa de 512)
+    - snapshots: {zip: market_snapshot} (count exacto, medianas aproximadas)
+    La memoria pico depende de chunksize y del nº de ZIPs, no del tamaño del fichero.
+    """
+    cdir = _stream_path(path, cache_dir)
+    tmp = f"{cdir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    fingerprint = _fingerprint(path)
+
+    writers = None
+    rng = {c: [np.inf, -np.inf] for c in ["PRICE", "BEDS", "BATHS", "SQUARE FEET"]}
+    sk = {
+        "pt_price": _Sketch(rel_error=rel_error), "pt_lat": _Sketch(log=False), "pt_lon": _Sketch(log=False),
+        "price": _Sketch(rel_error=rel_error), "sqft": _Sketch(rel_error=rel_error), "dom": _Sketch(rel_error=rel_error),
+    }
+    pt_count, zip_count = {}, {}
+    rows = 0
+
+    for raw in pd.read_csv(path, dtype=str, chunksize=chunksize):
+        chunk = clean_chunk(raw)
+        if writers is None:
+            writers = [_ColumnWriter(tmp, i, c, STREAM_SCHEMA.get(c, "text")) for i, c in enumerate(chunk.columns)]
+        for w in writers:
+            w.append(chunk[w.name])
+        rows += len(chunk)
+
+        for c, (lo, hi) in rng.items():
+            if c in chunk and chunk[c].notna().any():
+                rng[c] = [min(lo, chunk[c].min()), max(hi, chunk[c].max())]
+
+        if "ZIP OR POSTAL CODE" not in chunk:
+            continue
+        z = chunk["ZIP OR POSTAL CODE"].to_numpy()
+        col = lambda c: chunk[c].to_numpy(dtype=float) if c in chunk else np.full(len(chunk), np.nan)
+        for k, v in zip(*np.unique(z, return_counts=True)):
+            zip_count[int(k)] = zip_count.get(int(k), 0) + int(v)
+        sk["price"].add(z, col("PRICE")); sk["sqft"].add(z, col("SQUARE FEET")); sk["dom"].add(z, col("DAYS ON MARKET"))
+
+        lat, lon = col("LATITUDE"), col("LONGITUDE")
+        has = ~np.isnan(lat) & ~np.isnan(lon)
+        for k, v in zip(*np.unique(z[has], return_counts=True)):
+            pt_count[int(k)] = pt_count.get(int(k), 0) + int(v)
+        sk["pt_price"].add(z[has], col("PRICE")[has]); sk["pt_lat"].add(z[has], lat[has]); sk["pt_lon"].add(z[has], lon[has])
+
+    columns = [w.finish() for w in writers or []]
+    meta = {"version": STREAM_VERSION, "source": fingerprint, "rows": rows, "columns": columns}
+    _dump_meta(meta, tmp)
+
+    bounds = {}
+    for key, c in [("price", "PRICE"), ("beds", "BEDS"), ("baths", "BATHS"), ("sqft", "SQUARE FEET")]:
+        lo, hi = rng[c]
+        bounds[f"{key}_min"], bounds[f"{key}_max"] = (float(lo), float(hi)) if lo <= hi else (None, None)
+
+    zp = pd.DataFrame({
+        "ZIP": list(pt_count),
+        "COUNT": list(pt_count.values()),
+        "MEDIAN_PRICE": [sk["pt_price"].median(z) for z in pt_count],
+        "LAT": [sk["pt_lat"].median(z) for z in pt_count],
+        "LON": [sk["pt_lon"].median(z) for z in pt_count],
+    }, columns=["ZIP", "COUNT", "MEDIAN_PRICE", "LAT", "LON"])
+    zp = zp.sort_values(["COUNT", "ZIP"], ascending=[False, True]).reset_index(drop=True)
+
+    snapshots = {
+        z: {"count": n, "med_price": sk["price"].median(z), "med_sqft": sk["sqft"].median(z), "med_dom": sk["dom"].median(z)}
+        for z, n in sorted(zip_count.items())
+    }
+    if os.path.exists(cdir):
+        shutil.rmtree(cdir, ignore_errors=True)
+    os.rename(tmp, cdir)
+    return {"rows": rows, "bounds": bounds, "zip_points": zp, "snapshots": snapshots}
+
+
+if __name__ == "__main__":
+    import sys
+    res = stream_etl(sys.argv[1] if len(sys.argv) > 1 else "data/sold_data.csv")
+    print(f"[stream_etl] {res['rows']} filas, {len(res['zip_points'])} ZIPs")
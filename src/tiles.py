@@ -0,0 +1,243 @@
+# src/tiles.py
+import math, threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+MIN_LEVEL, MAX_LEVEL = 6, 18     # nivel L = rejilla web-mercator de 2^L x 2^L celdas (18 ~ 150 m)
+LISTING_ZOOM = 14                # a partir de este zoom se pueden pintar viviendas sueltas
+POINT_BUDGET = 2000
+MAP_PX = (800, 520)              # tamaño aproximado del mapa para estimar el viewport sin _derived
+PRECOMPUTE_RATIO = 4             # un nivel se precalcula si agrupa de media >= 4 viviendas por celda
+MAX_BANDS = 8                    # bandas de filtros (key) con niveles precalculados a la vez
+
+LISTING_COLS = ["ADDRESS", "PROPERTY TYPE", "BEDS", "BATHS", "SQUARE FEET", "PRICE"]
+
+
+def _mercator_xy(lat: np.ndarray, lon: np.ndarray, level: int):
+    """índices de celda (x, y) de la rejilla web-mercator del nivel dado"""
+    n = 2 ** level
+    r = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * n
+    y = (1.0 - np.log(np.tan(r) + 1.0 / np.cos(r)) / np.pi) / 2.0 * n
+    return np.clip(x, 0, n - 1).astype(np.uint32), np.clip(y, 0, n - 1).astype(np.uint32)
+
+
+def _interleave(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """código Morton (bits de x e y intercalados): las celdas de un nivel más grueso son prefijos"""
+    def spread(v):
+        v = v.astype(np.uint64)
+        out = np.zeros_like(v)
+        for b in range(MAX_LEVEL):
+            out |= ((v >> np.uint64(b)) & np.uint64(1)) << np.uint64(2 * b)
+        return out
+    return (spread(x) << np.uint64(1)) | spread(y)
+
+
+def bbox_from_relayout(relayout: dict | None):
+    """
+    (bbox, zoom) a partir del relayoutData de un scatter_mapbox.
+    bbox = (lat_min, lat_max, lon_min, lon_max); None si no se sabe.
+    """
+    if not relayout:
+        return None, None
+    zoom = relayout.get("mapbox.zoom")
+    corners = (relayout.get("mapbox._derived") or {}).get("coordinates")
+    if corners:
+        lons = [c[0] for c in corners]
+        lats = [c[1] for c in corners]
+        return (min(lats), max(lats), min(lons), max(lons)), zoom
+    center = relayout.get("mapbox.center")
+    if center is None or zoom is None:
+        return None, zoom
+    # sin esquinas: se estima con el tamaño del mapa (256 px por tesela)
+    w = 360.0 / 2 ** zoom * MAP_PX[0] / 256.0
+    h = w * MAP_PX[1] / MAP_PX[0] * math.cos(math.radians(center["lat"]))
+    return (center["lat"] - h / 2, center["lat"] + h / 2, center["lon"] - w / 2, center["lon"] + w / 2), zoom
+
+
+class TilePyramid:
+    """
+    Pirámide de celdas web-mercator sobre LATITUDE/LONGITUDE (niveles MIN_LEVEL..MAX_LEVEL)
+    con nº de ventas, mediana de precio y de $/ft2 y ZIP principal por celda.
+    Los niveles gruesos (los que agrupan al menos PRECOMPUTE_RATIO viviendas por celda) se
+    precalculan para todo el dataset y, la primera vez que se piden, para cada banda de filtros
+    con key (p.ej. dormitorios mínimos con el precio sin tocar; se guardan las MAX_BANDS más
+    recientes). En esos niveles view() solo recorta las celdas del viewport. Los niveles más
+    finos, que apenas agrupan, y los filtros sin key se agregan al vuelo con las viviendas del
+    viewport: están ordenadas por longitud y las del viewport son un tramo (searchsorted).
+    """
+    def __init__(self, df: pd.DataFrame, min_level: int = MIN_LEVEL, max_level: int = MAX_LEVEL):
+        self.df = df
+        self.min_level, self.max_level = min_level, max_level
+        if {"LATITUDE", "LONGITUDE"}.issubset(df.columns):
+            lat = df["LATITUDE"].to_numpy(dtype=float)
+            lon = df["LONGITUDE"].to_numpy(dtype=float)
+            rows = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+            self._rows = rows[np.argsort(lon[rows], kind="stable")]
+        else:
+            lat = lon = np.empty(0)
+            self._rows = np.empty(0, dtype=np.intp)
+        self._lat, self._lon = lat[self._rows], lon[self._rows]
+        price = df["PRICE"].to_numpy(dtype=float)[self._rows] if "PRICE" in df else np.full(len(self._rows), np.nan)
+        sqft = df["SQUARE FEET"].to_numpy(dtype=float)[self._rows] if "SQUARE FEET" in df else np.full(len(self._rows), np.nan)
+        self._price = price
+        self._ppsf = np.where(sqft > 0, price / np.where(sqft > 0, sqft, 1), np.nan)
+        self._zip = df["ZIP OR POSTAL CODE"].to_numpy()[self._rows].astype(int) if "ZIP OR POSTAL CODE" in df else np.zeros(len(self._rows), dtype=int)
+        self._x, self._y = _mercator_xy(self._lat, self._lon, max_level)
+        self._morton = _interleave(self._x, self._y)
+        # posición en df -> índice interno (-1 si no tiene coordenadas)
+        self._inner = np.full(len(df), -1, dtype=np.intp)
+        self._inner[self._rows] = np.arange(len(self._rows))
+        self._bands = OrderedDict()   # key -> {nivel: celdas}; None = sin filtros
+        self._lock = threading.Lock()
+        self._band(None, None)
+
+    def _aggregate(self, sel: np.ndarray, level: int) -> pd.DataFrame:
+        """celdas del nivel con las viviendas sel, ordenadas por (TX, TY)"""
+        s = self.max_level - level
+        tx = (self._x[sel] >> s).astype(np.int64)
+        ty = (self._y[sel] >> s).astype(np.int64)
+        d = pd.DataFrame({
+            "KEY": (tx << 32) | ty,
+            "LAT": self._lat[sel], "LON": self._lon[sel],
+            "PRICE": self._price[sel], "PPSF": self._ppsf[sel], "ZIP": self._zip[sel],
+        })
+        g = d.groupby("KEY", sort=True)
+        # ZIP principal = el más frecuente de la celda (empate -> el menor)
+        zc = d.groupby(["KEY", "ZIP"]).size().reset_index(name="N")
+        top_zip = zc.sort_values(["KEY", "N"], ascending=[True, False], kind="stable").drop_duplicates("KEY").set_index("KEY")["ZIP"]
+        out = pd.DataFrame({
+            "LAT": g["LAT"].mean(),
+            "LON": g["LON"].mean(),
+            "COUNT": g.size(),
+            "MEDIAN_PRICE": g["PRICE"].median(),
+            "MEDIAN_PPSF": g["PPSF"].median(),
+            "ZIP": top_zip,
+        }).reset_index()
+        key = out.pop("KEY").to_numpy()
+        out["TX"] = key >> 32
+        out["TY"] = key & 0xFFFFFFFF
+        return out
+
+    def _select(self, bbox, rows: np.ndarray | None) -> np.ndarray:
+        """índices internos de las viviendas de rows (todas si None) dentro de bbox (todo si None)"""
+        if bbox is None:
+            if rows is None:
+                return np.arange(len(self._rows))
+            sel = self._inner[np.asarray(rows, dtype=np.intp)]
+            return sel[sel >= 0]
+        lat0, lat1, lon0, lon1 = bbox
+        a = int(np.searchsorted(self._lon, lon0, "left"))
+        b = int(np.searchsorted(self._lon, lon1, "right"))
+        if rows is not None and len(rows) < (b - a) * np.log2(max(len(rows), 2)):
+            # pocas filas filtradas frente al tramo: se recorren ellas
+            sel = self._select(None, rows)
+            lat, lon = self._lat[sel], self._lon[sel]
+            return sel[(lat >= lat0) & (lat <= lat1) & (lon >= lon0) & (lon <= lon1)]
+        lat = self._lat[a:b]
+        sel = a + np.flatnonzero((lat >= lat0) & (lat <= lat1))
+        if rows is not None and len(sel):
+            # rows viene ordenado (FilterIndex.select): pertenencia por búsqueda binaria
+            rows = np.asarray(rows, dtype=np.intp)
+            cand = self._rows[sel]
+            pos = np.minimum(np.searchsorted(rows, cand), len(rows) - 1)
+            sel = sel[rows[pos] == cand]
+        return sel
+
+    def _band(self, key, rows: np.ndarray | None) -> dict:
+        """niveles precalculados {nivel: celdas} de la banda key (None = sin filtros)"""
+        with self._lock:
+            levels = self._bands.get(key)
+            if levels is not None:
+                self._bands.move_to_end(key)
+                return levels
+        sel = self._select(None, None if key is None else rows)
+        levels = {}
+        for level in range(self.min_level, self.max_level + 1):
+            cells = self._aggregate(sel, level)
+            if level > self.min_level and len(cells) * PRECOMPUTE_RATIO > len(sel):
+                break
+            levels[level] = cells
+        with self._lock:
+            self._bands[key] = levels
+            while len(self._bands) > MAX_BANDS + 1:   # + la de sin filtros, que no se descarta
+                del self._bands[next(k for k in self._bands if k is not None)]
+        return levels
+
+    def _cells_in_bbox(self, cells: pd.DataFrame, level: int, bbox) -> pd.DataFrame:
+        """celdas que tocan el viewport: tramo de TX (searchsorted) y filtro de TY"""
+        if bbox is None:
+            return cells
+        lat0, lat1, lon0, lon1 = bbox
+        x0, y1 = _mercator_xy(np.array([lat0]), np.array([lon0]), level)
+        x1, y0 = _mercator_xy(np.array([lat1]), np.array([lon1]), level)
+        tx = cells["TX"].to_numpy()
+        part = cells.iloc[int(np.searchsorted(tx, x0[0], "left")):int(np.searchsorted(tx, x1[0], "right"))]
+        ty = part["TY"].to_numpy()
+        return part[(ty >= y0[0]) & (ty <= y1[0])]
+
+    def _level_for(self, sel: np.ndarray, top: int, budget: int, low: int | None = None) -> int | None:
+        """
+        nivel más fino <= top con como mucho budget celdas ocupadas; si ninguno cabe,
+        min_level (sin low) o None (con low: no se baja de low)
+        """
+        # con los códigos Morton ordenados, las celdas de cada nivel son tramos contiguos:
+        # contarlas es ver dónde cambia el prefijo, sin agrupar
+        m = np.sort(self._morton[sel])
+        for level in range(top, self.min_level if low is None else low - 1, -1):
+            k = m >> np.uint64(2 * (self.max_level - level))
+            if 1 + np.count_nonzero(k[1:] != k[:-1]) <= budget:
+                return level
+        return self.min_level if low is None else None
+
+    def listings(self, sel: np.ndarray) -> pd.DataFrame:
+        sel = sel[np.argsort(self._rows[sel], kind="stable")]   # en el orden de df
+        keep = [c for c in LISTING_COLS if c in self.df.columns]
+        out = self.df.iloc[self._rows[sel]][keep].reset_index(drop=True)
+        out.insert(0, "LAT", self._lat[sel])
+        out.insert(1, "LON", self._lon[sel])
+        out["COUNT"] = 1
+        out["MEDIAN_PRICE"] = self._price[sel]
+        out["MEDIAN_PPSF"] = self._ppsf[sel]
+        out["ZIP"] = self._zip[sel]
+        return out
+
+    def view(self, bbox=None, zoom: float | None = None, budget: int = POINT_BUDGET,
+             rows: np.ndarray | None = None, key=None):
+        """
+        Puntos a pintar para el viewport: (DataFrame, nivel); nivel None = viviendas sueltas.
+        bbox = (lat_min, lat_max, lon_min, lon_max) o None para todo el dataset.
+        rows: posiciones ordenadas en self.df que pasan los filtros (FilterIndex.select); None = sin filtros.
+        key: identifica la banda de filtros de rows (hashable) para precalcular sus niveles; sin
+        key, con rows, todo se agrega al vuelo con las viviendas del viewport.
+        En los niveles precalculados una celda cuenta entera si toca el viewport; al vuelo solo
+        cuentan las viviendas que caen dentro.
+        """
+        sel = None
+        if zoom is None or zoom >= LISTING_ZOOM:
+            sel = self._select(bbox, rows)
+            if len(sel) <= budget:
+                return self.listings(sel), None
+
+        # nivel más fino con cabida: unos 5 niveles por encima del zoom (celdas de ~8 px)
+        top = self.max_level if zoom is None else min(self.max_level, max(self.min_level, int(zoom) + 5))
+        if rows is None or key is not None:
+            levels = self._band(None if rows is None else key, rows)
+            fine = min(top, max(levels))
+            for level in range(fine, self.min_level - 1, -1):
+                cells = self._cells_in_bbox(levels[level], level, bbox)
+                if len(cells) <= budget:
+                    break
+            if level == fine and top > fine:
+                # cabe el nivel precalculado más fino: los de encima se agregan al vuelo
+                sel = self._select(bbox, rows) if sel is None else sel
+                finer = self._level_for(sel, top, budget, low=fine + 1)
+                if finer is not None:
+                    return self._aggregate(sel, finer), finer
+            return cells.reset_index(drop=True), level
+
+        sel = self._select(bbox, rows) if sel is None else sel
+        level = self._level_for(sel, top, budget)
+        return self._aggregate(sel, level), level
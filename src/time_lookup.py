@@ -0,0 +1,129 @@
+# src/time_lookup.py
+import os
+import joblib
+import numpy as np
+import pandas as pd
+
+
+RATIOS = np.round(np.arange(0.50, 2.0001, 0.025), 3)   # precio / mediana del ZIP
+MAX_BAND = 5                                          # banda de dormitorios 1..5 (5 = 5 o más)
+ALL = "*"                                             # celda de todo el ZIP (cualquier tipo y banda)
+CHUNK = 100_000
+
+
+def bed_band(beds) -> np.ndarray:
+    b = np.nan_to_num(np.asarray(beds, dtype=float), nan=0.0)
+    return np.clip(np.floor(b), 1, MAX_BAND).astype(int)
+
+
+class TimeLookup:
+    """
+    Categoría de tiempo de venta precalculada por ZIP x tipo x banda de dormitorios.
+    Para cada celda se evalúa el modelo de tiempo sobre una vivienda representativa (medianas
+    de la celda, sin parcela ni HOA, como el panel de oferta) a precio = ratio * mediana del
+    ZIP para cada ratio de la rejilla, y se guardan solo los puntos donde cambia la categoría.
+    categories() es una búsqueda binaria sobre esos precios: en los puntos de la rejilla da
+    exactamente lo mismo que el modelo; entre dos puntos, la categoría del punto inferior.
+    """
+    def __init__(self, ratios, zip_median: dict, cells: dict, starts, edges, cats):
+        self.ratios = np.asarray(ratios, dtype=float)
+        self.zip_median = zip_median    # ZIP -> mediana de precio usada al construir
+        self.cells = cells              # (zip, tipo, banda) o (zip, ALL, ALL) -> nº de celda
+        self.starts = np.asarray(starts)  # celda i: edges/cats[starts[i]:starts[i+1]]
+        self.edges = np.asarray(edges)    # ratio donde empieza cada tramo (el primero -inf)
+        self.cats = np.asarray(cats)
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, ms, bundle=None, ratios=RATIOS) -> "TimeLookup":
+        """
+        ms: ModelService (para build_features_batch); bundle: modelos a evaluar (por defecto
+        los activos de ms). Los ZIPs sin mediana de precio se quedan sin celda.
+        """
+        b = bundle if bundle is not None else ms.bundle
+        if not b.has_time:
+            raise ValueError("sin modelo de tiempo")
+        d = pd.DataFrame({
+            "ZIP": df["ZIP OR POSTAL CODE"].to_numpy().astype(np.int64),
+            "TYPE": df["PROPERTY TYPE"].astype(object).fillna(ms.default_ptype).to_numpy() if "PROPERTY TYPE" in df else ms.default_ptype,
+            "BAND": bed_band(df["BEDS"]),
+            **{c: df[c].to_numpy(dtype=float) for c in ("BEDS", "BATHS", "SQUARE FEET", "YEAR BUILT", "PRICE")},
+        })
+        zip_median = d.groupby("ZIP")["PRICE"].median().dropna()
+        zip_median = zip_median[zip_median > 0]
+        d = d[d["ZIP"].isin(zip_median.index)]
+        feat_cols = ["BEDS", "BATHS", "SQUARE FEET", "YEAR BUILT"]
+        exact = d.groupby(["ZIP", "TYPE", "BAND"], sort=True)[feat_cols].median().reset_index()
+        whole = d.groupby("ZIP", sort=True)[feat_cols].median().reset_index()
+        whole["TYPE"] = d.groupby("ZIP", sort=True)["TYPE"].agg(lambda s: s.mode().iloc[0]).to_numpy()
+        reps = pd.concat([exact, whole.assign(BAND=0)], ignore_index=True).fillna(0.0)
+        keys = [(int(z), t, int(bd)) for z, t, bd in zip(exact["ZIP"], exact["TYPE"], exact["BAND"])]
+        keys += [(int(z), ALL, ALL) for z in whole["ZIP"]]
+
+        # una fila por celda y ratio; los precios se calculan igual que en categories()
+        g = len(ratios)
+        med = zip_median.reindex(reps["ZIP"]).to_numpy()
+        prices = (np.asarray(ratios, dtype=float)[None, :] * med[:, None]).ravel()
+        rep = {c: np.repeat(reps[c].to_numpy(), g) for c in ["ZIP", "TYPE", *feat_cols]}
+        cats = np.empty(len(prices), dtype=np.int8)
+        cols = b.time_aligner.cols
+        for i in range(0, len(prices), CHUNK):
+            s = slice(i, i + CHUNK)
+            feats = ms.build_features_batch(rep["ZIP"][s], rep["BEDS"][s], rep["BATHS"][s], rep["SQUARE FEET"][s],
+                                            0, rep["YEAR BUILT"][s], 0, rep["TYPE"][s], prices[s])
+            X = b.time_aligner.transform(feats)
+            if "PRICE" in cols:
+                X[:, cols.index("PRICE")] = prices[s]
+            cats[s] = b.predict_time(X)[0]
+
+        # por celda solo los puntos donde cambia la categoría
+        grid = cats.reshape(len(reps), g)
+        change = np.ones_like(grid, dtype=bool)
+        change[:, 1:] = grid[:, 1:] != grid[:, :-1]
+        counts = change.sum(axis=1)
+        edges = np.broadcast_to(np.asarray(ratios, dtype=float), grid.shape)[change]
+        first = np.r_[0, np.cumsum(counts)[:-1]]
+        edges[first] = -np.inf
+        return cls(
+            ratios, {int(z): float(m) for z, m in zip_median.items()},
+            {k: i for i, k in enumerate(keys)},
+            np.r_[0, np.cumsum(counts)].astype(np.int64), edges, grid[change].astype(np.int8),
+        )
+
+    def cell(self, zip_code, property_type, beds) -> int | None:
+        z = int(zip_code or 0)
+        i = self.cells.get((z, property_type, int(bed_band([beds])[0])))
+        return i if i is not None else self.cells.get((z, ALL, ALL))
+
+    def categories(self, zip_code, property_type, beds, prices) -> np.ndarray | None:
+        """Categoría (0/1/2) a cada precio; None si el ZIP no está en la tabla."""
+        i = self.cell(zip_code, property_type, beds)
+        if i is None:
+            return None
+        s, e = int(self.starts[i]), int(self.starts[i + 1])
+        # mismos productos ratio * mediana que al construir: en la rejilla el resultado es exacto
+        bounds = self.edges[s:e] * self.zip_median[int(zip_code)]
+        pos = np.searchsorted(bounds, np.asarray(prices, dtype=float).reshape(-1), "right") - 1
+        return self.cats[s:e][np.maximum(pos, 0)].astype(int)
+
+    def save(self, path: str):
+        from src.model import _atomic_dump   # src.model importa este módulo
+        _atomic_dump(self, path)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> "TimeLookup":
+        return joblib.load(path, mmap_mode="r" if mmap else None)
+
+
+if __name__ == "__main__":
+    # python -m src.time_lookup [models_dir] [csv] -> genera time_lookup.joblib para los modelos activos
+    # (para modelos entrenados antes de que train_models la generase)
+    import sys
+    from src.etl import load_data
+    from src.model import TIME_LOOKUP, ModelBundle, ModelService
+    from src.time_lookup import TimeLookup   # la clase del módulo, no la de __main__: se carga con pickle
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else "models"
+    df = load_data(sys.argv[2] if len(sys.argv) > 2 else "data/sold_data.csv")
+    bundle = ModelBundle.load(models_dir, mmap=False)
+    path = os.path.join(os.path.dirname(bundle.signature[1][0]), os.path.basename(TIME_LOOKUP))
+    TimeLookup.build(df, ModelService(df, models_dir, background=True), bundle).save(path)
+    print(f"[time_lookup] {path}")
@@ -4,14 +4,22 @@ import pickle
 import numpy as np
 import pandas as pd
 
-from sklearn.model_selection import train_test_split, GridSearchCV, cross_val_score
+from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.metrics import mean_absolute_error, accuracy_score
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.ensemble import RandomForestRegressor
 
+from src.knn_index import KnnTimeIndex
+from src.etl import load_data
+from src.model import TIME_LOOKUP, FlatForest, ModelBundle, ModelService, write_mmap_copies
+from src.registry import new_version, write_manifest, publish as registry_publish
+from src.search import halving_search
+from src.time_lookup import TimeLookup
+
 DATA_PATH = "data/sold_data.csv"
 OUT_DIR = "models"
+SEARCH = "grid"      # "grid": rejilla completa; "halving": successive halving (src/search.py)
 
 DROP_MODEL1 = [
     "ADDRESS", "PRICE", "ORIGINAL LISTING PRICE", "$/SQUARE FOOT",
@@ -67,7 +75,28 @@ def build_features(df: pd.DataFrame) -> pd.DataFrame:
     return df_ohe
 
 
-def train_price_model(df_features: pd.DataFrame):
+def _search(estimator, param_grid, X, y, scoring, search, budget, n_jobs, resource_param=None):
+    """
+    Búsqueda de hiperparámetros. Las combinaciones candidato x fold van en paralelo (n_jobs
+    procesos) con el estimador a n_jobs=1. Devuelve (params, scores por fold del ganador, info):
+    esos scores son la validación cruzada del informe, sin volver a ajustar.
+    """
+    if search == "halving":
+        res = halving_search(estimator, param_grid, X, y, scoring, cv=3, resource_param=resource_param,
+                             budget=budget, n_jobs=n_jobs)
+        info = {k: res[k] for k in ("fraction", "truncated", "rounds", "workers", "seconds")}
+        return res["params"], np.asarray(res["split_scores"]), info
+    if "n_jobs" in estimator.get_params():
+        estimator = estimator.set_params(n_jobs=1)
+    gs = GridSearchCV(estimator, param_grid, cv=3, scoring=scoring, n_jobs=n_jobs or -1, refit=False)
+    gs.fit(X, y)
+    i = gs.best_index_
+    splits = np.array([gs.cv_results_[f"split{k}_test_score"][i] for k in range(gs.n_splits_)])
+    return gs.best_params_, splits, {}
+
+
+def train_price_model(df_features: pd.DataFrame, search: str = SEARCH, budget: float | None = None,
+                      n_jobs: int | None = None):
     y = df_features["PRICE"].astype(float)
     X = safe_drop(df_features, DROP_MODEL1)
     X = X.select_dtypes(include=["number"]).copy()
@@ -87,26 +116,27 @@ def train_price_model(df_features: pd.DataFrame):
         "min_samples_split": [2, 5],
     }
 
-    gs = GridSearchCV(
-        RandomForestRegressor(random_state=0, n_jobs=-1),
-        param_grid,
-        cv=3,
-        scoring="neg_mean_absolute_error",
+    params, splits, search_info = _search(
+        RandomForestRegressor(random_state=0), param_grid, X_train.to_numpy(dtype=float), y_train.to_numpy(),
+        "neg_mean_absolute_error", search, budget, n_jobs, resource_param="n_estimators",
     )
-    gs.fit(X_train, y_train)
-    model = gs.best_estimator_
+    # un único ajuste final con todos los datos de train y todos los núcleos
+    model = RandomForestRegressor(random_state=0, n_jobs=-1, **params).fit(X_train, y_train)
 
     preds = model.predict(X_test)
     mae = mean_absolute_error(y_test, preds)
-    cv_scores = -cross_val_score(model, X_train, y_train, cv=5, scoring="neg_mean_absolute_error")
-    print("[train_models] PRICE model - best params:", gs.best_params_)
+    cv_scores = -splits
+    print("[train_models] PRICE model - best params:", params)
     print(f"   MAE test: {mae:,.0f}")
     print(f"   CV MAE (min): {cv_scores.min():,.0f}")
 
-    return model, feature_cols
+    info = {"params": params, "mae_test": float(mae), "cv_mae_min": float(cv_scores.min()),
+            "search": {"mode": search, **search_info}}
+    return model, feature_cols, info
 
 
-def train_time_model(df_features: pd.DataFrame):
+def train_time_model(df_features: pd.DataFrame, search: str = SEARCH, budget: float | None = None,
+                     n_jobs: int | None = None):
     dom = pd.to_numeric(df_features["DAYS ON MARKET"], errors="coerce")
     fallback = dom.median() if not dom.dropna().empty else 45
     TIME_CAT = pd.cut(
@@ -133,45 +163,86 @@ def train_time_model(df_features: pd.DataFrame):
     Xt_test_s = scaler.transform(Xt_test)
 
     param_knn = {"n_neighbors": [5, 7, 9], "weights": ["uniform", "distance"]}
-    gs_knn = GridSearchCV(KNeighborsClassifier(), param_knn, cv=3, scoring="accuracy")
-    gs_knn.fit(Xt_train_s, yt_train)
-    model = gs_knn.best_estimator_
+    params, splits, search_info = _search(
+        KNeighborsClassifier(), param_knn, Xt_train_s, yt_train.to_numpy(), "accuracy", search, budget, n_jobs,
+    )
+    model = KNeighborsClassifier(**params).fit(Xt_train_s, yt_train)
+    # índice de consulta con la matriz de entrenamiento (la del KNN no es pública)
+    index = KnnTimeIndex.from_training(Xt_train_s, yt_train.to_numpy(), model, scaler)
 
     preds = model.predict(Xt_test_s)
     acc = accuracy_score(yt_test, preds)
-    print("[train_models] TIME model - best params:", gs_knn.best_params_)
+    print("[train_models] TIME model - best params:", params)
     print(f"   ACC test: {acc:.3f}")
+    print(f"   CV ACC (mean): {splits.mean():.3f}")
 
-    return scaler, model, Xt.columns.tolist()
+    info = {"params": params, "acc_test": float(acc), "cv_acc_mean": float(splits.mean()),
+            "search": {"mode": search, **search_info}}
+    return scaler, model, index, Xt.columns.tolist(), info
 
 
-def main():
+def main(publish: bool = True, search: str = SEARCH, budget: float | None = None, n_jobs: int | None = None):
+    """
+    Cada entrenamiento va a su propia versión (models/versions/<id>/ con manifest.json);
+    al terminar se publica moviendo CURRENT, y los workers la cargan solos sin reiniciar.
+    budget: segundos para la búsqueda con search="halving", repartidos entre precio (3/4) y tiempo.
+    """
     print(f"[train_models] Loading {DATA_PATH} ...")
     df = pd.read_csv(DATA_PATH)
     df_features = build_features(df)
 
-    price_model, feature_cols_model1 = train_price_model(df_features)
-    scaler_time, time_model, feature_cols_model2 = train_time_model(df_features)
+    price_model, feature_cols_model1, price_info = train_price_model(
+        df_features, search, budget * 0.75 if budget else None, n_jobs)
+    scaler_time, time_model, time_index, feature_cols_model2, time_info = train_time_model(
+        df_features, search, budget * 0.25 if budget else None, n_jobs)
 
     os.makedirs(OUT_DIR, exist_ok=True)
+    version, out = new_version(OUT_DIR)
 
-    with open(os.path.join(OUT_DIR, "price_xgb.pkl"), "wb") as f:
+    with open(os.path.join(out, "price_xgb.pkl"), "wb") as f:
         pickle.dump(price_model, f)
 
-    with open(os.path.join(OUT_DIR, "time_knn.pkl"), "wb") as f:
+    # bosque aplanado en arrays de nodos: lo que evalúa ModelService, sin joblib por petición
+    FlatForest.from_sklearn(price_model).save(os.path.join(out, "price_forest.joblib"))
+
+    with open(os.path.join(out, "time_knn.pkl"), "wb") as f:
         pickle.dump(time_model, f)
 
-    with open(os.path.join(OUT_DIR, "scaler_time.pkl"), "wb") as f:
+    with open(os.path.join(out, "scaler_time.pkl"), "wb") as f:
         pickle.dump(scaler_time, f)
 
-    with open(os.path.join(OUT_DIR, "feature_cols_model1.json"), "w") as f:
+    # matriz de entrenamiento en un KDTree + escalador fundido (lo que consulta ModelService)
+    time_index.save(os.path.join(out, "time_index.joblib"))
+
+    with open(os.path.join(out, "feature_cols_model1.json"), "w") as f:
         json.dump(feature_cols_model1, f)
 
-    with open(os.path.join(OUT_DIR, "feature_cols_model2.json"), "w") as f:
+    with open(os.path.join(out, "feature_cols_model2.json"), "w") as f:
         json.dump(feature_cols_model2, f)
 
-    print(f"[train_models] saved to {OUT_DIR}")
+    # tabla precio -> tiempo por ZIP/tipo/dormitorios con los modelos recién guardados
+    # (ModelService sin cargar modelos: solo aporta build_features_batch)
+    clean = load_data(DATA_PATH)
+    lookup = TimeLookup.build(clean, ModelService(clean, out, background=True), ModelBundle.load(out, mmap=False))
+    lookup.save(os.path.join(out, os.path.basename(TIME_LOOKUP)))
+
+    # copias .joblib de los pickles con arrays grandes (se abren con mmap); van en el manifest
+    write_mmap_copies(out)
+
+    write_manifest(out, version, data=DATA_PATH, rows=int(len(df)),
+                   metrics={"price": price_info, "time": time_info})
+    print(f"[train_models] saved to {out}")
+    if publish:
+        registry_publish(OUT_DIR, version)
+        print(f"[train_models] CURRENT -> {version}")
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser(description="Entrena y publica una versión de los modelos")
+    ap.add_argument("--no-publish", action="store_true", help="deja la versión sin mover CURRENT")
+    ap.add_argument("--search", choices=["grid", "halving"], default=SEARCH)
+    ap.add_argument("--budget", type=float, default=None, help="segundos de búsqueda (solo halving)")
+    ap.add_argument("--jobs", type=int, default=None, help="procesos de la búsqueda (por defecto, uno por CPU)")
+    a = ap.parse_args()
+    main(publish=not a.no_publish, search=a.search, budget=a.budget, n_jobs=a.jobs)
@@ -0,0 +1,50 @@
+# src/valuations.py
+import numpy as np
+import pandas as pd
+
+
+VALUATION_COLS = ["MODEL PRICE", "OFFER MIN", "MODEL TIME", "MODEL DISCOUNT"]
+OFFER_FACTOR = 0.97                          # oferta mínima = precio del modelo * 0.97 (panel de oferta)
+DEFAULT_PTYPE = "Single Family Residential"
+CHUNK = 50_000
+
+
+def _num(df: pd.DataFrame, col: str, rows: np.ndarray) -> np.ndarray:
+    # como float(row.get(col) or 0) en el panel: nulos -> 0; solo se convierten las filas pedidas
+    if col not in df:
+        return np.zeros(len(rows))
+    return np.nan_to_num(df[col].iloc[rows].to_numpy(dtype=float), nan=0.0)
+
+
+def valuate(df: pd.DataFrame, ms, rows: np.ndarray | None = None) -> pd.DataFrame:
+    """
+    Valoración de cada vivienda con los mismos datos que usa el panel de oferta (sin parcela
+    ni HOA), por lotes de CHUNK filas:
+    - MODEL PRICE: precio del modelo (o de las medianas si no hay modelo)
+    - OFFER MIN: MODEL PRICE * OFFER_FACTOR
+    - MODEL TIME: categoría de tiempo (0/1/2) a su PRICE
+    - MODEL DISCOUNT: 1 - PRICE / MODEL PRICE (> 0: se vendió por debajo del modelo)
+    rows: posiciones de df a valorar (None = todas); son el índice del resultado.
+    """
+    rows = np.arange(len(df)) if rows is None else np.asarray(rows, dtype=np.intp)
+    ptypes = df["PROPERTY TYPE"].astype(object).to_numpy() if "PROPERTY TYPE" in df else np.full(len(df), None)
+    zips = df["ZIP OR POSTAL CODE"].to_numpy()
+    # columnas numéricas convertidas una vez por llamada; los lotes toman rebanadas
+    num = {c: _num(df, c, rows) for c in ("PRICE", "BEDS", "BATHS", "SQUARE FEET", "YEAR BUILT")}
+    out = {c: np.full(len(rows), np.nan) for c in VALUATION_COLS}
+    for i in range(0, len(rows), CHUNK):
+        r = rows[i:i + CHUNK]
+        s = slice(i, i + len(r))
+        price = num["PRICE"][s]
+        pt = np.array([p if isinstance(p, str) and p else DEFAULT_PTYPE for p in ptypes[r]], dtype=object)
+        feats = ms.build_features_batch(
+            zips[r].astype(np.int64), num["BEDS"][s], num["BATHS"][s], num["SQUARE FEET"][s],
+            0, num["YEAR BUILT"][s], 0, pt, price,
+        )
+        base = ms.predict_price_batch(feats)
+        out["MODEL PRICE"][s] = base
+        out["OFFER MIN"][s] = base * OFFER_FACTOR
+        out["MODEL TIME"][s] = ms.predict_time_batch(feats, price)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["MODEL DISCOUNT"][s] = np.where(base > 0, 1.0 - price / np.where(base > 0, base, 1.0), np.nan)
+    return pd.DataFrame(out, index=rows)